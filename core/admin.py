@@ -1,20 +1,95 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils import timezone
 from .models import AttendanceSummary 
 from .models import (
     Student, Teacher, SchoolClass, Attendance, Fee,
-    Timetable, Result, Quiz, Course, ClassProceeding
+    Timetable, Result, Quiz, Course, ClassProceeding, ImportBatch, Job,
+    FeePayment, StudentBalance, ClassBalance,
 )
+from .jobs import enqueue
 
 
 admin.site.register(Student)
 admin.site.register(Teacher)
 admin.site.register(SchoolClass)
 admin.site.register(Attendance)
-admin.site.register(Fee)
 admin.site.register(Timetable)
 admin.site.register(Result)
 admin.site.register(Quiz)
 admin.site.register(Course)
 admin.site.register(ClassProceeding)
-admin.site.register(AttendanceSummary) 
+admin.site.register(AttendanceSummary)
 
+
+@admin.register(ImportBatch)
+class ImportBatchAdmin(admin.ModelAdmin):
+    """Upload a CSV/JSONL file, then run it with the action below (core/imports.py)."""
+    list_display = ('id', 'kind', 'source', 'status', 'rows_done', 'imported', 'rejected', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('status', 'rows_done', 'imported', 'rejected', 'rejects', 'error', 'created_at', 'finished_at')
+    actions = ['run_imports']
+
+    @admin.action(description='Run (or resume) selected imports in the background')
+    def run_imports(self, request, queryset):
+        batches = list(queryset.exclude(status__in=['running', 'done']))
+        for batch in batches:
+            enqueue('run_import_batch', {'batch_id': batch.pk})
+        skipped = queryset.count() - len(batches)
+        self.message_user(request, f'{len(batches)} import(s) queued.', messages.SUCCESS)
+        if skipped:
+            self.message_user(request, f'{skipped} running or finished import(s) skipped.', messages.WARNING)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Runs of the jobs in core/tasks.py, as claimed by the run_worker pool."""
+    list_display = ('id', 'name', 'status', 'run_at', 'attempts', 'worker', 'started_at', 'finished_at', 'parent')
+    list_filter = ('status', 'name')
+    readonly_fields = (
+        'name', 'args', 'run_at', 'dedupe_key', 'parent', 'attempts', 'worker', 'lease_expires_at',
+        'result', 'error', 'created_at', 'started_at', 'finished_at',
+    )
+    actions = ['requeue']
+
+    @admin.action(description='Run selected failed jobs again')
+    def requeue(self, request, queryset):
+        requeued = queryset.filter(status='failed').update(
+            status='queued', run_at=timezone.now(), attempts=0, worker='', error='', finished_at=None,
+        )
+        self.message_user(request, f'{requeued} job(s) queued again.', messages.SUCCESS)
+
+
+@admin.register(Fee)
+class FeeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'student', 'term', 'amount', 'amount_paid', 'paid', 'updated_at')
+    list_filter = ('paid', 'term')
+    readonly_fields = ('amount_paid', 'paid')
+    raw_id_fields = ('student',)
+
+
+@admin.register(FeePayment)
+class FeePaymentAdmin(admin.ModelAdmin):
+    """Payments change the ledger balances through the signals in core/signals.py."""
+    list_display = ('id', 'fee', 'student', 'amount', 'method', 'reference', 'paid_at')
+    list_filter = ('method',)
+    readonly_fields = ('student',)
+    raw_id_fields = ('fee',)
+
+
+@admin.register(StudentBalance)
+class StudentBalanceAdmin(admin.ModelAdmin):
+    """Maintained by core/ledger.py; read-only here."""
+    list_display = ('student', 'school_class', 'charged', 'paid', 'outstanding', 'updated_at')
+    ordering = ('-outstanding', 'student')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ClassBalance)
+class ClassBalanceAdmin(StudentBalanceAdmin):
+    list_display = ('school_class', 'charged', 'paid', 'outstanding', 'updated_at')
+    ordering = ('-outstanding', 'school_class')
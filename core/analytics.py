@@ -0,0 +1,281 @@
+"""
+Gradebook analytics over Result and Quiz scores.
+
+Scores are fetched with one values_list query per grouping and turned into
+NumPy columns. Grouping is a lexsort plus group boundaries, and every
+statistic (mean, median, percentiles, standard deviation, ranks, trend
+slopes) is computed over whole arrays at once, never per row in Python.
+Computed payloads are cached under the current Result/Quiz/Student version
+stamps (core/versions.py), so any write makes the next request recompute.
+"""
+import hashlib
+
+import numpy as np
+from django.core.cache import cache
+
+from .models import Quiz, Result, SchoolClass
+from .versions import CATALOG, GLOBAL, current_stamps
+
+SOURCES = {'results': Result, 'quizzes': Quiz}
+PERCENTILES = (25, 75, 90)
+
+# Rankings and class groupings follow Student.school_class; names come from SchoolClass.
+ANALYTICS_DEPENDENCIES = (('result', 'all'), ('quiz', 'all'), ('student', 'all'), CATALOG)
+
+# Entries are superseded by new stamps, so the timeout only bounds memory use.
+ANALYTICS_CACHE_TIMEOUT = 60 * 60
+
+
+# --- Columns and grouping --------------------------------------------------
+
+def score_columns(model, school_class_id=None):
+    """
+    One query for `model`'s scores of students in a class, as a dict of
+    arrays: school_class, subject (codes into 'subjects'), student, score,
+    and for quizzes day (days since the epoch).
+    """
+    queryset = model.objects.filter(student__school_class__isnull=False)
+    if school_class_id is not None:
+        queryset = queryset.filter(student__school_class_id=school_class_id)
+    fields = ['student__school_class_id', 'subject', 'student_id', 'score']
+    if model is Quiz:
+        fields.append('date')
+    rows = list(queryset.order_by().values_list(*fields))
+
+    columns = list(zip(*rows)) or [()] * len(fields)
+    subjects, subject_codes = encode_labels(columns[1])
+    data = {
+        'subjects': subjects,
+        'school_class': np.array(columns[0], dtype=np.int64),
+        'subject': subject_codes,
+        'student': np.array(columns[2], dtype=np.int64),
+        'score': np.array(columns[3], dtype=np.float64),
+    }
+    if model is Quiz:
+        data['day'] = np.array(columns[4], dtype='datetime64[D]').astype(np.int64)
+    return data
+
+
+def encode_labels(labels):
+    """
+    (sorted distinct labels, int64 code of each label). A dict pass is
+    linear, where np.unique would sort the Python strings.
+    """
+    codes = {}
+    raw = np.fromiter((codes.setdefault(label, len(codes)) for label in labels), dtype=np.int64, count=len(labels))
+    names = sorted(codes)
+    remap = np.empty(len(names), dtype=np.int64)
+    remap[[codes[name] for name in names]] = np.arange(len(names))
+    return names, remap[raw]
+
+
+def group_by(keys, values=None):
+    """
+    Sort rows by `keys` (primary first), then by `values` if given, and
+    return (order, starts, counts): the sort permutation and where each
+    group of equal keys begins in it and how long it is.
+
+    Keys are non-negative integer columns (ids, subject codes); they are
+    packed into one int64 code so the sort compares a single column.
+    """
+    code = np.zeros(len(keys[0]), dtype=np.int64)
+    for key in keys:
+        code = code * (int(key.max()) + 1 if len(key) else 1) + key
+    order = np.argsort(code, kind='stable') if values is None else np.lexsort((values, code))
+    if not len(order):
+        return order, order, order
+    sorted_code = code[order]
+    boundary = np.empty(len(order), dtype=bool)
+    boundary[0] = True
+    np.not_equal(sorted_code[1:], sorted_code[:-1], out=boundary[1:])
+    starts = np.flatnonzero(boundary)
+    counts = np.diff(np.append(starts, len(order)))
+    return order, starts, counts
+
+
+def _quantile(sorted_values, starts, counts, q):
+    """Linear-interpolated quantile of every group at once (same as numpy's default method)."""
+    position = starts + q * (counts - 1)
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def describe(sorted_values, starts, counts):
+    """Per-group statistics of values already sorted within each group."""
+    if not len(starts):
+        empty = np.array([], dtype=np.float64)
+        return dict.fromkeys(['count', 'mean', 'median', 'std', 'min', 'max', *(f'p{p}' for p in PERCENTILES)], empty)
+    sums = np.add.reduceat(sorted_values, starts)
+    squares = np.add.reduceat(sorted_values ** 2, starts)
+    mean = sums / counts
+    stats = {
+        'count': counts,
+        'mean': mean,
+        'median': _quantile(sorted_values, starts, counts, 0.5),
+        'std': np.sqrt(np.maximum(squares / counts - mean ** 2, 0.0)),
+        'min': sorted_values[starts],
+        'max': sorted_values[starts + counts - 1],
+    }
+    for percentile in PERCENTILES:
+        stats[f'p{percentile}'] = _quantile(sorted_values, starts, counts, percentile / 100)
+    return stats
+
+
+def trend_slopes(days, scores, group_ids, groups):
+    """
+    Least-squares slope of score over time for each group, in points per
+    30 days; NaN where a group has a single date.
+    """
+    x = (days - days.min()).astype(np.float64) if len(days) else days.astype(np.float64)
+    n = np.bincount(group_ids, minlength=groups)
+    sx = np.bincount(group_ids, x, minlength=groups)
+    sy = np.bincount(group_ids, scores, minlength=groups)
+    sxx = np.bincount(group_ids, x * x, minlength=groups)
+    sxy = np.bincount(group_ids, x * scores, minlength=groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = n * sxx - sx * sx
+        slope = np.where(denominator > 0, (n * sxy - sx * sy) / denominator, np.nan)
+    return slope * 30
+
+
+def competition_ranks(group_starts_per_row, sorted_scores_desc):
+    """
+    '1224' ranks for rows sorted by group, then score descending: tied
+    scores share the best rank, the next score skips ahead.
+    """
+    positions = np.arange(len(sorted_scores_desc))
+    new_score = np.ones(len(positions), dtype=bool)
+    new_score[1:] = sorted_scores_desc[1:] != sorted_scores_desc[:-1]
+    new_score |= positions == group_starts_per_row
+    tie_start = np.maximum.accumulate(np.where(new_score, positions, 0))
+    return tie_start - group_starts_per_row + 1
+
+
+# --- Payloads --------------------------------------------------------------
+
+def _rows(names, columns):
+    """Lists of equal length -> list of dicts, with floats rounded and NaN as None."""
+    prepared = []
+    for column in columns:
+        if isinstance(column, np.ndarray) and column.dtype.kind == 'f':
+            column = np.round(column, 2)
+            has_nan = np.isnan(column).any()
+            column = column.tolist()
+            if has_nan:
+                column = [None if value != value else value for value in column]
+        elif isinstance(column, np.ndarray):
+            column = column.tolist()
+        prepared.append(column)
+    return [dict(zip(names, values)) for values in zip(*prepared)]
+
+
+def _statistics(data, keys):
+    """Statistics of `score` grouped by the given key columns, as (group key arrays, stats)."""
+    order, starts, counts = group_by([data[key] for key in keys], data['score'])
+    stats = describe(data['score'][order], starts, counts)
+    return [data[key][order][starts] for key in keys], stats
+
+
+def score_statistics(source):
+    """
+    School-wide statistics for one source ('results' or 'quizzes'): by
+    subject, and by (school class, subject). Quizzes also get trend slopes.
+    """
+    data = score_columns(SOURCES[source])
+    subjects = data['subjects']
+    class_names = dict(SchoolClass.objects.values_list('pk', 'name'))
+    stat_names = ['count', 'mean', 'median', 'std', 'min', 'max', *(f'p{p}' for p in PERCENTILES)]
+
+    (subject_keys,), stats = _statistics(data, ['subject'])
+    by_subject = _rows(
+        ['subject', *stat_names],
+        [[subjects[code] for code in subject_keys.tolist()], *(stats[name] for name in stat_names)],
+    )
+
+    (class_keys, class_subject_keys), stats = _statistics(data, ['school_class', 'subject'])
+    names = ['school_class', 'school_class_name', 'subject', *stat_names]
+    columns = [
+        class_keys, [class_names.get(pk) for pk in class_keys.tolist()],
+        [subjects[code] for code in class_subject_keys.tolist()],
+        *(stats[name] for name in stat_names),
+    ]
+    if 'day' in data and len(class_keys):
+        # Group ids follow the same (class, subject) order as the statistics.
+        subject_count = max(len(subjects), 1)
+        combined = data['school_class'] * subject_count + data['subject']
+        group_keys = class_keys * subject_count + class_subject_keys
+        group_ids = np.searchsorted(group_keys, combined)
+        names.append('trend_per_30_days')
+        columns.append(trend_slopes(data['day'], data['score'], group_ids, len(group_keys)))
+    return {'by_subject': by_subject, 'by_class_subject': _rows(names, columns)}
+
+
+def class_ranking(source, school_class_id):
+    """
+    Rank of every student of one class in each subject (by their mean
+    score there) and overall (by the mean of their subject means).
+
+    Both come as parallel students/scores/ranks arrays, best first, which
+    keeps a ranking of thousands of students cheap to build and to send.
+    """
+    return rank_scores(score_columns(SOURCES[source], school_class_id))
+
+
+def rank_scores(data):
+    """The ranking payload of class_ranking() for columns from score_columns()."""
+    subjects = data['subjects']
+    if not len(data['score']):
+        return {'by_subject': [], 'overall': {'of': 0, 'students': [], 'scores': [], 'subjects': [], 'ranks': []}}
+
+    # Mean score per (subject, student)
+    order, starts, counts = group_by([data['subject'], data['student']])
+    means = np.add.reduceat(data['score'][order], starts) / counts
+    subject_of = data['subject'][order][starts]
+    student_of = data['student'][order][starts]
+
+    # Rank within each subject, best mean first; one columnar entry per subject
+    order, starts, counts = group_by([subject_of], -means)
+    ranks = competition_ranks(np.repeat(starts, counts), -means[order])
+    by_subject = [
+        {
+            'subject': subjects[code],
+            'of': count,
+            'students': students,
+            'scores': scores,
+            'ranks': subject_ranks,
+        }
+        for code, count, students, scores, subject_ranks in zip(
+            subject_of[order][starts].tolist(), counts.tolist(),
+            *(np.split(column, starts[1:]) for column in (student_of[order], np.round(means[order], 2), ranks)),
+        )
+    ]
+    for entry in by_subject:
+        entry.update((name, entry[name].tolist()) for name in ('students', 'scores', 'ranks'))
+
+    # Overall: mean over the subjects each student has scores in
+    order, starts, counts = group_by([student_of])
+    overall_means = np.add.reduceat(means[order], starts) / counts
+    students = student_of[order][starts]
+    order = np.argsort(-overall_means, kind='stable')
+    ranks = competition_ranks(np.zeros(len(order), dtype=np.int64), -overall_means[order])
+    overall = {
+        'of': len(order),
+        'students': students[order].tolist(),
+        'scores': np.round(overall_means[order], 2).tolist(),
+        'subjects': counts[order].tolist(),
+        'ranks': ranks.tolist(),
+    }
+    return {'by_subject': by_subject, 'overall': overall}
+
+
+def cached(name, compute):
+    """`compute()`, cached under the current analytics version stamps."""
+    stamps = current_stamps([GLOBAL, *ANALYTICS_DEPENDENCIES])
+    digest = hashlib.md5('|'.join(stamps).encode(), usedforsecurity=False).hexdigest()
+    key = f'analytics:{name}:{digest}'
+    payload = cache.get(key)
+    if payload is None:
+        payload = compute()
+        cache.set(key, payload, ANALYTICS_CACHE_TIMEOUT)
+    return payload
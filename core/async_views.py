@@ -0,0 +1,189 @@
+"""
+Async versions of the read-only student endpoints, under /api/async/.
+
+They answer like their DRF counterparts in core/views.py (same payloads,
+keyset pagination, ETags and 304s) but are plain Django async views that
+read through the async ORM, so under ASGI (see Procfile) a request waiting
+on the database leaves the worker free to serve other connections.
+Authentication, the Student lookup and the ETag stamps usually come from
+the cache, and run together in a single sync_to_async() call.
+
+Writes and ?since= delta sync stay on the sync endpoints. ?fields= trims
+the output here but does not narrow the SELECT.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .dashboard import abuild_dashboard, requested_sections
+from .instrumentation import TimedJSONRenderer
+from .mixins import resolve_student
+from .models import Attendance, AttendanceSummary, Fee, Quiz, Result, Student
+from .pagination import KeysetPagination
+from .proceedings import aclass_proceedings
+from .serializers import (
+    AttendanceSerializer, AttendanceSummarySerializer, FeeSerializer, QuizSerializer,
+    ResultSerializer, StudentSerializer,
+)
+from .versions import CATALOG, etag_for
+
+NO_STUDENT = {'error': 'Logged-in user is not linked to a student record.'}
+
+
+class AsyncReadView(View):
+    """
+    Authenticates with the DRF authentication classes, resolves
+    request.student and answers a matching If-None-Match with 304 before
+    awaiting respond(), whose data is rendered as JSON.
+    """
+    http_method_names = ['get', 'head', 'options']
+    version_resources = ()
+
+    def get_version_dependencies(self, student):
+        # As ConditionalGetMixin.get_version_dependencies
+        scope = student.pk if student else 'none'
+        return [
+            resource if isinstance(resource, tuple) else (resource, scope)
+            for resource in self.version_resources
+        ]
+
+    def get_etag_variant(self):
+        return ''
+
+    def authenticators(self):
+        return [authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+
+    def prepare(self, request):
+        """The synchronous part of a request: (DRF request, student, ETag)."""
+        drf_request = Request(request, authenticators=self.authenticators())
+        if not drf_request.user.is_authenticated:
+            raise NotAuthenticated()
+        student = resolve_student(drf_request)
+        etag = etag_for(request, self.get_version_dependencies(student), self.get_etag_variant())
+        return drf_request, student, etag
+
+    async def get(self, request, **kwargs):
+        try:
+            drf_request, student, etag = await sync_to_async(self.prepare)(request)
+            if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+                return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+            data = await self.respond(drf_request, student, **kwargs)
+        except APIException as exc:
+            return self.handle_exception(request, exc)
+        if isinstance(data, HttpResponse):
+            return data
+        response = HttpResponse(TimedJSONRenderer().render(data), content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+    async def respond(self, request, student, **kwargs):
+        raise NotImplementedError
+
+    def handle_exception(self, request, exc):
+        # The payloads and headers of rest_framework.views.exception_handler
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        response = JsonResponse(data, status=exc.status_code, safe=False)
+        if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+            response['WWW-Authenticate'] = self.authenticators()[0].authenticate_header(request)
+        return response
+
+
+class AsyncListView(AsyncReadView):
+    """A keyset-paginated list of the logged-in student's rows."""
+    queryset = None
+    serializer_class = None
+    keyset_ordering = ('id',)
+    student_field = 'student_id'
+
+    def get_queryset(self, student, **kwargs):
+        """The rows to list, or None when there are none (no linked Student)."""
+        if student is None:
+            return None
+        return self.queryset.filter(**{self.student_field: student.pk})
+
+    async def respond(self, request, student, **kwargs):
+        queryset = self.get_queryset(student, **kwargs)
+        if queryset is None:
+            return {'next': None, 'results': []}
+        paginator = KeysetPagination()
+        rows = await paginator.apaginate_queryset(queryset, request, view=self)
+        results = self.serializer_class(rows, many=True, context={'request': request}).data
+        return {'next': paginator.get_next_link(), 'results': results}
+
+
+class AsyncStudentsView(AsyncListView):
+    queryset = Student.objects.select_related('school_class')
+    serializer_class = StudentSerializer
+    student_field = 'pk'
+    version_resources = ('student', CATALOG)
+
+
+class AsyncFeesView(AsyncListView):
+    queryset = Fee.objects.all()
+    serializer_class = FeeSerializer
+    version_resources = ('fee',)
+
+
+class AsyncResultsView(AsyncListView):
+    queryset = Result.objects.all()
+    serializer_class = ResultSerializer
+    version_resources = ('result',)
+
+
+class AsyncQuizzesView(AsyncListView):
+    queryset = Quiz.objects.all()
+    serializer_class = QuizSerializer
+    version_resources = ('quiz',)
+
+
+class AsyncAttendancesView(AsyncListView):
+    queryset = Attendance.objects.all()
+    serializer_class = AttendanceSerializer
+    keyset_ordering = ('-date', '-id')
+    version_resources = ('attendance',)
+
+
+class AsyncAttendanceSummaryView(AsyncListView):
+    """Summaries of the student in the URL, as /api/students/<pk>/attendancesummary/."""
+    serializer_class = AttendanceSummarySerializer
+    keyset_ordering = ('-percentage', 'id')
+
+    def get_version_dependencies(self, student):
+        return [('attendance', self.kwargs['student_pk']), CATALOG]
+
+    def get_queryset(self, student, student_pk):
+        return AttendanceSummary.objects.filter(student_id=student_pk).select_related('course')
+
+
+class AsyncClassProceedingsView(AsyncReadView):
+    version_resources = ('attendance', 'student', CATALOG)
+
+    async def respond(self, request, student):
+        if student is None:
+            return JsonResponse(NO_STUDENT, status=status.HTTP_404_NOT_FOUND)
+        return await aclass_proceedings(student)
+
+
+class AsyncDashboardView(AsyncReadView):
+    """/api/dashboard/ through the async section builders (core/dashboard.py)."""
+    version_resources = ('student', 'fee', 'result', 'quiz', 'attendance', CATALOG)
+
+    def get_version_dependencies(self, student):
+        dependencies = super().get_version_dependencies(student)
+        if student is not None:
+            dependencies.append(('timetable', student.school_class_id))
+        return dependencies
+
+    def get_etag_variant(self):
+        return timezone.localdate().isoformat()
+
+    async def respond(self, request, student):
+        if student is None:
+            return JsonResponse(NO_STUDENT, status=status.HTTP_404_NOT_FOUND)
+        return await abuild_dashboard(student, requested_sections(request.query_params))
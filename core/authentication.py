@@ -0,0 +1,180 @@
+import threading
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import LocalTTLCache, shared_cache
+from .models import Student
+
+DEFAULTS = {
+    # Process-local tier. Invalidation only reaches the process that saw the
+    # change, so this TTL bounds how long a deleted token or deactivated user
+    # still authenticates on the other workers: keep it to a few seconds.
+    'LOCAL_TTL': 5,
+    'LOCAL_MAX_ENTRIES': 10000,
+    # Optional shared tier: a CACHES alias (e.g. Redis), or None to disable.
+    # Ignored when the alias is a per-process cache (locmem), which would
+    # only add another tier that invalidation cannot reach.
+    'SHARED_CACHE': 'default',
+    # Capped at MAX_SHARED_TTL. Changes made without signals (a queryset
+    # update() of User.is_active, raw SQL) are only seen once entries expire.
+    'SHARED_TTL': 60,
+}
+MAX_SHARED_TTL = 60
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+
+
+def _shared_key(token_key):
+    return f'auth-token:{token_key}'
+
+
+def _generation_key(token_key):
+    return f'auth-token-generation:{token_key}'
+
+
+def _shared_ttl():
+    return min(_config()['SHARED_TTL'], MAX_SHARED_TTL)
+
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.shared_hits = self.shared_misses = self.db_lookups = 0
+
+    def bump(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+_local = LocalTTLCache(max_entries=_config()['LOCAL_MAX_ENTRIES'], ttl=_config()['LOCAL_TTL'])
+_counters = _Counters()
+# Bumped by every invalidation in this process: a lookup that raced one
+# does not write what it loaded back to the local tier.
+_local_generation = 0
+
+
+def _shared_cache():
+    return shared_cache(_config()['SHARED_CACHE'])
+
+
+def token_cache_stats():
+    """Hit/miss counters for this process, for both tiers."""
+    return {
+        'local': _local.stats(),
+        'shared': {
+            'enabled': _shared_cache() is not None,
+            'hits': _counters.shared_hits,
+            'misses': _counters.shared_misses,
+        },
+        'db_lookups': _counters.db_lookups,
+    }
+
+
+def invalidate_tokens(token_keys):
+    """
+    Forget cached authentications for the given token keys in both tiers.
+
+    Shared entries are versioned: each records the token's generation when
+    its lookup started, and this moves the generation on. An entry loaded
+    before the change but written after it is then never served.
+    """
+    global _local_generation
+    token_keys = list(token_keys)
+    _local_generation += 1
+    for token_key in token_keys:
+        _local.delete(token_key)
+    shared = _shared_cache()
+    if shared is not None and token_keys:
+        generation = uuid.uuid4().hex
+        # Outlives any entry written under the previous generation.
+        shared.set_many({_generation_key(token_key): generation for token_key in token_keys}, _shared_ttl())
+        shared.delete_many([_shared_key(token_key) for token_key in token_keys])
+
+
+def invalidate_users(user_ids):
+    """Forget cached authentications for every token of the given users."""
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if user_ids:
+        invalidate_tokens(Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True))
+
+
+class CachedUser(SimpleLazyObject):
+    """
+    request.user for a cached authentication. The cached id and flags
+    answer authentication and permission checks without a query; reading
+    anything else loads the User row once.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, is_active, is_staff, is_superuser):
+        super().__init__(lambda: get_user_model()._default_manager.get(pk=user_id))
+        self.__dict__.update(
+            pk=user_id, id=user_id, is_active=is_active, is_staff=is_staff, is_superuser=is_superuser,
+        )
+
+    def __bool__(self):
+        return True
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for TokenAuthentication that caches the
+    token -> (user id, is_active, is_staff, is_superuser, linked Student id)
+    mapping. Only those fields are cached, never the password hash; the
+    request's User is a CachedUser that loads the full row only if a view
+    reads more than them.
+
+    Lookups go to a process-local LRU first, then to the optional shared
+    cache, and only then to the database. Entries are invalidated when the
+    token is deleted or the user / linked Student changes (core/signals.py).
+    The resolved Student id is exposed as request.auth.student_id.
+    """
+
+    def authenticate_credentials(self, key):
+        entry = _local.get(key)
+        if entry is None:
+            local_generation = _local_generation
+            shared = _shared_cache()
+            if shared is not None:
+                found = shared.get_many([_shared_key(key), _generation_key(key)])
+                generation = found.get(_generation_key(key))
+                written_at, entry = found.get(_shared_key(key), (None, None))
+                if written_at != generation:
+                    entry = None
+                _counters.bump('shared_hits' if entry is not None else 'shared_misses')
+            if entry is None:
+                entry = self._load(key)
+                if shared is not None:
+                    shared.set(_shared_key(key), (generation, entry), _shared_ttl())
+            if local_generation == _local_generation:
+                _local.set(key, entry)
+
+        user_id, is_active, is_staff, is_superuser, student_id = entry
+        if not is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        user = CachedUser(user_id, is_active, is_staff, is_superuser)
+        token = self.get_model()(key=key, user_id=user_id)
+        token.student_id = student_id
+        return (user, token)
+
+    def _load(self, key):
+        _counters.bump('db_lookups')
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        student_id = Student.objects.filter(user_id=token.user_id).values_list('pk', flat=True).first()
+        user = token.user
+        return (user.pk, user.is_active, user.is_staff, user.is_superuser, student_id)
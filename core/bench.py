@@ -0,0 +1,417 @@
+"""
+Helpers shared by the benchmark management commands: a throwaway database
+and a deterministic synthetic school to run against.
+"""
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, time as time_of_day, timedelta
+from itertools import islice
+from urllib.parse import quote
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .bitmaps import rebuild_attendance_bitmaps
+from .ledger import deferred_ledger
+from .models import Attendance, Course, Fee, FeePayment, Quiz, Result, SchoolClass, Student, Teacher, Timetable
+from .proceedings import rebuild_class_proceedings
+from .summaries import rebuild_attendance_summaries
+
+
+@contextmanager
+def scratch_database(test_name=None):
+    """
+    Run the block against a freshly migrated test database, destroyed
+    afterwards. With `test_name` it is a named database (a file, on SQLite)
+    that other processes can open too; see database_url().
+    """
+    old_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST'].get('NAME')
+    if test_name is not None:
+        connection.settings_dict['TEST']['NAME'] = test_name
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+
+
+def database_url():
+    """A DATABASE_URL for the database this process is connected to, for child processes."""
+    settings = connection.settings_dict
+    if connection.vendor == 'sqlite':
+        return f'sqlite:///{settings["NAME"]}'
+    credentials = quote(settings['USER'] or '', safe='')
+    if settings['PASSWORD']:
+        credentials += ':' + quote(settings['PASSWORD'], safe='')
+    host = settings['HOST'] or 'localhost'
+    port = f':{settings["PORT"]}' if settings['PORT'] else ''
+    return f'postgres://{credentials}@{host}{port}/{settings["NAME"]}'
+
+
+@contextmanager
+def timed(results, label):
+    """Store the wall time of the block (in seconds) under results[label]."""
+    start = time.perf_counter()
+    yield
+    results[label] = time.perf_counter() - start
+
+
+def percentile(ordered, fraction):
+    """The `fraction` quantile (nearest rank) of an ascending list; NaN when empty."""
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else float('nan')
+
+
+# Every API route, as (method, url, user, budget). `url` is formatted with
+# row ids (seed_school() in the tests, the bench_suite command); `user` is
+# 'student' (linked to a Student) or 'staff'. The budget is the most queries
+# one request may run at any volume, from a cold cache; keep it tight so a
+# new query shows up in review. QueryBudgetTests fails on a route missing here.
+ENDPOINTS = [
+    ('GET', '/api/', 'student', 0),
+    ('GET', '/api/students/', 'student', 2),
+    ('GET', '/api/students/{student}/', 'student', 2),
+    ('GET', '/api/fees/', 'student', 2),
+    ('GET', '/api/fees/{fee}/', 'student', 2),
+    ('GET', '/api/results/', 'student', 2),
+    ('GET', '/api/results/{result}/', 'student', 2),
+    ('GET', '/api/quizzes/', 'student', 2),
+    ('GET', '/api/quizzes/{quiz}/', 'student', 2),
+    ('GET', '/api/attendances/', 'student', 2),
+    ('GET', '/api/attendances/{attendance}/', 'student', 2),
+    ('POST', '/api/attendances/roll-call/', 'staff', 23),
+    ('GET', '/api/payments/', 'student', 2),
+    ('GET', '/api/payments/{payment}/', 'student', 2),
+    ('POST', '/api/payments/', 'staff', 14),
+    ('GET', '/api/ledger/students/', 'staff', 1),
+    ('GET', '/api/ledger/students/?school_class={school_class}', 'staff', 1),
+    ('GET', '/api/ledger/students/{student}/', 'staff', 1),
+    ('GET', '/api/ledger/classes/', 'staff', 1),
+    ('GET', '/api/ledger/classes/{school_class}/', 'staff', 1),
+    ('POST', '/api/ledger/classes/{school_class}/issue-fees/', 'staff', 22),
+    ('GET', '/api/teachers/', 'student', 1),
+    ('GET', '/api/teachers/{teacher}/', 'student', 1),
+    ('GET', '/api/classes/', 'student', 1),
+    ('GET', '/api/classes/{school_class}/', 'student', 1),
+    ('GET', '/api/timetables/', 'student', 2),
+    ('GET', '/api/timetables/?school_class={school_class}', 'staff', 2),
+    ('GET', '/api/timetables/{timetable}/', 'staff', 2),
+    ('GET', '/api/students/{student}/attendancesummary/', 'student', 1),
+    ('GET', '/api/students/{student}/attendancesummary/{summary}/', 'student', 1),
+    ('POST', '/api/auth/', None, 5),
+    ('GET', '/api/auth/cache-stats/', 'staff', 0),
+    ('GET', '/api/proceedings/', 'student', 2),
+    ('GET', '/api/attendance-terms/', 'student', 2),
+    ('GET', '/api/attendance-terms/?term=2024-T1', 'student', 2),
+    ('GET', '/api/attendance-calendar/?month=2024-01', 'student', 2),
+    ('GET', '/api/dashboard/', 'student', 7),
+    ('GET', '/api/jobs/metrics/', 'staff', 3),
+    ('GET', '/api/metrics/', 'staff', 0),
+    ('GET', '/api/exports/attendance.csv', 'staff', 1),
+    ('GET', '/api/exports/results.jsonl', 'staff', 1),
+    ('GET', '/api/exports/fees.csv.gz', 'staff', 1),
+    ('GET', '/api/analytics/results/', 'student', 2),
+    ('GET', '/api/analytics/quizzes/', 'student', 2),
+    ('GET', '/api/analytics/results/classes/{school_class}/ranking/', 'staff', 1),
+    ('GET', '/api/analytics/attendance/classes/{school_class}/?term=2024-T1', 'staff', 1),
+    ('GET', '/api/async/students/', 'student', 2),
+    ('GET', '/api/async/students/{student}/attendancesummary/', 'student', 2),
+    ('GET', '/api/async/fees/', 'student', 2),
+    ('GET', '/api/async/results/', 'student', 2),
+    ('GET', '/api/async/quizzes/', 'student', 2),
+    ('GET', '/api/async/attendances/', 'student', 2),
+    ('GET', '/api/async/proceedings/', 'student', 2),
+    ('GET', '/api/async/dashboard/', 'student', 7),
+]
+
+
+def insert_rows(model, fields, rows, batch_size=5000, progress=None):
+    """
+    INSERT `rows` (tuples of database-ready values for `fields`) into the
+    table of `model`, as multi-row INSERT statements in one transaction
+    per `batch_size` rows. No model instances are built and no signals or
+    QuerySet write hooks run, so callers rebuild whatever those maintain.
+    `progress`, if given, is called with the running total after each
+    batch. Returns the number of rows written.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+    prefix = f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES '
+    placeholder = f"({', '.join(['%s'] * len(fields))})"
+    per_statement = max(1, min(batch_size, (connection.features.max_query_params or 65535) // len(fields)))
+
+    written = 0
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        with transaction.atomic(), connection.cursor() as cursor:
+            for offset in range(0, len(batch), per_statement):
+                chunk = batch[offset:offset + per_statement]
+                cursor.execute(prefix + ', '.join([placeholder] * len(chunk)), [v for row in chunk for v in row])
+        written += len(batch)
+        if progress:
+            progress(written)
+    return written
+
+
+def school_dates(start, days, weekdays_only=False):
+    """`days` consecutive dates from `start`, skipping Saturdays and Sundays with `weekdays_only`."""
+    dates = []
+    current = start
+    while len(dates) < days:
+        if not weekdays_only or current.weekday() < 5:
+            dates.append(current)
+        current += timedelta(days=1)
+    return dates
+
+
+def letter_grade(score):
+    return 'A' if score >= 80 else 'B' if score >= 65 else 'C' if score >= 50 else 'D'
+
+
+# Lessons a day in the generated timetables: 08:00-08:45, 09:00-09:45, ...
+TIMETABLE_PERIODS = 6
+TIMETABLE_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri')
+
+
+def generate_school(students=200, courses=20, classes=5, days=30,
+                    attendance_ratio=0.25, seed=0, batch_size=5000, teachers=None,
+                    results=0, quizzes=0, fees=0, timetable=False,
+                    start=date(2024, 1, 1), weekdays_only=False, progress=None):
+    """
+    Populate a synthetic school. The same arguments always produce the
+    same rows.
+
+    Every student gets attendance on each of `days` days for roughly
+    `attendance_ratio` of the courses, so most (student, course) pairs have
+    no rows at all, as in production; with `weekdays_only`, `days` counts
+    school days. Each student also gets `results` results, `quizzes`
+    quizzes and `fees` term fees (about half of them paid), and with
+    `timetable` every class gets a week of lessons.
+
+    Attendance, results and quizzes go in through insert_rows(), and the
+    attendance summaries, class proceedings and attendance bitmaps are
+    rebuilt once at the end. `progress`, if given, is called with (table, rows so far) as they
+    are written. Returns the number of Attendance rows created.
+    """
+    rng = random.Random(seed)
+    report = (lambda table: lambda written: progress(table, written)) if progress else (lambda table: None)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    teacher_objs = Teacher.objects.bulk_create([
+        Teacher(first_name=f'Teacher{i}', last_name='Bench', email=f'teacher{i}@bench.local')
+        for i in range(teachers or max(1, courses // 2))
+    ])
+    school_classes = SchoolClass.objects.bulk_create([
+        SchoolClass(name=f'Class {i}', teacher=teacher_objs[i % len(teacher_objs)])
+        for i in range(classes)
+    ])
+    course_objs = Course.objects.bulk_create([
+        Course(name=f'Course {i}', subject=f'Subject {i}', teacher=teacher_objs[i % len(teacher_objs)])
+        for i in range(courses)
+    ])
+    student_objs = Student.objects.bulk_create([
+        Student(
+            first_name=f'Student{i}', last_name='Bench', email=f'student{i}@bench.local',
+            grade=str(1 + i % 12), school_class=school_classes[i % classes],
+        )
+        for i in range(students)
+    ], batch_size=batch_size)
+    student_ids = [student.pk for student in student_objs]
+    course_ids = [course.pk for course in course_objs]
+
+    if timetable:
+        Timetable.objects.bulk_create([
+            Timetable(
+                school_class=school_class, day=day, subject=course.subject, teacher_id=course.teacher_id,
+                room=f'Room {c}', start_time=time_of_day(8 + period, 0), end_time=time_of_day(8 + period, 45),
+            )
+            for c, school_class in enumerate(school_classes)
+            for d, day in enumerate(TIMETABLE_DAYS)
+            for period in range(TIMETABLE_PERIODS)
+            for course in [course_objs[(c + d * TIMETABLE_PERIODS + period) % courses]]
+        ], batch_size=batch_size)
+
+    dates = [connection.ops.adapt_datefield_value(day) for day in school_dates(start, days, weekdays_only)]
+    per_student = max(1, int(courses * attendance_ratio))
+
+    def attendance():
+        for student_id in student_ids:
+            for course_id in rng.sample(course_ids, per_student):
+                for day in dates:
+                    yield student_id, course_id, day, 'Present' if rng.random() < 0.85 else 'Absent', now
+
+    created = insert_rows(
+        Attendance, ('student', 'course', 'date', 'status', 'updated_at'), attendance(),
+        batch_size, report('attendance'),
+    )
+
+    # Separate streams, so the attendance above does not depend on these counts.
+    scores = random.Random(f'{seed}:results')
+    insert_rows(
+        Result, ('student', 'subject', 'score', 'grade', 'updated_at'),
+        (
+            (student_id, f'Subject {(i + n) % courses}', score, letter_grade(score), now)
+            for i, student_id in enumerate(student_ids)
+            for n in range(results)
+            for score in [scores.randint(30, 100)]
+        ),
+        batch_size, report('results'),
+    )
+    quiz_rng = random.Random(f'{seed}:quizzes')
+    quiz_dates = dates or [connection.ops.adapt_datefield_value(start)]
+    insert_rows(
+        Quiz, ('student', 'subject', 'date', 'score', 'updated_at'),
+        (
+            (student_id, f'Subject {quiz_rng.randrange(courses)}', quiz_rng.choice(quiz_dates),
+             quiz_rng.randint(0, 10), now)
+            for student_id in student_ids
+            for _ in range(quizzes)
+        ),
+        batch_size, report('quizzes'),
+    )
+    if fees:
+        generate_fees(student_ids, fees, random.Random(f'{seed}:fees'), batch_size, report('fees'))
+
+    rebuild_attendance_summaries()
+    rebuild_class_proceedings()
+    rebuild_attendance_bitmaps()
+    return created
+
+
+def generate_fees(student_ids, per_student, rng, batch_size=5000, progress=None):
+    """
+    `per_student` term fees for each student, through the ledger (one
+    balance refresh per batch): about half paid in full, a quarter in part.
+    """
+    written = 0
+    for offset in range(0, len(student_ids), max(1, batch_size // per_student)):
+        with deferred_ledger():
+            fees = Fee.objects.bulk_create([
+                Fee(student_id=student_id, amount=rng.choice((150, 200, 250, 300)), term=f'T{term + 1}')
+                for student_id in student_ids[offset:offset + max(1, batch_size // per_student)]
+                for term in range(per_student)
+            ])
+            payments = []
+            for fee in fees:
+                share = rng.random()
+                if share < 0.75:
+                    payments.append(FeePayment(
+                        fee=fee, student_id=fee.student_id, method='transfer',
+                        amount=fee.amount if share < 0.5 else fee.amount // 2,
+                    ))
+            FeePayment.objects.bulk_create(payments)
+        written += len(fees)
+        if progress:
+            progress(written)
+    return written
+
+
+# Weekly hours per subject in the synthetic timetable problems: 30 lessons
+# a week into 5 days x 8 periods, so every class has some free periods.
+TIMETABLE_SUBJECT_HOURS = (5, 5, 4, 4, 3, 3, 3, 3)
+
+
+def timetable_problem(classes, seed=0, room_ratio=0.85, unavailable_per_teacher=2):
+    """
+    An in-memory scheduling.Problem shaped like a real school: each subject's
+    teachers take as many classes as fit in ~34 hours a week, rooms cover
+    `room_ratio` of the classes, and every teacher has a few blocked periods.
+    """
+    from .scheduling import Lesson, Problem
+
+    rng = random.Random(seed)
+    days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri']
+    periods = [
+        (time_of_day(8 + hour, 0), time_of_day(8 + hour, 45))
+        for hour in range(8)
+    ]
+    lessons = []
+    teacher_ids = []
+    for subject, hours in enumerate(TIMETABLE_SUBJECT_HOURS):
+        per_teacher = 34 // hours
+        for school_class in range(classes):
+            teacher = subject * classes + school_class // per_teacher
+            if not teacher_ids or teacher_ids[-1] != teacher:
+                teacher_ids.append(teacher)
+            lessons.extend(
+                Lesson(school_class, subject, teacher, f'Subject {subject}') for _ in range(hours)
+            )
+    unavailable = {
+        (teacher, rng.choice(days), rng.randrange(len(periods)))
+        for teacher in teacher_ids
+        for _ in range(unavailable_per_teacher)
+    }
+    rooms = [f'Room {i}' for i in range(max(1, round(classes * room_ratio)))]
+    return Problem(days=days, periods=periods, rooms=rooms, lessons=lessons, unavailable=unavailable)
+
+
+# --- HTTP load ---------------------------------------------------------------
+
+async def _exchange(reader, writer, request):
+    """Send one raw HTTP/1.1 request; (status, whether the connection stays open)."""
+    writer.write(request)
+    await writer.drain()
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    status = int(head[0].split()[1])
+    headers = {}
+    for line in head[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection') != 'close'
+
+
+async def http_load(host, port, requests, concurrency, duration, timeout=10.0):
+    """
+    Keep `concurrency` connections busy for `duration` seconds, each sending
+    the next of `requests` (raw HTTP/1.1 request bytes) as soon as its last
+    answer is in, and reconnecting whenever the server closes. Returns the
+    latencies (seconds) of the 2xx answers, the number of errors (other
+    statuses, timeouts, dropped connections) and the elapsed time.
+    """
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(offset):
+        nonlocal errors
+        stream = None
+        sent = offset
+        while time.perf_counter() < deadline:
+            request = requests[sent % len(requests)]
+            sent += concurrency
+            start = time.perf_counter()
+            try:
+                if stream is None:
+                    stream = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+                status, keep_alive = await asyncio.wait_for(_exchange(*stream, request), timeout)
+            except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                errors += 1
+                keep_alive, status = False, None
+            else:
+                if 200 <= status < 300:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+            if not keep_alive and stream is not None:
+                stream[1].close()
+                stream = None
+        if stream is not None:
+            stream[1].close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
@@ -0,0 +1,48 @@
+"""
+WSGI and ASGI applications for bench_async_reads to serve in its own
+gunicorn processes: the regular ones, plus an optional fixed delay on every
+SQL query (BENCH_DB_LATENCY_MS) standing in for the round trip to a
+database on another host. Loaded as factories (`module:wsgi_application()`)
+so nothing is imported before Django is set up.
+"""
+import os
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'school_api.settings')
+
+
+def _delay_queries():
+    from django.db.backends.signals import connection_created
+
+    latency = float(os.environ.get('BENCH_DB_LATENCY_MS') or 0) / 1000
+    if not latency:
+        return
+
+    def delayed(execute, sql, params, many, context):
+        # A blocking wait, like a network read: it holds this thread, not the event loop.
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        if delayed not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delayed)
+
+    connection_created.connect(install, weak=False)
+
+
+def wsgi_application():
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+    _delay_queries()
+    return application
+
+
+def asgi_application():
+    from django.core.asgi import get_asgi_application
+
+    # As school_api/asgi.py does for the web process
+    os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+    application = get_asgi_application()
+    _delay_queries()
+    return application
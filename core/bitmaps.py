@@ -0,0 +1,474 @@
+"""
+Attendance bitmaps: one AttendanceBitmap row per (student, course, term)
+with two bit strings over the term's calendar days, `held` (attendance
+was taken that day) and `present`. Bit i is day `start + i`, least
+significant bit first, as np.packbits(..., bitorder='little') lays it out.
+A term of ~120 days fits in 16 bytes per string.
+
+Percentages, longest absence streaks, month calendars and class-wide
+aggregates are popcounts and whole-matrix bit operations over a few small
+blobs, instead of a GROUP BY over every Attendance row behind them.
+
+Attendance stays the source of truth. Single writes recompute the bits
+of the days they touch (core/signals.py), the bulk paths refresh the
+touched (student, course) pairs along with their summaries
+(core/summaries.py), and rebuild_attendance_bitmaps() or the
+rebuild_attendance_bitmaps command recompute everything. Several rows on
+one day count once: held if there is any, present if any is Present.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Attendance, AttendanceBitmap
+from .proceedings import student_batches
+from .versions import bump_everything
+
+# (month, day) each term starts on, in year order; a term runs until the
+# next one starts. Labels are 'YYYY-Tn' by the year the term starts in.
+# Override with settings.ATTENDANCE_TERM_STARTS, then rebuild the bitmaps.
+DEFAULT_TERM_STARTS = ((1, 1), (5, 1), (9, 1))
+
+# Students under this percentage of a course's held days count as at risk
+# in class_attendance().
+AT_RISK_PERCENTAGE = 75
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+# --- Terms -------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Term:
+    label: str
+    start: date
+    # First day of the next term
+    end: date
+
+    @property
+    def days(self):
+        return (self.end - self.start).days
+
+    @property
+    def size(self):
+        """Bytes in each bit string of the term."""
+        return (self.days + 7) // 8
+
+    def bit(self, day):
+        return (day - self.start).days
+
+
+def term_starts():
+    return tuple(tuple(start) for start in getattr(settings, 'ATTENDANCE_TERM_STARTS', DEFAULT_TERM_STARTS))
+
+
+def make_term(year, number):
+    starts = term_starts()
+    if not 1 <= number <= len(starts):
+        raise ValueError(f'There are {len(starts)} terms a year, not {number}.')
+    start = date(year, *starts[number - 1])
+    end = date(year, *starts[number]) if number < len(starts) else date(year + 1, *starts[0])
+    return Term(f'{year}-T{number}', start, end)
+
+
+def term_of(day):
+    starts = term_starts()
+    for number in range(len(starts), 0, -1):
+        if (day.month, day.day) >= starts[number - 1]:
+            return make_term(day.year, number)
+    return make_term(day.year - 1, len(starts))
+
+
+def parse_term(label):
+    """The Term labelled 'YYYY-Tn'; ValueError for anything else."""
+    year, separator, number = label.partition('-T')
+    if not separator or not year.isdigit() or not number.isdigit():
+        raise ValueError(f"'{label}' is not a term; expected YYYY-Tn, e.g. 2024-T1.")
+    return make_term(int(year), int(number))
+
+
+def terms_between(first, last):
+    """The terms overlapping first..last (dates, inclusive), in order."""
+    term = term_of(first)
+    while term.start <= last:
+        yield term
+        term = term_of(term.end)
+
+
+# --- Packing rows into bitmaps -----------------------------------------------
+
+def pack_bitmaps(rows):
+    """
+    Bitmaps of (student_id, course_id, date, status) rows, as a list of
+    (student_id, course_id, Term, held, present) with the bit strings as
+    bytes. Rows are grouped with a lexsort and their bits set in one
+    boolean matrix, packed a row per bitmap.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    students, courses, days, statuses = zip(*rows)
+    students = np.array(students, dtype=np.int64)
+    courses = np.array(courses, dtype=np.int64)
+    present = np.array(statuses) == 'Present'
+
+    # Terms and bit positions per distinct day, then per row
+    day_values, day_codes = np.unique(np.array(days, dtype='datetime64[D]'), return_inverse=True)
+    terms, term_codes, day_terms, day_bits = [], {}, [], []
+    for day in day_values.tolist():
+        term = term_of(day)
+        if term.label not in term_codes:
+            term_codes[term.label] = len(terms)
+            terms.append(term)
+        day_terms.append(term_codes[term.label])
+        day_bits.append(term.bit(day))
+    row_terms = np.array(day_terms, dtype=np.int64)[day_codes]
+    row_bits = np.array(day_bits, dtype=np.int64)[day_codes]
+
+    order = np.lexsort((row_terms, courses, students))
+    students, courses, row_terms, row_bits, present = (
+        column[order] for column in (students, courses, row_terms, row_bits, present)
+    )
+    boundaries = np.r_[
+        True,
+        (students[1:] != students[:-1]) | (courses[1:] != courses[:-1]) | (row_terms[1:] != row_terms[:-1]),
+    ]
+    group = np.cumsum(boundaries) - 1
+    firsts = np.flatnonzero(boundaries)
+
+    width = max(term.days for term in terms)
+    held_bits = np.zeros((len(firsts), width), dtype=bool)
+    held_bits[group, row_bits] = True
+    present_bits = np.zeros_like(held_bits)
+    present_bits[group[present], row_bits[present]] = True
+    held = np.packbits(held_bits, axis=1, bitorder='little')
+    attended = np.packbits(present_bits, axis=1, bitorder='little')
+
+    packed = []
+    for index, first in enumerate(firsts):
+        term = terms[row_terms[first]]
+        packed.append((
+            int(students[first]), int(courses[first]), term,
+            held[index, :term.size].tobytes(), attended[index, :term.size].tobytes(),
+        ))
+    return packed
+
+
+def upsert_bitmaps(packed, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Bulk upsert pack_bitmaps() output, chunk by chunk. Returns the rows written."""
+    for offset in range(0, len(packed), chunk_size):
+        AttendanceBitmap.objects.bulk_create(
+            [
+                AttendanceBitmap(
+                    student_id=student_id, course_id=course_id, term=term.label, start=term.start,
+                    held=held, present=present,
+                )
+                for student_id, course_id, term, held, present in packed[offset:offset + chunk_size]
+            ],
+            update_conflicts=True,
+            unique_fields=['student', 'course', 'term'],
+            update_fields=['start', 'held', 'present', 'updated_at'],
+        )
+    return len(packed)
+
+
+def _attendance_rows(queryset):
+    return queryset.order_by().values_list('student_id', 'course_id', 'date', 'status')
+
+
+def _sync(live, stored, repair):
+    """
+    Write the bitmaps of `live` (pack_bitmaps() output) that differ from
+    `stored` ({(student_id, course_id, term): (pk, start, held, present)})
+    and remove stored ones with no rows. Returns (stale, orphaned) counts.
+    """
+    keys = set()
+    stale = []
+    for row in live:
+        student_id, course_id, term, held, present = row
+        keys.add((student_id, course_id, term.label))
+        if stored.get((student_id, course_id, term.label), (None,))[1:] != (term.start, held, present):
+            stale.append(row)
+    orphans = [pk for key, (pk, *_) in stored.items() if key not in keys]
+    if repair and stale:
+        upsert_bitmaps(stale)
+    if repair and orphans:
+        AttendanceBitmap.objects.filter(pk__in=orphans).delete()
+    return len(stale), len(orphans)
+
+
+def _stored(queryset):
+    return {
+        (student_id, course_id, term): (pk, start, bytes(held), bytes(present))
+        for pk, student_id, course_id, term, start, held, present in queryset.values_list(
+            'pk', 'student_id', 'course_id', 'term', 'start', 'held', 'present',
+        )
+    }
+
+
+def refresh_bitmaps(pairs):
+    """Recompute every bitmap of the given (student_id, course_id) pairs from their attendance."""
+    pairs = set(pairs)
+    if not pairs:
+        return 0
+    student_ids = {student_id for student_id, _ in pairs}
+    course_ids = {course_id for _, course_id in pairs}
+    live = pack_bitmaps(
+        row for row in _attendance_rows(
+            Attendance.objects.filter(student_id__in=student_ids, course_id__in=course_ids)
+        )
+        if (row[0], row[1]) in pairs
+    )
+    stored = {
+        key: value for key, value in _stored(
+            AttendanceBitmap.objects.filter(student_id__in=student_ids, course_id__in=course_ids)
+        ).items()
+        if key[:2] in pairs
+    }
+    stale, _ = _sync(live, stored, repair=True)
+    return stale
+
+
+def mark_days(days):
+    """
+    Recompute the bits of each (student_id, course_id, date) from that
+    day's Attendance rows: one indexed read and one locked update each.
+    """
+    date_field = Attendance._meta.get_field('date')
+    for student_id, course_id, day in days:
+        day = date_field.to_python(day)
+        statuses = set(
+            Attendance.objects.filter(student_id=student_id, course_id=course_id, date=day)
+            .values_list('status', flat=True)
+        )
+        term = term_of(day)
+        bit = 1 << term.bit(day)
+        with transaction.atomic():
+            rows = AttendanceBitmap.objects.filter(student_id=student_id, course_id=course_id, term=term.label)
+            bitmap = rows.select_for_update().only('held', 'present').first()
+            if bitmap is None:
+                if not statuses:
+                    continue
+                # First day of this pair in the term; tolerate a concurrent writer creating it too.
+                AttendanceBitmap.objects.bulk_create([AttendanceBitmap(
+                    student_id=student_id, course_id=course_id, term=term.label, start=term.start,
+                    held=bytes(term.size), present=bytes(term.size),
+                )], ignore_conflicts=True)
+                bitmap = rows.select_for_update().only('held', 'present').get()
+            held = int.from_bytes(bitmap.held, 'little') & ~bit | (bit if statuses else 0)
+            present = int.from_bytes(bitmap.present, 'little') & ~bit | (bit if 'Present' in statuses else 0)
+            if not held:
+                rows.delete()
+                continue
+            rows.update(
+                held=held.to_bytes(term.size, 'little'), present=present.to_bytes(term.size, 'little'),
+                updated_at=timezone.now(),
+            )
+
+
+# --- Rebuild and check -------------------------------------------------------
+
+def check_attendance_bitmaps(student_batch=500, repair=False, student_range=None):
+    """
+    Compare the stored bitmaps with ones packed from Attendance, students
+    in id batches (within `student_range`, an inclusive pair of ids, if
+    given). Returns (checked, drifted, orphaned); with `repair`, drifted
+    bitmaps are rewritten and orphans removed.
+    """
+    checked = drifted = orphaned = 0
+    for student_ids in student_batches(student_range, student_batch):
+        first, last = student_ids[0], student_ids[-1]
+        live = pack_bitmaps(_attendance_rows(Attendance.objects.filter(student_id__gte=first, student_id__lte=last)))
+        stored = _stored(AttendanceBitmap.objects.filter(student_id__gte=first, student_id__lte=last))
+        stale, orphans = _sync(live, stored, repair)
+        checked += len(live)
+        drifted += stale
+        orphaned += orphans
+    if repair and (drifted or orphaned):
+        bump_everything()
+    return checked, drifted, orphaned
+
+
+def rebuild_attendance_bitmaps(student_batch=500):
+    """
+    Recompute every bitmap from Attendance, one student batch (one read
+    of its rows) at a time, in one transaction. Returns (written, deleted).
+    """
+    written = deleted = 0
+    with transaction.atomic():
+        for student_ids in student_batches(student_batch=student_batch):
+            first, last = student_ids[0], student_ids[-1]
+            live = pack_bitmaps(_attendance_rows(Attendance.objects.filter(student_id__gte=first, student_id__lte=last)))
+            written += upsert_bitmaps(live)
+            keys = {(student_id, course_id, term.label) for student_id, course_id, term, _, _ in live}
+            orphans = [
+                pk for pk, *key in AttendanceBitmap.objects.filter(student_id__gte=first, student_id__lte=last)
+                .values_list('pk', 'student_id', 'course_id', 'term')
+                if tuple(key) not in keys
+            ]
+            deleted += AttendanceBitmap.objects.filter(pk__in=orphans).delete()[0]
+    bump_everything()
+    return written, deleted
+
+
+# --- Reading -----------------------------------------------------------------
+
+def bit_matrix(blobs, size):
+    """The bit strings as a uint8 matrix, one row each, zero-padded to `size` bytes."""
+    matrix = np.zeros((len(blobs), size), dtype=np.uint8)
+    for row, blob in enumerate(blobs):
+        blob = bytes(blob)
+        matrix[row, :len(blob)] = np.frombuffer(blob, dtype=np.uint8)
+    return matrix
+
+
+def popcounts(matrix):
+    """Set bits per row."""
+    return np.bitwise_count(matrix).sum(axis=1, dtype=np.int64)
+
+
+def percentages(held, present):
+    return np.round(np.where(held > 0, present * 100 / np.maximum(held, 1), 0.0), 2)
+
+
+def longest_absence_streaks(held, present):
+    """
+    Longest run of held days missed in a row, per row of two bit matrices.
+    Days without a class neither extend nor break a run: the run at each
+    day is the misses so far minus the misses up to the last day attended.
+    """
+    held_bits = np.unpackbits(held, axis=1, bitorder='little').astype(bool)
+    present_bits = np.unpackbits(present, axis=1, bitorder='little').astype(bool)
+    missed = np.cumsum(held_bits & ~present_bits, axis=1)
+    missed_at_last_attended = np.maximum.accumulate(np.where(present_bits, missed, 0), axis=1)
+    return (missed - missed_at_last_attended).max(axis=1, initial=0)
+
+
+def student_terms(student, term=None):
+    """
+    A student's attendance per course and term (or one `term`), newest
+    term first: held, present and absent days, the percentage and the
+    longest absence streak. One query.
+    """
+    bitmaps = AttendanceBitmap.objects.filter(student_id=student.pk)
+    if term is not None:
+        bitmaps = bitmaps.filter(term=term.label)
+    rows = list(
+        bitmaps.order_by('-start', 'course__subject', 'course_id')
+        .values_list('course_id', 'course__subject', 'term', 'start', 'held', 'present')
+    )
+    if not rows:
+        return []
+    course_ids, subjects, labels, starts, helds, presents = zip(*rows)
+    size = max(len(blob) for blob in helds)
+    held, present = bit_matrix(helds, size), bit_matrix(presents, size)
+    held_days, present_days = popcounts(held), popcounts(present)
+    streaks = longest_absence_streaks(held, present)
+    rates = percentages(held_days, present_days)
+    return [
+        {
+            'course': course_ids[i], 'subject': subjects[i], 'term': labels[i], 'start': starts[i],
+            'held': int(held_days[i]), 'present': int(present_days[i]),
+            'absent': int(held_days[i] - present_days[i]), 'percentage': float(rates[i]),
+            'longest_absence_streak': int(streaks[i]),
+        }
+        for i in range(len(rows))
+    ]
+
+
+def student_calendar(student, year, month):
+    """
+    One month of a student's attendance per course, read off the bitmaps
+    of the terms the month overlaps: a character per day, 'P' (present),
+    'A' (absent) or '.' (no class), and the month's counts. One query.
+    """
+    first = date(year, month, 1)
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    length = (last - first).days + 1
+    rows = (
+        AttendanceBitmap.objects
+        .filter(student_id=student.pk, term__in=[term.label for term in terms_between(first, last)])
+        .order_by('course__subject', 'course_id')
+        .values_list('course_id', 'course__subject', 'start', 'held', 'present')
+    )
+    courses = {}
+    for course_id, subject, start, held, present in rows:
+        # 0: no class, 1: absent, 2: present, per day of the month
+        codes = courses.setdefault(course_id, (subject, np.zeros(length, dtype=np.uint8)))[1]
+        held_bits = np.unpackbits(np.frombuffer(bytes(held), dtype=np.uint8), bitorder='little')
+        present_bits = np.unpackbits(np.frombuffer(bytes(present), dtype=np.uint8), bitorder='little')
+        offset = (first - start).days
+        lo, hi = max(0, -offset), min(length, len(held_bits) - offset)
+        if lo < hi:
+            np.maximum(codes[lo:hi], held_bits[offset + lo:offset + hi] + present_bits[offset + lo:offset + hi],
+                       out=codes[lo:hi])
+    symbols = np.array(list('.AP'))
+    return {
+        'month': first.strftime('%Y-%m'),
+        'courses': [
+            {
+                'course': course_id, 'subject': subject, 'days': ''.join(symbols[codes]),
+                'present': int((codes == 2).sum()), 'absent': int((codes == 1).sum()),
+            }
+            for course_id, (subject, codes) in courses.items()
+        ],
+    }
+
+
+def class_attendance(school_class_id, term):
+    """
+    Attendance of one class in one term, per course and per day, from the
+    bitmaps of its members in one query: popcounts per student, OR-ed bit
+    strings for the days each course met, and column sums for the daily
+    counts.
+    """
+    rows = list(
+        AttendanceBitmap.objects.filter(student__school_class_id=school_class_id, term=term.label)
+        .order_by('course_id', 'student_id')
+        .values_list('course_id', 'course__subject', 'student_id', 'held', 'present')
+    )
+    payload = {
+        'school_class': school_class_id, 'term': term.label, 'start': term.start,
+        'students': 0, 'percentage': 0.0, 'courses': [], 'days': [],
+    }
+    if not rows:
+        return payload
+    course_ids, subjects, student_ids, helds, presents = zip(*rows)
+    held, present = bit_matrix(helds, term.size), bit_matrix(presents, term.size)
+    held_days, present_days = popcounts(held), popcounts(present)
+    streaks = longest_absence_streaks(held, present)
+    at_risk = percentages(held_days, present_days) < AT_RISK_PERCENTAGE
+
+    # Rows are ordered by course: reduce each course's run of rows at once
+    course_ids = np.array(course_ids)
+    firsts = np.flatnonzero(np.r_[True, course_ids[1:] != course_ids[:-1]])
+    columns = zip(
+        firsts,
+        np.diff(np.r_[firsts, len(rows)]),
+        popcounts(np.bitwise_or.reduceat(held, firsts, axis=0)),
+        np.add.reduceat(held_days, firsts),
+        np.add.reduceat(present_days, firsts),
+        np.add.reduceat(at_risk, firsts),
+        np.maximum.reduceat(streaks, firsts),
+    )
+    for first, students, sessions, course_held, course_present, course_at_risk, streak in columns:
+        payload['courses'].append({
+            'course': int(course_ids[first]), 'subject': subjects[first], 'students': int(students),
+            'sessions': int(sessions), 'held': int(course_held), 'present': int(course_present),
+            'percentage': float(percentages(course_held, course_present)),
+            'at_risk': int(course_at_risk), 'longest_absence_streak': int(streak),
+        })
+
+    daily_held = np.unpackbits(held, axis=1, bitorder='little')[:, :term.days].sum(axis=0)
+    daily_present = np.unpackbits(present, axis=1, bitorder='little')[:, :term.days].sum(axis=0)
+    payload['days'] = [
+        {'date': term.start + timedelta(days=int(bit)), 'held': int(daily_held[bit]), 'present': int(daily_present[bit])}
+        for bit in np.flatnonzero(daily_held)
+    ]
+    payload['students'] = len(set(student_ids))
+    payload['percentage'] = float(percentages(held_days.sum(), present_days.sum()))
+    return payload
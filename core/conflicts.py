@@ -0,0 +1,106 @@
+"""
+Timetable conflict detection: overlapping slots for the same teacher, the
+same room or the same class on one day.
+
+Entries are bucketed per (dimension, day, value), e.g. ('teacher', 'Mon', 7).
+A single save asks the database for just the entries of its three buckets
+that overlap it (start before its end, end after its start), a range scan
+of the composite (day, dimension, start_time) indexes; the whole timetable
+is validated in one sweep-line pass ordered by start time.
+"""
+import heapq
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .models import Timetable
+
+# Dimension name -> Timetable field; entries with an empty value are not checked.
+DIMENSIONS = {
+    'teacher': 'teacher_id',
+    'room': 'room',
+    'school_class': 'school_class_id',
+}
+
+ENTRY_FIELDS = ('id', 'day', 'start_time', 'end_time', 'subject', *DIMENSIONS.values())
+
+
+def conflict(dimension, value, day, entry, other):
+    """A conflict as a plain dict, ready to serialize as a structured error."""
+    found = {
+        'dimension': dimension,
+        'value': value,
+        'day': day,
+        'entry': entry['id'],
+        'conflicts_with': other['id'],
+        'subject': other['subject'],
+        'start_time': other['start_time'],
+        'end_time': other['end_time'],
+    }
+    if entry['id'] is None:
+        # A proposed entry that is not saved yet
+        del found['entry']
+    return found
+
+
+def find_conflicts(entry):
+    """
+    Conflicts of one proposed entry (a dict with ENTRY_FIELDS; `id` is None
+    for a new one) with the stored timetable. One query, which returns only
+    the overlapping entries of its buckets.
+    """
+    buckets = Q()
+    for field in DIMENSIONS.values():
+        if entry.get(field) not in (None, ''):
+            buckets |= Q(**{field: entry[field]})
+    if not buckets:
+        return []
+    overlapping = (
+        Timetable.objects.filter(
+            buckets, day=entry['day'], start_time__lt=entry['end_time'], end_time__gt=entry['start_time'],
+        )
+        .order_by('start_time', 'id').values(*ENTRY_FIELDS)
+    )
+    if entry['id'] is not None:
+        overlapping = overlapping.exclude(pk=entry['id'])
+
+    overlapping = list(overlapping)
+    conflicts = []
+    for dimension, field in DIMENSIONS.items():
+        value = entry.get(field)
+        if value in (None, ''):
+            continue
+        for other in overlapping:
+            if other[field] == value:
+                conflicts.append(conflict(dimension, value, entry['day'], entry, other))
+    return conflicts
+
+
+def sweep_conflicts(entries):
+    """
+    Every overlapping pair among `entries` (dicts with ENTRY_FIELDS, in
+    (day, start_time) order), found in a single sweep: each bucket keeps a
+    heap of its active entries keyed by end time.
+    """
+    active = defaultdict(list)
+    conflicts = []
+    for entry in entries:
+        for dimension, field in DIMENSIONS.items():
+            value = entry[field]
+            if value in (None, ''):
+                continue
+            heap = active[dimension, entry['day'], value]
+            while heap and heap[0][0] <= entry['start_time']:
+                heapq.heappop(heap)
+            for _, _, other in heap:
+                conflicts.append(conflict(dimension, value, entry['day'], entry, other))
+            heapq.heappush(heap, (entry['end_time'], entry['id'], entry))
+    return conflicts
+
+
+def validate_timetable(queryset=None, chunk_size=2000):
+    """All conflicts in the stored timetable, from one ordered scan."""
+    if queryset is None:
+        queryset = Timetable.objects.all()
+    entries = queryset.order_by('day', 'start_time', 'id').values(*ENTRY_FIELDS).iterator(chunk_size=chunk_size)
+    return sweep_conflicts(entries)
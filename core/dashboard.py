@@ -0,0 +1,144 @@
+"""
+Everything the app shows on launch, built from one small, fixed set of
+queries (at most one per section) for /api/dashboard/.
+
+The async builders (ASYNC_SECTIONS, for /api/async/dashboard/) build the
+same payloads through the async ORM, so the event loop keeps serving other
+requests while one waits on the database. They are awaited one after the
+other: Django runs a request's ORM calls in turn on that request's single
+connection, so starting them together would not overlap any queries.
+"""
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import AttendanceSummary, Fee, Quiz, Result
+from .proceedings import aclass_proceedings, class_proceedings
+from .serializers import (
+    AttendanceSummarySerializer, FeeSerializer, QuizSerializer, ResultSerializer,
+    StudentSerializer,
+)
+from .timetables import aclass_timetable, class_timetable
+
+# Timetable.DAY_CHOICES codes, indexed by date.weekday()
+WEEKDAY_CODES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def profile_section(student):
+    # request.student already carries school_class: no query.
+    return StudentSerializer(student).data
+
+
+def fees_section(student):
+    return FeeSerializer(Fee.objects.filter(student_id=student.pk), many=True).data
+
+
+def results_section(student):
+    return ResultSerializer(Result.objects.filter(student_id=student.pk), many=True).data
+
+
+def quizzes_section(student):
+    return QuizSerializer(Quiz.objects.filter(student_id=student.pk), many=True).data
+
+
+def proceedings_section(student):
+    return class_proceedings(student)
+
+
+def attendance_summary_section(student):
+    summaries = (
+        AttendanceSummary.objects.filter(student_id=student.pk)
+        .select_related('course').order_by('-percentage')
+    )
+    return AttendanceSummarySerializer(summaries, many=True).data
+
+
+def timetable_section(student):
+    if student.school_class_id is None:
+        return []
+    today = WEEKDAY_CODES[timezone.localdate().weekday()]
+    return [entry for entry in class_timetable(student.school_class_id) if entry['day'] == today]
+
+
+SECTIONS = {
+    'profile': profile_section,
+    'fees': fees_section,
+    'results': results_section,
+    'quizzes': quizzes_section,
+    'proceedings': proceedings_section,
+    'attendance_summary': attendance_summary_section,
+    'timetable': timetable_section,
+}
+
+
+def requested_sections(query_params):
+    """Section names from ?include=fees,results (or ?fields=...), or None for all of them."""
+    requested = query_params.get('include') or query_params.get('fields')
+    if not requested:
+        return None
+    sections = {name.strip() for name in requested.split(',') if name.strip()}
+    unknown = sections - SECTIONS.keys()
+    if unknown:
+        raise ValidationError({'include': [f"Unknown section(s): {', '.join(sorted(unknown))}."]})
+    return sections
+
+
+def build_dashboard(student, sections=None):
+    """Build the requested sections (all of them by default), in SECTIONS order."""
+    return {
+        name: builder(student)
+        for name, builder in SECTIONS.items()
+        if sections is None or name in sections
+    }
+
+
+# --- Async builders: the same payloads through the async ORM ---
+
+async def aprofile_section(student):
+    return profile_section(student)
+
+
+async def afees_section(student):
+    return FeeSerializer([fee async for fee in Fee.objects.filter(student_id=student.pk)], many=True).data
+
+
+async def aresults_section(student):
+    return ResultSerializer([result async for result in Result.objects.filter(student_id=student.pk)], many=True).data
+
+
+async def aquizzes_section(student):
+    return QuizSerializer([quiz async for quiz in Quiz.objects.filter(student_id=student.pk)], many=True).data
+
+
+async def aattendance_summary_section(student):
+    summaries = (
+        AttendanceSummary.objects.filter(student_id=student.pk)
+        .select_related('course').order_by('-percentage')
+    )
+    return AttendanceSummarySerializer([summary async for summary in summaries], many=True).data
+
+
+async def atimetable_section(student):
+    if student.school_class_id is None:
+        return []
+    today = WEEKDAY_CODES[timezone.localdate().weekday()]
+    return [entry for entry in await aclass_timetable(student.school_class_id) if entry['day'] == today]
+
+
+ASYNC_SECTIONS = {
+    'profile': aprofile_section,
+    'fees': afees_section,
+    'results': aresults_section,
+    'quizzes': aquizzes_section,
+    'proceedings': aclass_proceedings,
+    'attendance_summary': aattendance_summary_section,
+    'timetable': atimetable_section,
+}
+
+
+async def abuild_dashboard(student, sections=None):
+    """build_dashboard() through the async builders, in SECTIONS order."""
+    return {
+        name: await builder(student)
+        for name, builder in ASYNC_SECTIONS.items()
+        if sections is None or name in sections
+    }
@@ -0,0 +1,143 @@
+"""
+Whole-school exports of Attendance, Result and Fee as CSV or JSONL.
+
+Rows come straight from a server-side cursor as `values_list` tuples (no
+model instances, no serializers) and are encoded into small buffers that
+are handed on as soon as they fill, optionally through an incremental gzip
+compressor. Memory use is therefore constant whatever the table size, both
+for StreamingHttpResponse (ExportView) and the export_data command. Under
+ASGI the response must be given an async iterator (Export.astream()):
+Django collects a sync one into a list before sending any of it. Behind a
+transaction pooler (DISABLE_SERVER_SIDE_CURSORS) rows are read in keyset
+pages by primary key instead.
+"""
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.utils import timezone
+
+from .models import Attendance, Fee, Result
+
+EXPORT_CHUNK_SIZE = 5000
+FORMATS = ('csv', 'jsonl')
+
+# Encoded output is handed on in pieces of about this size.
+FLUSH_BYTES = 64 * 1024
+
+# Export name -> (model, values_list columns). Columns spanning a relation
+# ('student__email') are written as 'student_email'.
+EXPORTS = {
+    'attendance': (Attendance, (
+        'id', 'student_id', 'student__email', 'course_id', 'course__name', 'date', 'status', 'updated_at',
+    )),
+    'results': (Result, (
+        'id', 'student_id', 'student__email', 'subject', 'score', 'grade', 'updated_at',
+    )),
+    'fees': (Fee, (
+        'id', 'student_id', 'student__email', 'term', 'amount', 'amount_paid', 'paid', 'updated_at',
+    )),
+}
+
+
+def gzip_stream(chunks, level=6):
+    """Compress an iterable of bytes into a gzip member, piece by piece."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class Export:
+    """
+    An iterable of bytes for one export. `rows` counts the rows written so
+    far, for reporting once the stream has been consumed.
+    """
+
+    def __init__(self, kind, fmt='csv', compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+        if kind not in EXPORTS:
+            raise ValueError(f"Unknown export {kind!r}; choose from {', '.join(EXPORTS)}.")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt!r}; choose from {', '.join(FORMATS)}.")
+        self.kind = kind
+        self.model, self.columns = EXPORTS[kind]
+        self.headers = [column.replace('__', '_') for column in self.columns]
+        self.format = fmt
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.rows = 0
+
+    @property
+    def filename(self):
+        suffix = '.gz' if self.compress else ''
+        return f'{self.kind}-{timezone.localdate():%Y-%m-%d}.{self.format}{suffix}'
+
+    @property
+    def content_type(self):
+        if self.compress:
+            return 'application/gzip'
+        return 'text/csv; charset=utf-8' if self.format == 'csv' else 'application/x-ndjson; charset=utf-8'
+
+    def __iter__(self):
+        chunks = self._encoded()
+        return gzip_stream(chunks) if self.compress else chunks
+
+    async def astream(self):
+        """
+        The same bytes as iterating the export, for ASGI responses. Each piece
+        is produced on the request's thread-sensitive worker thread, so the
+        server-side cursor stays on the one connection that opened it.
+        """
+        chunks = iter(self)
+        done = object()
+        while (chunk := await sync_to_async(next, thread_sensitive=True)(chunks, done)) is not done:
+            yield chunk
+
+    def _values(self):
+        queryset = self.model.objects.order_by('pk')
+        if connections[queryset.db].settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+            return self._pages(queryset)
+        # Primary-key order walks the table once; iterator() streams it
+        # through a server-side cursor where the database has them.
+        return queryset.values_list(*self.columns).iterator(chunk_size=self.chunk_size)
+
+    def _pages(self, queryset):
+        # Without server-side cursors iterator() would fetch the whole table
+        # in one go; a page per query keeps memory flat.
+        last_pk = None
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            rows = list(page.values_list('pk', *self.columns)[:self.chunk_size])
+            if not rows:
+                return
+            last_pk = rows[-1][0]
+            for row in rows:
+                yield row[1:]
+
+    def _encoded(self):
+        buffer = io.StringIO()
+        if self.format == 'csv':
+            writer = csv.writer(buffer)
+            writer.writerow(self.headers)
+            write = writer.writerow
+        else:
+            encoder = DjangoJSONEncoder()
+
+            def write(row):
+                buffer.write(encoder.encode(dict(zip(self.headers, row))))
+                buffer.write('\n')
+
+        for row in self._values():
+            write(row)
+            self.rows += 1
+            if buffer.tell() >= FLUSH_BYTES:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode()
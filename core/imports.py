@@ -0,0 +1,451 @@
+"""
+Streaming bulk import of students, attendance, results, quizzes and fees
+from CSV or JSONL files.
+
+The source is read a chunk at a time, so memory stays bounded whatever the
+file size. Foreign keys resolve through lookup maps built once per import,
+each chunk is validated as a whole (duplicate checks cost one query per
+chunk, never one per row), and good rows are written with a single bulk
+INSERT/upsert in a transaction that also advances the ImportBatch checkpoint.
+Bad rows go to the batch's reject file instead of aborting the import.
+"""
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .authentication import invalidate_users
+from .mixins import forget_students
+from .ledger import deferred_ledger, refresh_balances
+from .models import (
+    Attendance, ClassProceeding, Course, Fee, FeePayment, ImportBatch, Quiz, Result, SchoolClass, Student,
+)
+from .proceedings import NO_SECTION
+from .versions import bump_model
+
+IMPORT_CHUNK_SIZE = 2000
+JSONL_EXTENSIONS = ('.jsonl', '.ndjson', '.json')
+
+# Names shared by several rows cannot be resolved by name.
+AMBIGUOUS = object()
+
+_BOOLEANS = {
+    'true': True, 't': True, 'yes': True, 'y': True, '1': True,
+    'false': False, 'f': False, 'no': False, 'n': False, '0': False,
+}
+
+
+def is_jsonl(name):
+    return os.path.splitext(name)[1].lower() in JSONL_EXTENSIONS
+
+
+def read_records(fileobj, name):
+    """
+    Yield (line_number, record, error) for each record of a binary CSV or
+    JSONL file, reading it incrementally. Unparseable JSONL lines come
+    through with an error instead of stopping the import.
+    """
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    if not is_jsonl(name):
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_number, {}, f'Invalid JSON: {exc}'
+            continue
+        if not isinstance(record, dict):
+            yield line_number, {}, 'Expected a JSON object.'
+            continue
+        yield line_number, record, None
+
+
+def lookup_map(queryset, key_field):
+    """{key: pk} over `queryset`, built with one query; duplicated keys map to AMBIGUOUS."""
+    mapping = {}
+    for key, pk in queryset.values_list(key_field, 'pk').iterator():
+        mapping[key] = AMBIGUOUS if key in mapping else pk
+    return mapping
+
+
+class RowError(Exception):
+    """A record that cannot be imported; the message goes to the reject file."""
+
+
+# --- Importers -------------------------------------------------------------
+
+class Importer:
+    """
+    Turns records into unsaved model instances and writes them in bulk.
+
+    `columns` maps input columns to model fields; subclasses resolve the
+    foreign-key columns listed in `references` in convert() and add
+    chunk-wide checks in check_chunk().
+    """
+    model = None
+    columns = {}
+    references = ()
+
+    def clean(self, record, column):
+        """One column through its model field's validation (types, lengths, choices)."""
+        field = self.model._meta.get_field(self.columns[column])
+        value = record.get(column)
+        if isinstance(value, str):
+            value = value.strip()
+        if value in (None, '') and field.has_default():
+            return field.get_default()
+        if isinstance(field, models.BooleanField) and isinstance(value, str):
+            value = _BOOLEANS.get(value.lower(), value)
+        return field.clean(value, None)
+
+    def convert(self, record):
+        errors = []
+        values = {}
+        for column, field_name in self.columns.items():
+            try:
+                values[field_name] = self.clean(record, column)
+            except ValidationError as exc:
+                errors.append(f"{column}: {' '.join(exc.messages)}")
+        if errors:
+            raise RowError('; '.join(errors))
+        return self.model(**values)
+
+    def resolve(self, mapping, record, column, required=True):
+        value = record.get(column)
+        value = value.strip() if isinstance(value, str) else value
+        if value in (None, ''):
+            if required:
+                raise RowError(f'{column}: This field is required.')
+            return None
+        pk = mapping.get(value)
+        if pk is None:
+            raise RowError(f'{column}: No match for {value!r}.')
+        if pk is AMBIGUOUS:
+            raise RowError(f'{column}: {value!r} matches more than one row.')
+        return pk
+
+    def validate(self, chunk):
+        """Split a chunk of (line, record, error) into instances to write and (line, record, error) rejects."""
+        accepted = []
+        rejects = []
+        for line_number, record, error in chunk:
+            if error is None:
+                try:
+                    accepted.append((line_number, record, self.convert(record)))
+                    continue
+                except RowError as exc:
+                    error = str(exc)
+            rejects.append((line_number, record, error))
+        accepted, duplicates = self.check_chunk(accepted)
+        return [instance for _, _, instance in accepted], rejects + duplicates
+
+    def check_chunk(self, accepted):
+        return accepted, []
+
+    def write(self, instances):
+        self.model.objects.bulk_create(instances, batch_size=len(instances))
+
+
+class StudentImporter(Importer):
+    """Creates students, or updates the ones whose email already exists."""
+    model = Student
+    columns = {'first_name': 'first_name', 'last_name': 'last_name', 'email': 'email', 'grade': 'grade'}
+    references = ('school_class',)
+
+    def __init__(self):
+        self.classes = lookup_map(SchoolClass.objects.all(), 'name')
+        self.existing = {
+            email: (pk, user_id)
+            for email, pk, user_id in Student.objects.values_list('email', 'pk', 'user_id').iterator()
+        }
+
+    def convert(self, record):
+        school_class_id = self.resolve(self.classes, record, 'school_class', required=False)
+        student = super().convert(record)
+        student.school_class_id = school_class_id
+        # A file without the column leaves existing students' classes alone;
+        # an empty cell in it clears the class.
+        student._sets_school_class = 'school_class' in record
+        return student
+
+    def check_chunk(self, accepted):
+        # One upsert statement cannot touch a row twice. Later rows win, as
+        # they do across chunks.
+        last_line = {student.email: line_number for line_number, _, student in accepted}
+        kept, duplicates = [], []
+        for line_number, record, student in accepted:
+            if last_line[student.email] != line_number:
+                duplicates.append((line_number, record, f'email: Superseded by line {last_line[student.email]}.'))
+                continue
+            kept.append((line_number, record, student))
+        return kept, duplicates
+
+    def write(self, students):
+        # One upsert for a CSV chunk; JSONL records may differ in their keys.
+        for sets_school_class in (True, False):
+            group = [student for student in students if student._sets_school_class == sets_school_class]
+            if not group:
+                continue
+            update_fields = ['first_name', 'last_name', 'grade']
+            if sets_school_class:
+                update_fields.append('school_class')
+            Student.objects.bulk_create(
+                group,
+                batch_size=len(group),
+                update_conflicts=True,
+                unique_fields=['email'],
+                update_fields=update_fields,
+            )
+        updated = [self.existing[s.email] for s in students if s.email in self.existing]
+        if not updated:
+            return
+        # Upserts skip save(), so do what the Student signals would have done.
+        student_ids = [pk for pk, _ in updated]
+        user_ids = [user_id for _, user_id in updated if user_id]
+        forget_students(user_ids)
+        invalidate_users(user_ids)
+        bump_model(Student, student_ids)
+        ClassProceeding.objects.filter(student_id__in=student_ids).update(section=Coalesce(
+            Subquery(Student.objects.filter(pk=OuterRef('student_id')).values('school_class__name')[:1]),
+            Value(NO_SECTION),
+        ))
+        # Fee balances follow a student into their new class.
+        refresh_balances(student_ids)
+
+
+class StudentRowImporter(Importer):
+    """Rows belonging to one student, referenced by email in the `student` column."""
+    references = ('student',)
+
+    def __init__(self):
+        self.students = lookup_map(Student.objects.all(), 'email')
+
+    def convert(self, record):
+        student_id = self.resolve(self.students, record, 'student')
+        instance = super().convert(record)
+        instance.student_id = student_id
+        return instance
+
+
+class AttendanceImporter(StudentRowImporter):
+    """Historical attendance; rows already recorded (same student, course and date) are rejected."""
+    model = Attendance
+    columns = {'date': 'date', 'status': 'status'}
+    references = ('student', 'course')
+
+    def __init__(self):
+        super().__init__()
+        self.courses = lookup_map(Course.objects.all(), 'name')
+
+    def convert(self, record):
+        course_id = self.resolve(self.courses, record, 'course')
+        attendance = super().convert(record)
+        attendance.course_id = course_id
+        return attendance
+
+    def check_chunk(self, accepted):
+        if not accepted:
+            return accepted, []
+        dates = [attendance.date for _, _, attendance in accepted]
+        recorded = set(
+            Attendance.objects.filter(
+                student_id__in={attendance.student_id for _, _, attendance in accepted},
+                date__gte=min(dates), date__lte=max(dates),
+            ).values_list('student_id', 'course_id', 'date')
+        )
+        kept, duplicates = [], []
+        for line_number, record, attendance in accepted:
+            key = (attendance.student_id, attendance.course_id, attendance.date)
+            if key in recorded:
+                duplicates.append((line_number, record, 'Attendance already recorded for this student, course and date.'))
+                continue
+            recorded.add(key)
+            kept.append((line_number, record, attendance))
+        return kept, duplicates
+
+
+class ResultImporter(StudentRowImporter):
+    model = Result
+    columns = {'subject': 'subject', 'score': 'score', 'grade': 'grade'}
+
+
+class QuizImporter(StudentRowImporter):
+    model = Quiz
+    columns = {'subject': 'subject', 'date': 'date', 'score': 'score'}
+
+
+class FeeImporter(StudentRowImporter):
+    """Fees, with `term` optional. A row marked paid also records a payment of the full amount."""
+    model = Fee
+    columns = {'amount': 'amount', 'paid': 'paid', 'term': 'term'}
+
+    def check_chunk(self, accepted):
+        termed = [fee for _, _, fee in accepted if fee.term]
+        if not termed:
+            return accepted, []
+        billed = set(
+            Fee.objects.filter(
+                student_id__in={fee.student_id for fee in termed}, term__in={fee.term for fee in termed},
+            ).values_list('student_id', 'term')
+        )
+        kept, duplicates = [], []
+        for line_number, record, fee in accepted:
+            if fee.term:
+                if (fee.student_id, fee.term) in billed:
+                    duplicates.append((line_number, record, 'Fee already issued to this student for this term.'))
+                    continue
+                billed.add((fee.student_id, fee.term))
+            kept.append((line_number, record, fee))
+        return kept, duplicates
+
+    def write(self, fees):
+        # One balance refresh for the chunk's fees and payments together.
+        with deferred_ledger():
+            Fee.objects.bulk_create(fees, batch_size=len(fees))
+            FeePayment.objects.bulk_create([
+                FeePayment(fee=fee, student_id=fee.student_id, amount=fee.amount, reference='Imported as paid')
+                for fee in fees if fee.paid
+            ])
+
+
+IMPORTERS = {
+    'students': StudentImporter,
+    'attendance': AttendanceImporter,
+    'results': ResultImporter,
+    'quizzes': QuizImporter,
+    'fees': FeeImporter,
+}
+
+
+# --- Reject file -----------------------------------------------------------
+
+class RejectWriter:
+    """
+    Appends rejected records to the batch's reject file, in the source's
+    format with `line` and `error` added. The importers ignore those two
+    columns, so a corrected reject file can be imported as it is.
+
+    Rejects are appended when the chunk's transaction commits: a chunk that
+    rolls back is read again on resume, and must not leave its rejects in
+    the file twice.
+    """
+
+    def __init__(self, batch, importer):
+        self.batch = batch
+        self.jsonl = is_jsonl(batch.source.name)
+        self.fieldnames = ['line', 'error', *importer.references, *importer.columns]
+        self.handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.handle:
+            self.handle.close()
+            self.handle = None
+
+    def _name(self, batch):
+        if not batch.rejects:
+            stem = os.path.splitext(os.path.basename(batch.source.name))[0]
+            suffix = '.jsonl' if self.jsonl else '.csv'
+            batch.rejects.name = f'imports/rejects/{batch.pk}-{stem}-rejects{suffix}'
+        return batch.rejects.name
+
+    def _open(self, name):
+        path = self.batch.rejects.storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.handle = open(path, 'a', encoding='utf-8', newline='')
+        if not self.jsonl:
+            self.csv = csv.DictWriter(self.handle, fieldnames=self.fieldnames, extrasaction='ignore')
+            if new_file:
+                self.csv.writeheader()
+
+    def write(self, rejects):
+        """Name the reject file on the batch now; append the rows once the current transaction commits."""
+        if not rejects:
+            return
+        name = self._name(self.batch)
+        rows = [{**record, 'line': line_number, 'error': error} for line_number, record, error in rejects]
+        transaction.on_commit(lambda: self._append(name, rows))
+
+    def _append(self, name, rows):
+        if self.handle is None:
+            self._open(name)
+        for row in rows:
+            if self.jsonl:
+                self.handle.write(json.dumps(row, default=str) + '\n')
+            else:
+                self.csv.writerow(row)
+        self.handle.flush()
+
+
+# --- Running an import -----------------------------------------------------
+
+def create_batch(kind, path):
+    """An ImportBatch for a local file; the file is copied into storage in chunks."""
+    batch = ImportBatch(kind=kind)
+    with open(path, 'rb') as source:
+        batch.source.save(os.path.basename(path), File(source), save=False)
+    batch.save()
+    return batch
+
+
+def run_import(batch, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Import `batch` from its checkpoint onwards.
+
+    Each chunk is written and checkpointed in one transaction, so a failure
+    loses at most the chunk in flight; running the batch again resumes after
+    the last committed one. `progress(batch, rows_per_second)` is called after
+    every chunk. Returns the rows-per-second rate of this run.
+    """
+    importer = IMPORTERS[batch.kind]()
+    batch.status = 'running'
+    batch.error = ''
+    batch.save(update_fields=['status', 'error'])
+
+    start = time.perf_counter()
+    processed = 0
+    try:
+        with batch.source.open('rb') as source, RejectWriter(batch, importer) as rejects:
+            records = islice(read_records(source, batch.source.name), batch.rows_done, None)
+            while chunk := list(islice(records, chunk_size)):
+                instances, bad = importer.validate(chunk)
+                with transaction.atomic():
+                    if instances:
+                        importer.write(instances)
+                    rejects.write(bad)
+                    batch.rows_done += len(chunk)
+                    batch.imported += len(instances)
+                    batch.rejected += len(bad)
+                    batch.save(update_fields=['rows_done', 'imported', 'rejected', 'rejects'])
+                processed += len(chunk)
+                if progress:
+                    progress(batch, processed / (time.perf_counter() - start))
+    except Exception as exc:
+        batch.refresh_from_db(fields=['rows_done', 'imported', 'rejected', 'rejects'])
+        batch.status = 'failed'
+        batch.error = f'{type(exc).__name__}: {exc}'
+        batch.save(update_fields=['status', 'error'])
+        raise
+
+    batch.status = 'done'
+    batch.finished_at = timezone.now()
+    batch.save(update_fields=['status', 'finished_at'])
+    elapsed = time.perf_counter() - start
+    return processed / elapsed if elapsed else 0.0
@@ -0,0 +1,456 @@
+"""
+Per-route request instrumentation: SQL query count and time, view time,
+serialization time and response size, N+1 suspects, an opt-in
+Server-Timing header and a Prometheus text exposition (/api/metrics/).
+
+InstrumentationMiddleware keeps the current request's figures in a
+context variable. Queries are seen through an execute wrapper installed on
+every database connection, which records only while a request's context
+is active; that also covers async views, whose ORM calls run on other
+threads with their own connections but a copy of the request's context.
+Serializers (InstrumentedSerializerMixin) and the JSON renderer
+(TimedJSONRenderer) add their time to the serialization figure. A request
+whose same SQL statement shape runs N_PLUS_ONE_THRESHOLD times or more is
+an N+1 suspect: counted, and logged once per route and statement.
+
+Each process aggregates into plain counters under a lock. When
+SHARED_CACHE names a cache all workers share (not locmem), each process
+copies them every FLUSH_INTERVAL seconds into a slot of its own, claimed
+with an atomic cache.add(), so a scrape reaching any one worker reports
+the sum over all live workers; otherwise a scrape reports only the
+worker it reaches. The per-request cost is a few perf_counter() calls
+plus one dict update per query.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.renderers import JSONRenderer
+
+from .cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Server-Timing header: False, 'staff' (staff users only) or True (every response).
+    'SERVER_TIMING': False,
+    # Runs of one statement shape within a request that make it an N+1 suspect.
+    'N_PLUS_ONE_THRESHOLD': 5,
+    # A CACHES alias that aggregates all worker processes, or None for this process only.
+    # A process-local backend (locmem) counts as None.
+    'SHARED_CACHE': 'default',
+    'FLUSH_INTERVAL': 10,
+    # Slots in the shared cache, one per live worker process.
+    'MAX_PROCESSES': 64,
+}
+
+# Request duration histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# "IN (%s, %s, %s)" and "IN (%s, %s)" are one statement shape.
+_PLACEHOLDER_LIST = re.compile(r'%s(?:, %s)+')
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'INSTRUMENTATION', {})}
+
+
+class RequestStats:
+    """Figures for one request."""
+
+    __slots__ = ('queries', 'db_seconds', 'view_seconds', 'serialize_seconds',
+                 'serialize_depth', 'shapes', 'executed', 'duplicates', 'view_started')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.view_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.serialize_depth = 0
+        self.shapes = Counter()
+        self.executed = set()
+        self.duplicates = 0
+        self.view_started = None
+
+    def suspects(self, threshold):
+        """Statement shapes run `threshold` times or more, with their counts."""
+        return [(sql, count) for sql, count in self.shapes.items() if count >= threshold]
+
+
+_current = ContextVar('request_stats', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_seconds += time.perf_counter() - start
+        stats.queries += 1
+        stats.shapes[_PLACEHOLDER_LIST.sub('%s...', sql) if '%s, %s' in sql else sql] += 1
+        params = None if many else _hashable(params)
+        if params is not None:
+            # Exact repeats (same statement, same parameters) are pure waste.
+            if (sql, params) in stats.executed:
+                stats.duplicates += 1
+            else:
+                stats.executed.add((sql, params))
+
+
+def _install_recorder(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _hashable(params):
+    try:
+        key = tuple(params) if params is not None else ()
+        hash(key)
+        return key
+    except TypeError:
+        return None
+
+
+class _Timed:
+    """Adds the time spent in the outermost block to the request's serialization time."""
+
+    def __enter__(self):
+        self.stats = _current.get()
+        if self.stats is not None:
+            self.stats.serialize_depth += 1
+            if self.stats.serialize_depth == 1:
+                self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if self.stats is not None:
+            self.stats.serialize_depth -= 1
+            if self.stats.serialize_depth == 0:
+                self.stats.serialize_seconds += time.perf_counter() - self.start
+
+
+class InstrumentedSerializerMixin:
+    """Counts to_representation() time as serialization time; nested serializers are not counted twice."""
+
+    def to_representation(self, instance):
+        with _Timed():
+            return super().to_representation(instance)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer whose encoding time counts as serialization time."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with _Timed():
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+# --- Aggregation -----------------------------------------------------------
+
+class RouteStats:
+    """Cumulative figures for one (method, route) in this process."""
+
+    FIELDS = ('requests', 'seconds', 'queries', 'db_seconds', 'view_seconds', 'serialize_seconds',
+              'response_bytes', 'duplicate_queries', 'n_plus_one_requests')
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+        self.statuses = Counter()
+        self.buckets = [0] * len(BUCKETS)
+
+    def as_dict(self):
+        return {
+            **{field: getattr(self, field) for field in self.FIELDS},
+            'statuses': dict(self.statuses),
+            'buckets': list(self.buckets),
+        }
+
+
+class Registry:
+    """This process's RouteStats, and its copy in the shared cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.warned = set()
+        self.last_flush = 0.0
+        self.key = f'instrumentation:{os.getpid()}'
+        self.slot = None
+
+    def record(self, method, route, status, seconds, stats, response_bytes, suspects):
+        with self._lock:
+            entry = self.routes.get((method, route))
+            if entry is None:
+                entry = self.routes[method, route] = RouteStats()
+            entry.requests += 1
+            entry.seconds += seconds
+            entry.queries += stats.queries
+            entry.db_seconds += stats.db_seconds
+            entry.view_seconds += stats.view_seconds
+            entry.serialize_seconds += stats.serialize_seconds
+            entry.response_bytes += response_bytes
+            entry.duplicate_queries += stats.duplicates
+            entry.n_plus_one_requests += bool(suspects)
+            entry.statuses[f'{status // 100}xx'] += 1
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry.buckets[index] += 1
+                    break
+            new_suspects = [(sql, count) for sql, count in suspects if (route, sql) not in self.warned]
+            self.warned.update((route, sql) for sql, _ in new_suspects)
+        for sql, count in new_suspects:
+            logger.warning('N+1 suspect on %s %s: %d runs of %s', method, route, count, sql[:300])
+
+    def snapshot(self):
+        with self._lock:
+            return {f'{method} {route}': entry.as_dict() for (method, route), entry in self.routes.items()}
+
+    def flush_due(self, config):
+        """The shared cache (and the interval restarted) when it is time to copy to it, else None."""
+        cache = shared_cache(config['SHARED_CACHE'])
+        now = time.monotonic()
+        if cache is None or now - self.last_flush < config['FLUSH_INTERVAL']:
+            return None
+        self.last_flush = now
+        return cache
+
+    def maybe_flush(self, config):
+        cache = self.flush_due(config)
+        if cache is not None:
+            self.flush(cache, config)
+
+    def flush(self, cache, config):
+        """
+        Copy this process's figures to its slot, claiming a free one first if
+        it has none or lost it. The slot expires a few intervals after its
+        process stops flushing, which frees it for another.
+        """
+        timeout = config['FLUSH_INTERVAL'] * 6
+        entry = {'process': self.key, 'routes': self.snapshot()}
+        # Extended first, the slot cannot expire and be claimed by another
+        # process between the owner check and the write.
+        if self.slot is not None and cache.touch(self.slot, timeout):
+            current = cache.get(self.slot)
+            if current is not None and current['process'] == self.key:
+                cache.set(self.slot, entry, timeout)
+                return
+        self.slot = None
+        for key in _slots(config):
+            if cache.add(key, entry, timeout):
+                self.slot = key
+                return
+        logger.warning('No free instrumentation slot for %s; raise MAX_PROCESSES', self.key)
+
+    def merged(self):
+        """Figures of all live processes (this one read fresh), summed per route."""
+        config = _config()
+        snapshots = [self.snapshot()]
+        cache = shared_cache(config['SHARED_CACHE'])
+        if cache is not None:
+            self.flush(cache, config)
+            snapshots.extend(
+                entry['routes'] for entry in cache.get_many(_slots(config)).values()
+                if entry['process'] != self.key
+            )
+
+        merged = {}
+        for snapshot in snapshots:
+            for route, figures in snapshot.items():
+                total = merged.setdefault(route, RouteStats().as_dict())
+                for field in RouteStats.FIELDS:
+                    total[field] += figures[field]
+                for status, count in figures['statuses'].items():
+                    total['statuses'][status] = total['statuses'].get(status, 0) + count
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], figures['buckets'])]
+        return merged
+
+
+def _slots(config):
+    return [f'instrumentation:slot:{index}' for index in range(config['MAX_PROCESSES'])]
+
+
+registry = Registry()
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None and match.route else '<unresolved>'
+
+
+class InstrumentationMiddleware:
+    """
+    Measures each request; placed first in MIDDLEWARE so its total covers the
+    others. Runs in the handler's mode, so an ASGI stack stays fully async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django awaits coroutine hooks directly instead of hopping to a thread.
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+        connection_created.connect(_install_recorder, dispatch_uid='instrumentation')
+        for alias in connections:
+            _install_recorder(connections[alias])
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        config = _config()
+        self.record(request, response, stats, start, config)
+        registry.maybe_flush(config)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        config = _config()
+        self.record(request, response, stats, start, config)
+        cache = registry.flush_due(config)
+        if cache is not None:
+            await sync_to_async(registry.flush)(cache, config)
+        return response
+
+    def record(self, request, response, stats, start, config):
+        total = time.perf_counter() - start
+        if stats.view_started is not None and not stats.view_seconds:
+            # Not a template response: the view ended about when rendering did.
+            stats.view_seconds = time.perf_counter() - stats.view_started
+
+        suspects = stats.suspects(config['N_PLUS_ONE_THRESHOLD'])
+        response_bytes = 0 if response.streaming else len(response.content)
+        registry.record(request.method, route_of(request), response.status_code, total, stats, response_bytes, suspects)
+
+        if server_timing_allowed(request, config['SERVER_TIMING']):
+            response['Server-Timing'] = server_timing(stats, total)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _view_started()
+
+    def process_template_response(self, request, response):
+        _view_finished()
+        return response
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        _view_started()
+
+    async def aprocess_template_response(self, request, response):
+        _view_finished()
+        return response
+
+
+def _view_started():
+    stats = _current.get()
+    if stats is not None:
+        stats.view_started = time.perf_counter()
+
+
+def _view_finished():
+    # DRF responses come back unrendered: the view itself is done here.
+    stats = _current.get()
+    if stats is not None and stats.view_started is not None:
+        stats.view_seconds = time.perf_counter() - stats.view_started
+
+
+def server_timing_allowed(request, setting):
+    """
+    Whether this response may carry Server-Timing: its figures tell a
+    client how the request was served, so only when the setting opens it.
+    """
+    if setting == 'staff':
+        # DRF copies the user it authenticated onto the HttpRequest.
+        user = getattr(request, 'user', None)
+        return bool(user is not None and user.is_staff)
+    return bool(setting)
+
+
+def server_timing(stats, total):
+    return ', '.join([
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"',
+        f'view;dur={stats.view_seconds * 1000:.1f}',
+        f'serialize;dur={stats.serialize_seconds * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ])
+
+
+# --- Prometheus exposition -------------------------------------------------
+
+METRICS = (
+    ('school_http_request_db_queries_total', 'counter', 'SQL queries run', 'queries'),
+    ('school_http_request_db_seconds_total', 'counter', 'Time spent in SQL queries', 'db_seconds'),
+    ('school_http_request_view_seconds_total', 'counter', 'Time spent in views, queries and serializers included', 'view_seconds'),
+    ('school_http_request_serialize_seconds_total', 'counter', 'Time spent in serializers and JSON rendering', 'serialize_seconds'),
+    ('school_http_response_bytes_total', 'counter', 'Response body bytes (streaming responses excluded)', 'response_bytes'),
+    ('school_http_request_duplicate_queries_total', 'counter', 'Queries repeating an earlier one of the same request exactly', 'duplicate_queries'),
+    ('school_http_request_n_plus_one_total', 'counter', 'Requests with an N+1 suspect statement', 'n_plus_one_requests'),
+)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(merged=None):
+    """All routes' figures in the Prometheus text exposition format (version 0.0.4)."""
+    merged = registry.merged() if merged is None else merged
+    lines = []
+    series = sorted(merged.items())
+
+    lines.append('# HELP school_http_requests_total Requests served')
+    lines.append('# TYPE school_http_requests_total counter')
+    for key, figures in series:
+        method, route = key.split(' ', 1)
+        for status, count in sorted(figures['statuses'].items()):
+            lines.append(
+                f'school_http_requests_total{{method="{method}",route="{_label(route)}",status="{status}"}} {count}'
+            )
+
+    lines.append('# HELP school_http_request_duration_seconds Request duration')
+    lines.append('# TYPE school_http_request_duration_seconds histogram')
+    for key, figures in series:
+        method, route = key.split(' ', 1)
+        labels = f'method="{method}",route="{_label(route)}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS, figures['buckets']):
+            cumulative += count
+            lines.append(f'school_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'school_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {figures["requests"]}')
+        lines.append(f'school_http_request_duration_seconds_sum{{{labels}}} {figures["seconds"]:.6f}')
+        lines.append(f'school_http_request_duration_seconds_count{{{labels}}} {figures["requests"]}')
+
+    for name, kind, description, field in METRICS:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key, figures in series:
+            method, route = key.split(' ', 1)
+            value = figures[field]
+            value = f'{value:.6f}' if isinstance(value, float) else value
+            lines.append(f'{name}{{method="{method}",route="{_label(route)}"}} {value}')
+    return '\n'.join(lines) + '\n'
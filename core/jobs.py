@@ -0,0 +1,401 @@
+"""
+Job execution: a registry of job functions, a queue in the Job table, a
+scheduler for periodic jobs and a process-pool worker (run_worker).
+
+Jobs are registered with @job (core/tasks.py) and queued with enqueue().
+Periodic jobs are queued by the worker itself, once per schedule slot under
+a unique dedupe key, so nothing is queued at import time and several
+workers never double up a run. A worker claims due jobs with one locked
+SELECT (skipping rows other workers hold, where the database can) and one
+UPDATE, runs them in a pool of processes that each keep their own database
+connection, and records status, timings and the result on the row. Claimed
+jobs carry a lease the worker keeps renewing; a job whose lease lapses
+(its worker died, on whatever host) is requeued by the next worker to look. Jobs
+declared with `partition` fan out into one child job per slice of student
+ids, which the pool then runs in parallel.
+"""
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from .models import Job
+from .proceedings import student_ranges
+
+DEFAULTS = {
+    # Pool size; None means one process per CPU.
+    'PROCESSES': None,
+    # Seconds between queue checks while nothing is running.
+    'POLL_INTERVAL': 1.0,
+    # Pool processes are replaced after this many jobs, bounding leaks.
+    'MAX_TASKS_PER_CHILD': 100,
+    # Finished jobs are purged after this many days (purge_finished_jobs).
+    'KEEP_FINISHED_DAYS': 7,
+    # Lease on a running job; the worker renews it every third of this.
+    'LEASE_SECONDS': 60,
+}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'JOB_WORKER', {})}
+
+
+def _lease():
+    return timedelta(seconds=_config()['LEASE_SECONDS'])
+
+
+@dataclass(frozen=True)
+class JobSpec:
+    name: str
+    func: object
+    # Seconds between periodic runs, or None for on-demand jobs
+    every: int = None
+    # Students per child job, or None to run in one piece
+    partition: int = None
+    max_attempts: int = 1
+    retry_delay: int = 60
+
+
+JOBS = {}
+
+
+def job(name=None, every=None, partition=None, max_attempts=1, retry_delay=60):
+    """
+    Register a function as a job. Arguments must be JSON-serializable and
+    so must the return value, which is stored as the job's result.
+
+    A job with `partition` receives `student_range=(first, last)`: queued
+    without one, it only splits the students into slices of that size and
+    queues a child job per slice.
+    """
+    def register(func):
+        spec = JobSpec(name or func.__name__, func, every, partition, max_attempts, retry_delay)
+        JOBS[spec.name] = spec
+        return func
+    return register
+
+
+def enqueue(name, args=None, run_at=None, parent=None):
+    """Queue one run of a registered job."""
+    if name not in JOBS:
+        raise ValueError(f"Unknown job {name!r}; choose from {', '.join(sorted(JOBS))}.")
+    return Job.objects.create(name=name, args=args or {}, run_at=run_at or timezone.now(), parent=parent)
+
+
+# --- Scheduling ------------------------------------------------------------
+
+def schedule_periodic(now=None):
+    """
+    Queue the current slot of every periodic job, in one INSERT that skips
+    slots already queued. Slots are aligned to the epoch, so every worker
+    agrees on them; a run is due from when it is first queued. Returns when
+    the next slot starts (a timestamp).
+    """
+    now = now or timezone.now()
+    stamp = now.timestamp()
+    runs = []
+    next_slot = None
+    for spec in JOBS.values():
+        if not spec.every:
+            continue
+        slot = int(stamp // spec.every)
+        runs.append(Job(
+            name=spec.name,
+            run_at=now,
+            dedupe_key=f'{spec.name}:{slot}',
+        ))
+        next_slot = min(next_slot or float('inf'), (slot + 1) * spec.every)
+    if runs:
+        Job.objects.bulk_create(runs, ignore_conflicts=True)
+    return next_slot
+
+
+def fan_out(spec, parent_pk, args):
+    """Queue the child jobs of a partitioned job; returns how many."""
+    now = timezone.now()
+    parts = [
+        Job(name=spec.name, args={**args, 'student_range': [first, last]}, run_at=now, parent_id=parent_pk)
+        for first, last in student_ranges(spec.partition)
+    ]
+    Job.objects.bulk_create(parts)
+    return len(parts)
+
+
+def purge_finished(now=None):
+    """Delete finished jobs older than KEEP_FINISHED_DAYS."""
+    cutoff = (now or timezone.now()) - timedelta(days=_config()['KEEP_FINISHED_DAYS'])
+    return Job.objects.filter(status__in=['done', 'failed'], finished_at__lt=cutoff).delete()[0]
+
+
+# --- Claiming and running --------------------------------------------------
+
+def claim(limit, worker, now=None):
+    """
+    Mark up to `limit` due jobs as running for `worker` and return them as
+    (pk, name, args) tuples, oldest first.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        pks = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', run_at__lte=now)
+            .order_by('run_at', 'pk')
+            .values_list('pk', flat=True)[:limit]
+        )
+        if not pks:
+            return []
+        Job.objects.filter(pk__in=pks).update(
+            status='running', worker=worker, started_at=now, attempts=F('attempts') + 1,
+            lease_expires_at=now + _lease(),
+        )
+    return list(Job.objects.filter(pk__in=pks).order_by('run_at', 'pk').values_list('pk', 'name', 'args'))
+
+
+def execute(pk, name, args):
+    """
+    Run one claimed job; called in a pool process. Returns (result, error),
+    where error is a traceback or ''.
+    """
+    # Ctrl-C reaches the whole process group; the parent stops the pool
+    # once the jobs in hand are done.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    close_old_connections()
+    spec = JOBS.get(name)
+    try:
+        # Claim time plus waiting for a free process is latency, not run time.
+        Job.objects.filter(pk=pk).update(started_at=timezone.now())
+        if spec is None:
+            return None, f"Unknown job {name!r}"
+        if spec.partition and 'student_range' not in args:
+            return {'parts': fan_out(spec, pk, args)}, ''
+        return spec.func(**args), ''
+    except Exception:
+        return None, traceback.format_exc()
+    finally:
+        close_old_connections()
+
+
+def finish(pk, result=None, error=''):
+    """Record the outcome of a run, queueing a retry if the job allows one."""
+    name, attempts = Job.objects.filter(pk=pk).values_list('name', 'attempts').get()
+    spec = JOBS.get(name)
+    now = timezone.now()
+    if error and spec is not None and attempts < spec.max_attempts:
+        Job.objects.filter(pk=pk).update(
+            status='queued', run_at=now + timedelta(seconds=spec.retry_delay), worker='', error=error,
+            lease_expires_at=None,
+        )
+        return 'retrying'
+    status = 'failed' if error else 'done'
+    Job.objects.filter(pk=pk).update(
+        status=status, result=result, error=error, finished_at=now, lease_expires_at=None,
+    )
+    return status
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _requeue(jobs, now):
+    return jobs.filter(status='running').update(status='queued', worker='', run_at=now, lease_expires_at=None)
+
+
+def release_lapsed(now=None):
+    """Requeue running jobs whose lease has lapsed, whatever their host. Returns how many."""
+    now = now or timezone.now()
+    return _requeue(Job.objects.filter(lease_expires_at__lt=now), now)
+
+
+def release_abandoned(host=None, now=None):
+    """
+    Requeue jobs left running by workers that no longer exist: at once for
+    workers on this host whose process is gone (killed or crashed), and
+    through release_lapsed() for the others. Run at worker start. Returns
+    how many.
+    """
+    host = host or socket.gethostname()
+    now = now or timezone.now()
+    abandoned = []
+    for pk, worker in Job.objects.filter(status='running', worker__startswith=f'{host}:').values_list('pk', 'worker'):
+        pid = int(worker.rsplit(':', 1)[1])
+        # A container restart can hand a previous worker's pid to this one.
+        if pid == os.getpid() or not _alive(pid):
+            abandoned.append(pk)
+    return _requeue(Job.objects.filter(pk__in=abandoned), now) + release_lapsed(now)
+
+
+class Worker:
+    """
+    Claims due jobs and runs them on a pool of `processes` processes. The
+    pool uses 'spawn', so each process runs django.setup() on its own and
+    opens its own database connection rather than sharing the parent's.
+    """
+
+    def __init__(self, processes=None, poll_interval=None, schedule=True, log=None):
+        config = _config()
+        self.processes = processes or config['PROCESSES'] or os.cpu_count() or 1
+        self.poll_interval = poll_interval if poll_interval is not None else config['POLL_INTERVAL']
+        self.max_tasks_per_child = config['MAX_TASKS_PER_CHILD']
+        self.schedule = schedule
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.log = log or (lambda message: None)
+        self.running = {}
+        self.stopping = False
+
+    def stop(self, *args):
+        """Finish the jobs in hand, claim no more (also the SIGTERM/SIGINT handler)."""
+        self.stopping = True
+
+    def heartbeat(self, now=None):
+        """Renew the leases of this worker's running jobs and requeue other workers' lapsed ones."""
+        now = now or timezone.now()
+        Job.objects.filter(status='running', worker=self.name).update(lease_expires_at=now + _lease())
+        released = release_lapsed(now)
+        if released:
+            self.log(f'Requeued {released} job(s) whose lease lapsed.')
+
+    def _pool(self):
+        return ProcessPoolExecutor(
+            self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+            max_tasks_per_child=self.max_tasks_per_child,
+        )
+
+    def _collect(self, futures):
+        """Record finished runs; returns False if the pool broke."""
+        intact = True
+        for future in futures:
+            pk, name = self.running.pop(future)
+            try:
+                result, error = future.result()
+            except BrokenProcessPool:
+                result, error = None, 'The pool process running this job died.'
+                intact = False
+            status = finish(pk, result, error)
+            self.log(f'{name} #{pk}: {status}')
+        return intact
+
+    def run(self, once=False):
+        """
+        Work until stopped; with `once`, return as soon as nothing is due
+        or running (handy for cron and tests).
+        """
+        released = release_abandoned()
+        if released:
+            self.log(f'Requeued {released} job(s) abandoned by a previous worker.')
+        pool = self._pool()
+        next_slot = 0
+        next_heartbeat = time.time() + _lease().total_seconds() / 3
+        try:
+            while not self.stopping:
+                # The parent's connection, recycled as a request cycle would.
+                close_old_connections()
+                if time.time() >= next_heartbeat:
+                    self.heartbeat()
+                    next_heartbeat = time.time() + _lease().total_seconds() / 3
+                if self.schedule and time.time() >= next_slot:
+                    next_slot = schedule_periodic() or float('inf')
+                free = self.processes - len(self.running)
+                claimed = claim(free, self.name) if free else []
+                for pk, name, args in claimed:
+                    self.running[pool.submit(execute, pk, name, args)] = (pk, name)
+                if not self.running:
+                    if once and not claimed:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                done, _ = wait(self.running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                if not self._collect(done):
+                    # A dead process breaks the whole pool and fails the
+                    # jobs still in it; start a new one.
+                    self._collect(wait(self.running).done)
+                    pool.shutdown()
+                    pool = self._pool()
+            self._collect(wait(self.running).done)
+        finally:
+            pool.shutdown()
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+
+# --- Metrics ---------------------------------------------------------------
+
+def _percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None, 'max': None}
+    values = sorted(values)
+
+    def nearest_rank(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+    return {'p50': nearest_rank(0.5), 'p95': nearest_rank(0.95), 'max': round(values[-1], 3)}
+
+
+def job_metrics(window=timedelta(hours=1), now=None):
+    """
+    Queue depth and age, plus per-job throughput, queueing latency (due to
+    started in a pool process) and run time over the runs finished within
+    `window`.
+    """
+    now = now or timezone.now()
+    due = Job.objects.filter(status='queued', run_at__lte=now).aggregate(count=Count('pk'), oldest=Min('run_at'))
+
+    per_job = {}
+
+    def entry(name):
+        return per_job.setdefault(name, {'queued': 0, 'running': 0, 'done': 0, 'failed': 0})
+
+    pending = (
+        Job.objects.filter(status__in=['queued', 'running'])
+        .values_list('name', 'status').annotate(count=Count('pk')).order_by()
+    )
+    for name, status, count in pending:
+        entry(name)[status] = count
+
+    latencies, durations = {}, {}
+    finished = Job.objects.filter(finished_at__gte=now - window).values_list(
+        'name', 'status', 'run_at', 'started_at', 'finished_at',
+    )
+    for name, status, run_at, started_at, finished_at in finished:
+        entry(name)[status] += 1
+        latencies.setdefault(name, []).append((started_at - run_at).total_seconds())
+        durations.setdefault(name, []).append((finished_at - started_at).total_seconds())
+
+    minutes = window.total_seconds() / 60
+    for name, stats in per_job.items():
+        stats['throughput_per_minute'] = round((stats['done'] + stats['failed']) / minutes, 3)
+        stats['latency_seconds'] = _percentiles(latencies.get(name, []))
+        stats['run_seconds'] = _percentiles(durations.get(name, []))
+
+    return {
+        'window_seconds': int(window.total_seconds()),
+        'queue': {
+            'queued': sum(stats['queued'] for stats in per_job.values()),
+            'due': due['count'],
+            'running': sum(stats['running'] for stats in per_job.values()),
+            'oldest_due_seconds': round((now - due['oldest']).total_seconds(), 3) if due['oldest'] else None,
+        },
+        'jobs': dict(sorted(per_job.items())),
+    }
@@ -0,0 +1,345 @@
+"""
+The fee ledger: payments against fees, and running balances per student
+and per class.
+
+FeePayment rows are the source of truth. Fee.amount_paid, StudentBalance
+and ClassBalance are derived from them and from Fee.amount. Each single
+write shifts them by F() deltas in its own transaction (core/signals.py);
+the bulk paths (LedgerQuerySet in core/querysets.py) refresh whatever
+they touched from the rows once, at the end. Balances are stored rather
+than summed per request, so the outstanding lists are index scans on
+(-outstanding). reconcile_fee_ledger() finds and repairs drift.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Sum, Value, When
+from django.utils import timezone
+
+from .models import ClassBalance, Fee, FeePayment, SchoolClass, Student, StudentBalance
+from .proceedings import student_batches
+
+ZERO = Decimal('0.00')
+
+
+class LedgerError(ValueError):
+    """A payment the ledger refuses, e.g. one larger than what is owed on the fee."""
+
+
+def _sums(queryset, key):
+    """{key: Sum('amount')} over `queryset`, in one grouped query."""
+    return dict(queryset.values_list(key).annotate(Sum('amount')).order_by())
+
+
+# --- Upserts ---------------------------------------------------------------
+
+def upsert_student_balances(rows):
+    """Write (student_id, school_class_id, charged, paid) rows to StudentBalance."""
+    StudentBalance.objects.bulk_create(
+        [
+            StudentBalance(
+                student_id=student_id, school_class_id=school_class_id,
+                charged=charged, paid=paid, outstanding=charged - paid,
+            )
+            for student_id, school_class_id, charged, paid in rows
+        ],
+        update_conflicts=True,
+        unique_fields=['student'],
+        update_fields=['school_class', 'charged', 'paid', 'outstanding', 'updated_at'],
+    )
+
+
+def upsert_class_balances(rows):
+    """Write (school_class_id, charged, paid) rows to ClassBalance."""
+    ClassBalance.objects.bulk_create(
+        [
+            ClassBalance(school_class_id=school_class_id, charged=charged, paid=paid, outstanding=charged - paid)
+            for school_class_id, charged, paid in rows
+        ],
+        update_conflicts=True,
+        unique_fields=['school_class'],
+        update_fields=['charged', 'paid', 'outstanding', 'updated_at'],
+    )
+
+
+# --- Refresh from the rows ---------------------------------------------------
+
+def refresh_fees(fee_ids):
+    """Recompute amount_paid and paid of the given fees from their payments; returns how many changed."""
+    fee_ids = {pk for pk in fee_ids if pk is not None}
+    if not fee_ids:
+        return 0
+    paid = _sums(FeePayment.objects.filter(fee_id__in=fee_ids), 'fee_id')
+    changed = []
+    for fee in Fee.objects.filter(pk__in=fee_ids).only('pk', 'student_id', 'amount', 'amount_paid', 'paid'):
+        amount_paid = paid.get(fee.pk, ZERO)
+        if (fee.amount_paid, fee.paid) != (amount_paid, amount_paid >= fee.amount):
+            fee.amount_paid, fee.paid = amount_paid, amount_paid >= fee.amount
+            changed.append(fee)
+    Fee.objects.bulk_update(changed, ['amount_paid', 'paid'])
+    return len(changed)
+
+
+def refresh_class_balances(class_ids):
+    """Recompute the ClassBalance of the given classes from their members' balances."""
+    class_ids = set(SchoolClass.objects.filter(pk__in={pk for pk in class_ids if pk is not None})
+                    .values_list('pk', flat=True))
+    if not class_ids:
+        return 0
+    totals = {
+        school_class_id: (charged, paid)
+        for school_class_id, charged, paid in StudentBalance.objects.filter(school_class_id__in=class_ids)
+        .values_list('school_class_id').annotate(Sum('charged'), Sum('paid')).order_by()
+    }
+    upsert_class_balances(
+        (school_class_id, *totals.get(school_class_id, (ZERO, ZERO))) for school_class_id in class_ids
+    )
+    return len(class_ids)
+
+
+def refresh_balances(student_ids):
+    """
+    Recompute the StudentBalance of the given students from their fees and
+    payments, and the ClassBalance of every class they are or were counted
+    in. Students that no longer exist are skipped.
+    """
+    student_ids = {pk for pk in student_ids if pk is not None}
+    if not student_ids:
+        return 0
+    charged = _sums(Fee.objects.filter(student_id__in=student_ids), 'student_id')
+    paid = _sums(FeePayment.objects.filter(student_id__in=student_ids), 'student_id')
+    classes = dict(Student.objects.filter(pk__in=student_ids).values_list('pk', 'school_class_id'))
+    previous = set(
+        StudentBalance.objects.filter(student_id__in=student_ids).values_list('school_class_id', flat=True)
+    )
+    with transaction.atomic():
+        upsert_student_balances(
+            (student_id, school_class_id, charged.get(student_id, ZERO), paid.get(student_id, ZERO))
+            for student_id, school_class_id in classes.items()
+        )
+        refresh_class_balances(previous | set(classes.values()))
+    return len(classes)
+
+
+# --- Incremental maintenance -------------------------------------------------
+
+_deferred = threading.local()
+
+
+class Touched:
+    """The students and fees written inside a deferred_ledger() block."""
+
+    def __init__(self):
+        self.students = set()
+        self.fees = set()
+
+
+def _shift(balances, charged, paid):
+    return balances.update(
+        charged=F('charged') + charged,
+        paid=F('paid') + paid,
+        outstanding=F('outstanding') + (charged - paid),
+        updated_at=timezone.now(),
+    )
+
+
+def apply_ledger_delta(student_id, charged=ZERO, paid=ZERO):
+    """
+    Shift the balance of one student, and of the class it is counted in,
+    by the amounts newly charged and paid: one UPDATE each. A balance that
+    does not exist yet is computed from the rows instead.
+    """
+    if not charged and not paid:
+        return
+    pending = getattr(_deferred, 'touched', None)
+    if pending is not None:
+        pending.students.add(student_id)
+        return
+    with transaction.atomic():
+        balance = StudentBalance.objects.filter(student_id=student_id)
+        if not _shift(balance, charged, paid):
+            # The student's first fee; the write being applied is already in the rows.
+            refresh_balances([student_id])
+            return
+        in_class = ClassBalance.objects.filter(school_class_id__in=Subquery(balance.values('school_class_id')))
+        if not _shift(in_class, charged, paid):
+            refresh_class_balances(balance.values_list('school_class_id', flat=True))
+
+
+def apply_payment_delta(fee_id, student_id, amount):
+    """Add `amount` (negative to take it back) to what has been paid on one fee, and to the balances."""
+    if not amount:
+        return
+    pending = getattr(_deferred, 'touched', None)
+    if pending is not None:
+        pending.fees.add(fee_id)
+        pending.students.add(student_id)
+        return
+    new_paid = F('amount_paid') + amount
+    with transaction.atomic():
+        Fee.objects.filter(pk=fee_id).update(
+            amount_paid=new_paid,
+            paid=Case(When(amount__lte=new_paid, then=Value(True)), default=Value(False)),
+        )
+        apply_ledger_delta(student_id, paid=amount)
+
+
+@contextmanager
+def deferred_ledger():
+    """
+    Collect the students and fees touched by ledger writes in the block and
+    refresh them once at the end, instead of applying one delta per row.
+
+    Used by the bulk paths of Fee and FeePayment. Nested blocks share the
+    outermost collection.
+    """
+    if getattr(_deferred, 'touched', None) is not None:
+        yield _deferred.touched
+        return
+    _deferred.touched = touched = Touched()
+    try:
+        yield touched
+    finally:
+        _deferred.touched = None
+    with transaction.atomic():
+        refresh_fees(touched.fees)
+        refresh_balances(touched.students)
+
+
+# --- Operations ----------------------------------------------------------------
+
+def record_payment(fee, amount, method='cash', reference='', paid_at=None):
+    """
+    Record a payment of `amount` against `fee` (a Fee or its pk) and return
+    the FeePayment. The fee row is locked while what is still owed on it is
+    checked, so concurrent payments cannot overpay it between them.
+    """
+    amount = Decimal(amount)
+    if amount <= 0:
+        raise LedgerError('A payment must be a positive amount.')
+    with transaction.atomic():
+        fee = Fee.objects.select_for_update().get(pk=getattr(fee, 'pk', fee))
+        owed = fee.amount - fee.amount_paid
+        if amount > owed:
+            raise LedgerError(f'The payment exceeds the {owed} still owed on this fee.')
+        return FeePayment.objects.create(
+            fee=fee, student_id=fee.student_id, amount=amount, method=method,
+            reference=reference, paid_at=paid_at or timezone.now(),
+        )
+
+
+def issue_term_fees(school_class, term, amount):
+    """
+    Charge `amount` for `term` to every member of `school_class` (a
+    SchoolClass or its pk) not billed for that term yet, with one bulk
+    INSERT; the balances are refreshed once for the whole class. Returns
+    the number of fees created.
+
+    The members' rows are locked first, so concurrent issues for the same
+    class run one after the other and the second bills nobody twice. The
+    count compares the members billed for the term, by the (student, term)
+    conflict target, before and after the INSERT inside that lock. A fee
+    for the term that another path writes meanwhile is skipped by the
+    INSERT (fee_unique_student_term) rather than failing it.
+    """
+    with transaction.atomic():
+        students = list(
+            Student.objects.select_for_update()
+            .filter(school_class_id=getattr(school_class, 'pk', school_class))
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        billed = set(Fee.objects.filter(student_id__in=students, term=term).values_list('student_id', flat=True))
+        members = [pk for pk in students if pk not in billed]
+        Fee.objects.bulk_create(
+            [Fee(student_id=pk, amount=amount, term=term) for pk in members], ignore_conflicts=True,
+        )
+        return Fee.objects.filter(student_id__in=members, term=term).count()
+
+
+# --- Reconciliation ------------------------------------------------------------
+
+def reconcile_fee_ledger(student_batch=500, repair=True):
+    """
+    Check every stored ledger figure against the rows it derives from:
+    each payment's student against its fee's, Fee.amount_paid against the
+    fee's payments, StudentBalance against the student's fees and payments,
+    and ClassBalance against its members. Students are walked in id
+    batches, a few grouped queries each; with `repair`, only drifted rows
+    are written. Returns {'payments'|'fees'|'students'|'classes': (checked, drifted)}.
+    """
+    counts = {name: [0, 0] for name in ('payments', 'fees', 'students', 'classes')}
+    class_totals = defaultdict(lambda: (ZERO, ZERO))
+    for student_ids in student_batches(student_batch=student_batch):
+        first, last = student_ids[0], student_ids[-1]
+
+        payments = FeePayment.objects.filter(fee__student_id__gte=first, fee__student_id__lte=last)
+        misfiled = list(payments.exclude(student_id=F('fee__student_id')).values_list('pk', flat=True))
+        counts['payments'][1] += len(misfiled)
+        if repair and misfiled:
+            FeePayment.objects.filter(pk__in=misfiled).update(student_id=Subquery(
+                Fee.objects.filter(pk=OuterRef('fee_id')).values('student_id')[:1]
+            ))
+
+        paid_by_fee = {}
+        for fee_id, paid, count in payments.values_list('fee_id').annotate(Sum('amount'), Count('id')).order_by():
+            paid_by_fee[fee_id] = paid
+            counts['payments'][0] += count
+
+        charged, paid = defaultdict(lambda: ZERO), defaultdict(lambda: ZERO)
+        drifted_fees = []
+        for fee in Fee.objects.filter(student_id__gte=first, student_id__lte=last).only(
+            'pk', 'student_id', 'amount', 'amount_paid', 'paid',
+        ):
+            amount_paid = paid_by_fee.get(fee.pk, ZERO)
+            charged[fee.student_id] += fee.amount
+            paid[fee.student_id] += amount_paid
+            counts['fees'][0] += 1
+            if (fee.amount_paid, fee.paid) != (amount_paid, amount_paid >= fee.amount):
+                fee.amount_paid, fee.paid = amount_paid, amount_paid >= fee.amount
+                drifted_fees.append(fee)
+        counts['fees'][1] += len(drifted_fees)
+
+        stored = {
+            student_id: (school_class_id, charged, paid, outstanding)
+            for student_id, school_class_id, charged, paid, outstanding in StudentBalance.objects.filter(
+                student_id__gte=first, student_id__lte=last,
+            ).values_list('student_id', 'school_class_id', 'charged', 'paid', 'outstanding')
+        }
+        drifted_students = []
+        for student_id, school_class_id in Student.objects.filter(pk__in=student_ids).values_list(
+            'pk', 'school_class_id',
+        ):
+            live = (charged[student_id], paid[student_id])
+            if school_class_id is not None:
+                totals = class_totals[school_class_id]
+                class_totals[school_class_id] = (totals[0] + live[0], totals[1] + live[1])
+            counts['students'][0] += 1
+            expected = (school_class_id, *live, live[0] - live[1])
+            if stored.get(student_id, (school_class_id, ZERO, ZERO, ZERO)) != expected:
+                drifted_students.append((student_id, school_class_id, *live))
+        counts['students'][1] += len(drifted_students)
+
+        if repair:
+            with transaction.atomic():
+                Fee.objects.bulk_update(drifted_fees, ['amount_paid', 'paid'])
+                upsert_student_balances(drifted_students)
+
+    stored = {
+        school_class_id: (charged, paid, outstanding)
+        for school_class_id, charged, paid, outstanding in ClassBalance.objects.values_list(
+            'school_class_id', 'charged', 'paid', 'outstanding',
+        )
+    }
+    drifted_classes = []
+    for school_class_id in SchoolClass.objects.values_list('pk', flat=True):
+        live = class_totals[school_class_id]
+        counts['classes'][0] += 1
+        if stored.get(school_class_id, (ZERO, ZERO, ZERO)) != (*live, live[0] - live[1]):
+            drifted_classes.append((school_class_id, *live))
+    counts['classes'][1] += len(drifted_classes)
+    if repair:
+        upsert_class_balances(drifted_classes)
+    return {name: tuple(pair) for name, pair in counts.items()}
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.authtoken.models import Token
+
+from core.bench import database_url, generate_school, http_load, percentile, scratch_database
+from core.models import Fee, Quiz, Result, Student
+from core.proceedings import rebuild_class_proceedings
+from core.summaries import rebuild_attendance_summaries
+
+# Read endpoints with an async version under /api/async/
+ENDPOINTS = ('dashboard', 'proceedings', 'fees', 'results', 'quizzes', 'attendances', 'students')
+
+# (label, gunicorn arguments, DB_CONN_MAX_AGE): the old WSGI deployment, with
+# persistent connections, against the ASGI one from the Procfile.
+SERVERS = (
+    ('sync', ['core.bench_servers:wsgi_application()'], '600'),
+    ('async', ['-k', 'uvicorn_worker.UvicornWorker', 'core.bench_servers:asgi_application()'], '0'),
+)
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def _wait_until_listening(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'The server exited with status {process.returncode}.')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f'No server listening on port {port} after {timeout}s.')
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test one read endpoint on a sync (gunicorn, WSGI) and an async "
+        "(gunicorn + uvicorn worker, ASGI) server at rising connection counts, "
+        "and report the concurrent connections each worker sustains within --slo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=ENDPOINTS, default='dashboard')
+        parser.add_argument('--concurrency', default='1,10,50,100,200',
+                            help='Comma-separated connection counts to try, in order.')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds of load per connection count.')
+        parser.add_argument('--workers', type=int, default=1, help='gunicorn worker processes per server.')
+        parser.add_argument('--db-latency', type=float, default=5.0,
+                            help='Milliseconds added to every SQL query, as for a database on another host.')
+        parser.add_argument('--slo', type=float, default=500.0,
+                            help='p95 latency (ms) a connection count must stay under to count as sustained.')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Seconds before a request counts as failed.')
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200, help='Students with their own token.')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        if connection.vendor == 'sqlite':
+            self.stderr.write(
+                'Running on SQLite: concurrent reads work, but PostgreSQL (DATABASE_URL) is closer to production.'
+            )
+        with tempfile.TemporaryDirectory() as directory:
+            test_name = os.path.join(directory, 'bench.sqlite3') if connection.vendor == 'sqlite' else None
+            with scratch_database(test_name):
+                tokens = self.seed(options)
+                # The servers have the database to themselves.
+                connection.close()
+                path = f"/api/{options['endpoint']}/"
+                capacities = {}
+                for label, arguments, conn_max_age in SERVERS:
+                    url = path if label == 'sync' else f"/api/async/{options['endpoint']}/"
+                    capacities[label] = self.run_server(label, arguments, conn_max_age, url, tokens, levels, options)
+
+        self.stdout.write('')
+        for label, capacity in capacities.items():
+            self.stdout.write(
+                f"{label}: {capacity or 'no'} concurrent connections per worker with p95 under {options['slo']:.0f} ms"
+                f" (of {options['concurrency']} tried, {options['workers']} worker(s))"
+            )
+
+    def seed(self, options):
+        generate_school(students=options['students'], courses=20, classes=20, days=20)
+        students = list(Student.objects.order_by('pk')[:options['users']])
+        users = User.objects.bulk_create([
+            User(username=f'bench{student.pk}', email=f'bench{student.pk}@bench.local') for student in students
+        ])
+        for student, user in zip(students, users):
+            student.user = user
+        Student.objects.bulk_update(students, ['user'])
+        tokens = Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in users])
+        Fee.objects.bulk_create([Fee(student=student, amount=100 + i) for student in students for i in range(3)])
+        Result.objects.bulk_create([
+            Result(student=student, subject=f'Subject {i}', score=40 + 5 * i, grade='B')
+            for student in students for i in range(8)
+        ])
+        Quiz.objects.bulk_create([
+            Quiz(student=student, subject=f'Subject {i}', date=f'2024-02-{1 + i:02d}', score=i)
+            for student in students for i in range(8)
+        ])
+        rebuild_attendance_summaries()
+        rebuild_class_proceedings()
+        return [token.key for token in tokens]
+
+    def run_server(self, label, arguments, conn_max_age, url, tokens, levels, options):
+        port = _free_port()
+        env = {
+            **os.environ,
+            'DATABASE_URL': database_url(),
+            'DB_CONN_MAX_AGE': conn_max_age,
+            'DJANGO_DEBUG': 'False',
+            'SECRET_KEY': os.environ.get('SECRET_KEY') or settings.SECRET_KEY + '-bench',
+            'BENCH_DB_LATENCY_MS': str(options['db_latency']),
+        }
+        command = [
+            sys.executable, '-m', 'gunicorn', '--workers', str(options['workers']),
+            '--bind', f'127.0.0.1:{port}', '--backlog', '4096', '--log-level', 'warning', *arguments,
+        ]
+        requests = [
+            f'GET {url} HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Token {token}\r\n\r\n'.encode()
+            for token in tokens
+        ]
+        process = subprocess.Popen(command, env=env, cwd=settings.BASE_DIR)
+        try:
+            _wait_until_listening(port, process)
+            # Warm-up: imports, token and Student caches
+            asyncio.run(http_load('127.0.0.1', port, requests, min(len(requests), 10), 1.0, options['timeout']))
+
+            self.stdout.write(f'\n{label}: {" ".join(command[3:])}  GET {url}')
+            self.stdout.write(
+                f"{'connections':>11}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+            )
+            capacity = None
+            for level in levels:
+                latencies, errors, elapsed = asyncio.run(
+                    http_load('127.0.0.1', port, requests, level, options['duration'], options['timeout'])
+                )
+                ordered = sorted(latency * 1000 for latency in latencies)
+                p95 = percentile(ordered, 0.95)
+                self.stdout.write(
+                    f'{level:>11}{len(ordered) / elapsed:>9.1f}'
+                    f'{statistics.median(ordered) if ordered else float("nan"):>9.1f}'
+                    f'{p95:>9.1f}{percentile(ordered, 0.99):>9.1f}{errors:>8}'
+                )
+                if ordered and not errors and p95 <= options['slo']:
+                    capacity = level
+            return capacity
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
@@ -0,0 +1,176 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Q
+
+from core.bench import generate_school, scratch_database
+from core.bitmaps import (
+    class_attendance, rebuild_attendance_bitmaps, student_calendar, student_terms, term_of,
+)
+from core.models import Attendance, AttendanceBitmap, SchoolClass, Student
+from core.proceedings import proceeding_totals
+
+
+def row_proceedings(student_id):
+    """The row-based aggregate behind ClassProceedingsView: a GROUP BY over the student's attendance."""
+    return list(proceeding_totals(Attendance.objects.filter(student_id=student_id)))
+
+
+def row_streaks(student_id):
+    """Longest absence streak per course from the rows, read in date order."""
+    streaks, runs = defaultdict(int), defaultdict(int)
+    rows = (
+        Attendance.objects.filter(student_id=student_id)
+        .order_by('course_id', 'date').values_list('course_id', 'status')
+    )
+    for course_id, status in rows:
+        runs[course_id] = 0 if status == 'Present' else runs[course_id] + 1
+        streaks[course_id] = max(streaks[course_id], runs[course_id])
+    return streaks
+
+
+def row_calendar(student_id, first, last):
+    days = defaultdict(lambda: ['.'] * ((last - first).days + 1))
+    rows = (
+        Attendance.objects.filter(student_id=student_id, date__gte=first, date__lte=last)
+        .values_list('course_id', 'date', 'status')
+    )
+    for course_id, day, status in rows:
+        days[course_id][(day - first).days] = 'P' if status == 'Present' else 'A'
+    return {course_id: ''.join(codes) for course_id, codes in days.items()}
+
+
+def row_class_attendance(school_class_id, term):
+    rows = Attendance.objects.filter(
+        student__school_class_id=school_class_id, date__gte=term.start, date__lt=term.end,
+    ).order_by()
+    counts = {'held': Count('id'), 'present': Count('id', filter=Q(status='Present'))}
+    by_course = list(rows.values('course_id').annotate(**counts).values_list('course_id', 'held', 'present'))
+    by_day = list(rows.values('date').annotate(**counts).values_list('date', 'held', 'present'))
+    return by_course, by_day
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare attendance percentages, streaks, month calendars and class aggregates read off "
+        "the per-term bitmaps with the same figures aggregated from Attendance rows, on a "
+        "generated school. --students 7600 gives about 10M attendance rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--classes', type=int, default=40)
+        parser.add_argument('--courses', type=int, default=30)
+        parser.add_argument('--days', type=int, default=190, help='School days of attendance.')
+        parser.add_argument('--samples', type=int, default=50, help='Students and classes timed per operation.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        start = date(2024, 1, 1)
+        with tempfile.TemporaryDirectory() as directory:
+            # A file rather than memory on SQLite, so tens of millions of rows fit
+            test_name = os.path.join(directory, 'bench.sqlite3') if connection.vendor == 'sqlite' else None
+            with scratch_database(test_name):
+                began = time.perf_counter()
+                rows = generate_school(
+                    students=options['students'], classes=options['classes'], courses=options['courses'],
+                    days=options['days'], weekdays_only=True, start=start, seed=options['seed'],
+                    batch_size=20000,
+                )
+                self.stdout.write(f"{rows:,} attendance rows generated in {time.perf_counter() - began:.0f}s")
+
+                began = time.perf_counter()
+                written, _ = rebuild_attendance_bitmaps()
+                elapsed = time.perf_counter() - began
+                stored = sum(
+                    len(held) + len(present)
+                    for held, present in AttendanceBitmap.objects.values_list('held', 'present').iterator()
+                )
+                self.stdout.write(
+                    f"{written:,} bitmaps rebuilt in {elapsed:.1f}s: {stored:,} bytes of bit strings "
+                    f"for {Attendance.objects.count():,} rows"
+                )
+
+                students = rng.sample(list(Student.objects.values_list('pk', flat=True)), options['samples'])
+                classes = list(SchoolClass.objects.values_list('pk', flat=True))
+                classes = rng.sample(classes, min(options['samples'], len(classes)))
+                term = term_of(start)
+                month = start + timedelta(days=40)
+                first = month.replace(day=1)
+                last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+                self.check_results(students, classes, term, first, last)
+                comparisons = (
+                    (
+                        'percentages per course (student)',
+                        row_proceedings, lambda pk: student_terms(Student(pk=pk)), students,
+                    ),
+                    (
+                        'longest absence streaks (student)',
+                        row_streaks, lambda pk: student_terms(Student(pk=pk)), students,
+                    ),
+                    (
+                        f'calendar of {first:%Y-%m} (student)',
+                        lambda pk: row_calendar(pk, first, last),
+                        lambda pk: student_calendar(Student(pk=pk), first.year, first.month), students,
+                    ),
+                    (
+                        f'class aggregate for {term.label}',
+                        lambda pk: row_class_attendance(pk, term), lambda pk: class_attendance(pk, term), classes,
+                    ),
+                )
+                self.stdout.write(f"\n{'':<36}{'rows p50 ms':>13}{'bitmaps p50 ms':>16}{'speedup':>9}")
+                for label, from_rows, from_bitmaps, keys in comparisons:
+                    row_ms = self.p50(from_rows, keys)
+                    bitmap_ms = self.p50(from_bitmaps, keys)
+                    self.stdout.write(f"{label:<36}{row_ms:>13.2f}{bitmap_ms:>16.2f}{row_ms / bitmap_ms:>8.1f}x")
+
+    def p50(self, func, keys):
+        timings = []
+        for key in keys:
+            began = time.perf_counter()
+            func(key)
+            timings.append((time.perf_counter() - began) * 1000)
+        return statistics.median(timings)
+
+    def check_results(self, students, classes, term, first, last):
+        """Both sides must agree before their timings mean anything."""
+        for pk in students:
+            totals = defaultdict(lambda: [0, 0, 0])
+            for row in student_terms(Student(pk=pk)):
+                course = totals[row['course']]
+                course[0] += row['held']
+                course[1] += row['present']
+                course[2] = max(course[2], row['longest_absence_streak'])
+            streaks = row_streaks(pk)
+            expected = {
+                course_id: [total, attended, streaks[course_id]]
+                for _, course_id, _, _, _, total, attended, _ in row_proceedings(pk)
+            }
+            # Streaks from the rows run across terms; the bitmaps' stop at a term boundary.
+            if {course: values[:2] for course, values in totals.items()} != {
+                course: values[:2] for course, values in expected.items()
+            } or any(totals[course][2] > expected[course][2] for course in expected):
+                raise CommandError(f'Student {pk}: bitmaps {dict(totals)} != rows {expected}')
+            calendar = {
+                course['course']: course['days']
+                for course in student_calendar(Student(pk=pk), first.year, first.month)['courses']
+            }
+            if calendar != row_calendar(pk, first, last):
+                raise CommandError(f'Student {pk}: the {first:%Y-%m} calendars differ')
+        for pk in classes:
+            by_course, by_day = row_class_attendance(pk, term)
+            payload = class_attendance(pk, term)
+            if sorted(by_course) != sorted((c['course'], c['held'], c['present']) for c in payload['courses']) or (
+                sorted(by_day) != [(d['date'], d['held'], d['present']) for d in payload['days']]
+            ):
+                raise CommandError(f'Class {pk}: the {term.label} aggregates differ')
+        self.stdout.write('Bitmap and row results agree on every sample.')
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+from core.bench import generate_school, scratch_database, timed
+from core.models import Attendance, AttendanceSummary, Course, Student
+from core.summaries import rebuild_attendance_summaries
+
+
+def legacy_recompute():
+    """The original calculate_all_attendance loop: two COUNTs and an update_or_create per pair."""
+    for student in Student.objects.all():
+        for course in Course.objects.all():
+            total_classes = Attendance.objects.filter(student=student, course=course).count()
+            classes_attended = Attendance.objects.filter(
+                student=student, course=course, status='Present',
+            ).count()
+            percentage = (classes_attended / total_classes) * 100 if total_classes > 0 else 0.0
+            AttendanceSummary.objects.update_or_create(
+                student=student, course=course, defaults={'percentage': percentage},
+            )
+
+
+class Command(BaseCommand):
+    help = "Compare the per-pair summary loop with the set-based engine on a generated dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--courses', type=int, default=20)
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        timings = {}
+        queries = {}
+        with scratch_database():
+            rows = generate_school(
+                students=options['students'], courses=options['courses'],
+                days=options['days'], seed=options['seed'],
+            )
+            self.stdout.write(
+                f"dataset: {options['students']} students, {options['courses']} courses, "
+                f"{rows} attendance rows"
+            )
+
+            for label, run in (('legacy loop', legacy_recompute), ('set-based', rebuild_attendance_summaries)):
+                AttendanceSummary.objects.all().delete()
+                reset_queries()
+                with CaptureQueriesContext(connection) as ctx, timed(timings, label):
+                    run()
+                queries[label] = len(ctx)
+                self.stdout.write(
+                    f"{label:>12}: {timings[label]:8.3f}s  {queries[label]:>8} queries  "
+                    f"{AttendanceSummary.objects.count():>7} summary rows"
+                )
+
+        speedup = timings['legacy loop'] / timings['set-based'] if timings['set-based'] else float('inf')
+        self.stdout.write(self.style.SUCCESS(f"speedup: {speedup:.1f}x"))
@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.bench import generate_school, scratch_database
+from core.models import Fee, Result, Student
+
+ENDPOINTS = [
+    '/api/students/',
+    '/api/fees/',
+    '/api/results/',
+    '/api/attendances/',
+    '/api/proceedings/',
+    '/api/timetables/',
+    '/api/dashboard/',
+]
+
+
+def _measure(client, url, requests, etag=None):
+    headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+    timings = []
+    with CaptureQueriesContext(connection) as ctx:
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.get(url, **headers)
+            timings.append((time.perf_counter() - start) * 1000)
+    return response, timings, len(ctx) / requests
+
+
+class Command(BaseCommand):
+    help = "Compare full (200) and conditional (304) GET latency for the read endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and mode.')
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--days', type=int, default=60)
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def handle(self, *args, **options):
+        requests = options['requests']
+        with scratch_database():
+            generate_school(students=options['students'], courses=20, days=options['days'])
+            student = Student.objects.order_by('pk').first()
+            student.user = User.objects.create_user('bench', 'bench@bench.local', 'bench')
+            student.save()
+            Fee.objects.bulk_create([Fee(student=student, amount=100 + i) for i in range(20)])
+            Result.objects.bulk_create([
+                Result(student=student, subject=f'Subject {i}', score=50 + i, grade='B') for i in range(20)
+            ])
+            token = Token.objects.create(user=student.user)
+            cache.clear()
+
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+            self.stdout.write(f"{'endpoint':<22}{'200 p50 ms':>12}{'304 p50 ms':>12}{'speedup':>9}{'q/200':>7}{'q/304':>7}")
+            for url in ENDPOINTS:
+                response, full, full_queries = _measure(client, url, requests)
+                etag = response.get('ETag')
+                if not etag:
+                    self.stdout.write(f"{url:<22} no ETag, skipped")
+                    continue
+                response, conditional, conditional_queries = _measure(client, url, requests, etag)
+                assert response.status_code == 304, (url, response.status_code)
+                full_p50 = statistics.median(full)
+                conditional_p50 = statistics.median(conditional)
+                self.stdout.write(
+                    f"{url:<22}{full_p50:>12.3f}{conditional_p50:>12.3f}"
+                    f"{full_p50 / conditional_p50:>8.1f}x{full_queries:>7.1f}{conditional_queries:>7.1f}"
+                )
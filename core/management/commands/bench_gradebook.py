@@ -0,0 +1,64 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.analytics import class_ranking, rank_scores, score_columns, score_statistics
+from core.bench import generate_school, scratch_database
+from core.models import Result, SchoolClass, Student
+
+
+def loop_ranking(school_class_id):
+    """The obvious version: ORM objects and Python dicts, for comparison."""
+    means = {}
+    for result in Result.objects.filter(student__school_class_id=school_class_id):
+        means.setdefault(result.subject, {}).setdefault(result.student_id, []).append(result.score)
+    ranking = {}
+    for subject, students in means.items():
+        ordered = sorted(students, key=lambda pk: -sum(students[pk]) / len(students[pk]))
+        ranking[subject] = {pk: position for position, pk in enumerate(ordered, start=1)}
+    return ranking
+
+
+class Command(BaseCommand):
+    help = "Time the NumPy gradebook analytics on a synthetic school (one class, every student ranked)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=10000)
+        parser.add_argument('--subjects', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with scratch_database():
+            generate_school(students=options['students'], courses=2, classes=1, days=0, seed=options['seed'])
+            Result.objects.bulk_create(
+                (
+                    Result(student_id=pk, subject=f'Subject {i}', score=rng.randint(0, 100), grade='-')
+                    for pk in Student.objects.values_list('pk', flat=True)
+                    for i in range(options['subjects'])
+                ),
+                batch_size=5000,
+            )
+            school_class_id = SchoolClass.objects.get().pk
+            self.stdout.write(f"{Result.objects.count()} results, {options['students']} students in one class")
+
+            timings = {}
+            start = time.perf_counter()
+            data = score_columns(Result, school_class_id)
+            timings['fetch columns (1 query)'] = time.perf_counter() - start
+            start = time.perf_counter()
+            rank_scores(data)
+            timings['rank (NumPy)'] = time.perf_counter() - start
+            start = time.perf_counter()
+            class_ranking('results', school_class_id)
+            timings['class_ranking total'] = time.perf_counter() - start
+            start = time.perf_counter()
+            score_statistics('results')
+            timings['score_statistics total'] = time.perf_counter() - start
+            start = time.perf_counter()
+            loop_ranking(school_class_id)
+            timings['rank (ORM objects + Python loop)'] = time.perf_counter() - start
+
+            for label, seconds in timings.items():
+                self.stdout.write(f"{label:<36}{seconds * 1000:>10.1f} ms")
@@ -0,0 +1,273 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from contextlib import nullcontext
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.bench import ENDPOINTS, generate_school, percentile, scratch_database
+from core.ledger import reconcile_fee_ledger
+from core.models import (
+    Attendance, AttendanceSummary, ClassProceeding, Course, Fee, FeePayment, Quiz, Result, SchoolClass,
+    Student, Teacher, Timetable,
+)
+from core.proceedings import check_class_proceedings, rebuild_class_proceedings
+from core.summaries import rebuild_attendance_summaries, reconcile_attendance_summaries
+
+# The whole-table jobs behind the summaries and the ledger, timed with the
+# endpoints. Reconciliation only checks, so every run reads the same rows.
+JOBS = {
+    'rebuild_attendance_summaries': rebuild_attendance_summaries,
+    'reconcile_attendance_summaries': reconcile_attendance_summaries,
+    'rebuild_class_proceedings': rebuild_class_proceedings,
+    'check_class_proceedings': check_class_proceedings,
+    'reconcile_fee_ledger': lambda: reconcile_fee_ledger(repair=False),
+}
+
+DATASET = (
+    Teacher, SchoolClass, Course, Student, Attendance, AttendanceSummary, ClassProceeding,
+    Result, Quiz, Fee, FeePayment, Timetable,
+)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _statistics(timings, queries):
+    """Latency percentiles (ms), throughput and queries per run of one endpoint or job."""
+    ordered = sorted(timings)
+    return {
+        'runs': len(ordered),
+        'p50_ms': round(percentile(ordered, 0.50), 3),
+        'p95_ms': round(percentile(ordered, 0.95), 3),
+        'p99_ms': round(percentile(ordered, 0.99), 3),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+        'max_ms': round(ordered[-1], 3),
+        'per_second': round(1000 * len(ordered) / sum(ordered), 2),
+        'queries': round(queries / len(ordered), 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every API route (ENDPOINTS in core/bench.py) in-process, and the summary "
+        "and ledger jobs, on a generated school or the current database. Writes p50/p95/p99 "
+        "latency, throughput and query counts to a JSON file that --compare diffs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='bench-suite.json', help='JSON results file (default: %(default)s).')
+        parser.add_argument('--compare', metavar='JSON', help='Earlier results to print the change against.')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per endpoint first.')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request.')
+        parser.add_argument(
+            '--exclude', action='append', default=[], metavar='TEXT',
+            help="Skip endpoints whose 'METHOD template' contains TEXT (repeatable), e.g. exports/.",
+        )
+        parser.add_argument('--job-runs', type=int, default=3, help='Timed runs per job; 0 skips the jobs.')
+        parser.add_argument(
+            '--current-database', action='store_true',
+            help='Run against the configured database instead of a generated scratch one. '
+                 'Everything the run writes is rolled back.',
+        )
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--classes', type=int, default=40)
+        parser.add_argument('--courses', type=int, default=30)
+        parser.add_argument('--days', type=int, default=60, help='School days of attendance.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with nullcontext() if options['current_database'] else scratch_database(), transaction.atomic():
+            if not options['current_database']:
+                self.stdout.write(f"Generating {options['students']} students, {options['days']} school days...")
+                generate_school(
+                    students=options['students'], classes=options['classes'], courses=options['courses'],
+                    days=options['days'], weekdays_only=True, results=10, quizzes=20, fees=3, timetable=True,
+                    seed=options['seed'], batch_size=20000,
+                )
+            dataset = {model._meta.model_name: model.objects.count() for model in DATASET}
+            clients, ids, payloads = self.fixtures()
+            endpoints = self.run_endpoints(clients, ids, payloads, options)
+            jobs = self.run_jobs(options['job_runs'])
+            transaction.set_rollback(True)
+
+        report = {
+            'meta': {
+                'commit': _git_commit(),
+                'timestamp': timezone.now().isoformat(timespec='seconds'),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'dataset': dataset,
+                'options': {
+                    key: options[key] for key in (
+                        'requests', 'warmup', 'cold', 'exclude', 'job_runs', 'current_database',
+                        'students', 'classes', 'courses', 'days', 'seed',
+                    )
+                },
+                'seconds': round(time.perf_counter() - started, 1),
+            },
+            'endpoints': endpoints,
+            'jobs': jobs,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+            output.write('\n')
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        if options['compare']:
+            self.compare(options['compare'], report)
+
+    def fixtures(self):
+        """
+        Clients per role, ids for the URL templates and POST bodies, around
+        a student without a user account who still owes on a fee and has a
+        row of every kind.
+        """
+        candidates = Fee.objects.filter(
+            student__user__isnull=True, amount__gte=F('amount_paid') + 10,
+        ).order_by('student_id').values_list('pk', 'student_id')[:200]
+        for fee_id, student_id in candidates:
+            student = Student.objects.get(pk=student_id)
+            ids = {
+                'student': student.pk,
+                'fee': fee_id,
+                'payment': FeePayment.objects.filter(student=student).values_list('pk', flat=True).first(),
+                'result': student.result_set.values_list('pk', flat=True).first(),
+                'quiz': student.quiz_set.values_list('pk', flat=True).first(),
+                'attendance': student.attendances.values_list('pk', flat=True).first(),
+                'summary': AttendanceSummary.objects.filter(student=student).values_list('pk', flat=True).first(),
+                'teacher': student.school_class.teacher_id if student.school_class else None,
+                'school_class': student.school_class_id,
+                'timetable': Timetable.objects.filter(school_class_id=student.school_class_id)
+                .values_list('pk', flat=True).first(),
+            }
+            if None not in ids.values():
+                break
+        else:
+            raise CommandError(
+                'No student without a user account has an unpaid fee, a payment, a result, a quiz, '
+                'attendance and a class with a timetable to benchmark with.'
+            )
+
+        staff = User.objects.create_user('bench-suite-staff', 'staff@bench.local', 'bench', is_staff=True)
+        student.user = User.objects.create_user('bench-suite-student', 'student@bench.local', 'bench')
+        student.save()
+        clients = {None: APIClient()}
+        for role, user in (('staff', staff), ('student', student.user)):
+            clients[role] = APIClient()
+            clients[role].credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+
+        payloads = {
+            '/api/auth/': {'username': 'bench-suite-student', 'password': 'bench'},
+            '/api/attendances/roll-call/': {
+                'school_class': student.school_class_id,
+                'course': student.attendances.values_list('course_id', flat=True).first(),
+                'date': timezone.localdate().isoformat(),
+                'entries': [
+                    {'student': pk, 'status': 'Present'}
+                    for pk in Student.objects.filter(school_class_id=student.school_class_id).values_list('pk', flat=True)
+                ],
+            },
+            '/api/payments/': {'fee': ids['fee'], 'amount': '10.00', 'method': 'card'},
+            f"/api/ledger/classes/{ids['school_class']}/issue-fees/": {'term': 'BENCH', 'amount': '120.00'},
+        }
+        return clients, ids, payloads
+
+    def run_endpoints(self, clients, ids, payloads, options):
+        """{'METHOD url template': statistics}; every POST is rolled back, so each one sees the same rows."""
+        results = {}
+        self.stdout.write(f"\n{'endpoint':<60}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'queries':>9}")
+        for method, template, role, _ in ENDPOINTS:
+            if any(text in f'{method} {template}' for text in options['exclude']):
+                continue
+            url = template.format(**ids)
+            client = clients[role]
+            timings, queries = [], 0
+            for run in range(options['warmup'] + options['requests']):
+                if options['cold']:
+                    cache.clear()
+                with transaction.atomic(), CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    if method == 'POST':
+                        response = client.post(url, payloads[url], format='json')
+                    else:
+                        response = client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    transaction.set_rollback(True)
+                if not 200 <= response.status_code < 300:
+                    raise CommandError(f'{method} {url} answered {response.status_code}: {response.content[:200]!r}')
+                if run >= options['warmup']:
+                    timings.append(elapsed)
+                    queries += len(ctx)
+            results[f'{method} {template}'] = stats = _statistics(timings, queries)
+            self.stdout.write(
+                f"{method + ' ' + template:<60}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+                f"{stats['p99_ms']:>10.2f}{stats['per_second']:>9.1f}{stats['queries']:>9.1f}"
+            )
+        return results
+
+    def run_jobs(self, runs):
+        results = {}
+        if not runs:
+            return results
+        self.stdout.write(f"\n{'job':<60}{'p50 ms':>10}{'max ms':>10}{'queries':>9}")
+        for name, job in JOBS.items():
+            timings, queries = [], 0
+            for _ in range(runs):
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    job()
+                    timings.append((time.perf_counter() - start) * 1000)
+                queries += len(ctx)
+            results[name] = stats = _statistics(timings, queries)
+            self.stdout.write(f"{name:<60}{stats['p50_ms']:>10.1f}{stats['max_ms']:>10.1f}{stats['queries']:>9.1f}")
+        return results
+
+    def compare(self, path, report):
+        try:
+            with open(path) as baseline_file:
+                baseline = json.load(baseline_file)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+        self.stdout.write(
+            f"\nAgainst {path} ({(baseline['meta'].get('commit') or 'unknown')[:12]}):\n"
+            f"{'':<60}{'p50 was':>9}{'p50 now':>9}{'change':>9}{'p95 was':>9}{'p95 now':>9}{'queries':>12}"
+        )
+        for section in ('endpoints', 'jobs'):
+            for name, now in report[section].items():
+                was = baseline.get(section, {}).get(name)
+                if was is None:
+                    self.stdout.write(f"{name:<60}{'new':>9}")
+                    continue
+                change = (now['p50_ms'] - was['p50_ms']) / was['p50_ms'] * 100 if was['p50_ms'] else 0.0
+                queries = f"{was['queries']:g}" + (f" -> {now['queries']:g}" if now['queries'] != was['queries'] else '')
+                line = (
+                    f"{name:<60}{was['p50_ms']:>9.2f}{now['p50_ms']:>9.2f}{change:>+8.0f}%"
+                    f"{was['p95_ms']:>9.2f}{now['p95_ms']:>9.2f}{queries:>12}"
+                )
+                if now['queries'] > was['queries'] or change > 10:
+                    line = self.style.WARNING(line)
+                self.stdout.write(line)
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.bench import timetable_problem
+from core.scheduling import solve, timetable_entries
+
+
+class Command(BaseCommand):
+    help = "Time the timetable generator on synthetic schools and report the quality of what it finds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, nargs='+', default=[50, 200, 1000])
+        parser.add_argument('--budget', type=float, default=30.0, help='Seconds per solve (default: %(default)s).')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'classes':>8}{'lessons':>9}{'greedy s':>10}{'search s':>10}{'iters':>9}"
+            f"{'hard':>7}{'soft':>7}{'rows s':>8}"
+        )
+        for classes in options['classes']:
+            problem = timetable_problem(classes, seed=options['seed'])
+            solution = solve(problem, time_budget=options['budget'], seed=options['seed'])
+            start = time.perf_counter()
+            timetable_entries(problem, solution)
+            build = time.perf_counter() - start
+            self.stdout.write(
+                f"{classes:>8}{len(problem.lessons):>9}{solution.construction_seconds:>10.2f}"
+                f"{solution.search_seconds:>10.2f}{solution.iterations:>9}"
+                f"{solution.hard_violations:>7}{solution.soft_penalty:>7}{build:>8.2f}"
+            )
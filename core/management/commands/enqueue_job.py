@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.jobs import JOBS, enqueue
+
+
+class Command(BaseCommand):
+    help = "Queue one run of a job for run_worker, e.g. reconcile_attendance_summaries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(JOBS))
+        parser.add_argument(
+            '--args', dest='job_args', default='{}', help='Keyword arguments as a JSON object.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            job_args = json.loads(options['job_args'])
+        except ValueError as exc:
+            raise CommandError(f"--args is not valid JSON: {exc}")
+        if not isinstance(job_args, dict):
+            raise CommandError("--args must be a JSON object.")
+        job = enqueue(options['name'], job_args)
+        self.stdout.write(self.style.SUCCESS(f"Queued {job}"))
@@ -0,0 +1,49 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exports import EXPORT_CHUNK_SIZE, EXPORTS, FORMATS, Export
+
+
+class Command(BaseCommand):
+    help = "Stream a whole-school export of attendance, results or fees to a CSV/JSONL file, gzipped on the fly."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument(
+            'path',
+            help="Output file, or '-' for stdout. Format and compression follow the extension "
+                 "(.csv, .jsonl, optionally .gz) unless --format/--gzip are given.",
+        )
+        parser.add_argument('--format', choices=FORMATS)
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+            help='Rows fetched per cursor round trip (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        compress = options['gzip'] or path.endswith('.gz')
+        fmt = options['format'] or ('jsonl' if path.removesuffix('.gz').endswith('.jsonl') else 'csv')
+        try:
+            export = Export(options['kind'], fmt, compress=compress, chunk_size=options['chunk_size'])
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        start = time.perf_counter()
+        written = 0
+        out = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        try:
+            for chunk in export:
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        elapsed = time.perf_counter() - start
+        self.stderr.write(self.style.SUCCESS(
+            f"{export.rows} {options['kind']} rows, {written / 1e6:.1f} MB in {elapsed:.2f}s "
+            f"({export.rows / elapsed if elapsed else 0:,.0f} rows/s)"
+        ))
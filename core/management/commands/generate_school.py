@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bench import generate_school
+from core.models import Attendance, Student
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a deterministic synthetic school at the given scale "
+        "(classes, teachers, courses, students and years of attendance, results, quizzes, "
+        "fees and timetables), in bulk inserts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--classes', type=int, default=40)
+        parser.add_argument('--teachers', type=int, default=None, help='Default: half the courses.')
+        parser.add_argument('--courses', type=int, default=30)
+        parser.add_argument('--years', type=float, default=1.0, help='School years of daily attendance.')
+        parser.add_argument('--school-days', type=int, default=190, help='Attended weekdays per school year.')
+        parser.add_argument(
+            '--attendance-ratio', type=float, default=0.25,
+            help='Share of the courses each student attends (default: %(default)s).',
+        )
+        parser.add_argument('--results', type=int, default=10, help='Results per student.')
+        parser.add_argument('--quizzes', type=int, default=20, help='Quizzes per student.')
+        parser.add_argument('--fees', type=int, default=3, help='Term fees per student.')
+        parser.add_argument('--no-timetable', action='store_true', help='Skip the weekly class timetables.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size', type=int, default=20000,
+            help='Rows per insert transaction (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        if Student.objects.exists():
+            raise CommandError(
+                'The database already has students. Generate into an empty one, '
+                'e.g. DATABASE_URL=sqlite:////tmp/school.sqlite3 after migrate.'
+            )
+        self.verbosity = options['verbosity']
+        days = round(options['years'] * options['school_days'])
+        per_student = max(1, int(options['courses'] * options['attendance_ratio']))
+        self.stdout.write(
+            f"Generating {options['students']} students in {options['classes']} classes, "
+            f"{options['courses']} courses, {days} school days: "
+            f"~{options['students'] * per_student * days:,} attendance rows"
+        )
+        self.start = time.perf_counter()
+        self.next_report = 1_000_000
+        created = generate_school(
+            students=options['students'], courses=options['courses'], classes=options['classes'],
+            teachers=options['teachers'], days=days, weekdays_only=True,
+            attendance_ratio=options['attendance_ratio'], results=options['results'],
+            quizzes=options['quizzes'], fees=options['fees'], timetable=not options['no_timetable'],
+            seed=options['seed'], batch_size=options['batch_size'], progress=self.report,
+        )
+        elapsed = time.perf_counter() - self.start
+        self.stdout.write(self.style.SUCCESS(
+            f"{created:,} attendance rows ({Attendance.objects.count():,} in the table) "
+            f"in {elapsed:.1f}s, summaries, proceedings and bitmaps included"
+        ))
+
+    def report(self, table, written):
+        # Attendance every million rows; every batch of everything with -v 2
+        if table == 'attendance' and written >= self.next_report:
+            self.next_report += 1_000_000
+        elif self.verbosity < 2:
+            return
+        self.stdout.write(f"  {table}: {written:,} rows ({time.perf_counter() - self.start:.0f}s)")
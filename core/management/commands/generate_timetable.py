@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.scheduling import load_problem_file, solve, write_timetable
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a conflict-free timetable from a JSON spec of weekly course hours, "
+        "periods, rooms and teacher availability, replacing the listed classes' current entries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('spec', help='Path of the JSON spec (see core.scheduling.load_problem).')
+        parser.add_argument('--budget', type=float, default=30.0, help='Search time budget in seconds (0 for none).')
+        parser.add_argument('--max-iterations', type=int, help='Stop the search after this many steps.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--dry-run', action='store_true', help='Solve and report without writing anything.')
+
+    def handle(self, *args, **options):
+        try:
+            problem = load_problem_file(options['spec'])
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Invalid spec: {exc}")
+        if not problem.lessons:
+            raise CommandError("The spec has no lessons to place.")
+
+        solution = solve(
+            problem, time_budget=options['budget'], max_iterations=options['max_iterations'], seed=options['seed'],
+        )
+        self.stdout.write(
+            f"{len(problem.lessons)} lessons in {problem.slots} slots: {solution.hard_violations} hard violation(s), "
+            f"soft penalty {solution.soft_penalty} after {solution.iterations} steps "
+            f"({solution.construction_seconds:.2f}s greedy, {solution.search_seconds:.2f}s search)"
+        )
+        if solution.hard_violations:
+            raise CommandError("No conflict-free timetable found; raise --budget or relax the spec.")
+        if options['dry_run']:
+            return
+
+        try:
+            written = write_timetable(problem, solution)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} timetable entries."))
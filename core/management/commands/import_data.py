@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import IMPORT_CHUNK_SIZE, IMPORTERS, create_batch, run_import
+from core.models import ImportBatch
+
+
+class Command(BaseCommand):
+    help = "Stream a CSV or JSONL file into students, attendance, results, quizzes or fees in chunked bulk writes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', nargs='?', choices=sorted(IMPORTERS))
+        parser.add_argument('path', nargs='?', help='CSV file, or JSONL with a .jsonl/.ndjson extension.')
+        parser.add_argument(
+            '--resume', type=int, metavar='BATCH_ID',
+            help='Continue an interrupted or failed import after its last committed chunk.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+            help='Rows validated and written per transaction (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if options['resume']:
+            try:
+                batch = ImportBatch.objects.get(pk=options['resume'])
+            except ImportBatch.DoesNotExist:
+                raise CommandError(f"No import batch #{options['resume']}.")
+            if batch.status == 'done':
+                raise CommandError(f"{batch} has already finished.")
+        elif options['kind'] and options['path']:
+            batch = create_batch(options['kind'], options['path'])
+        else:
+            raise CommandError('Give a kind and a path, or --resume BATCH_ID.')
+
+        self.stdout.write(f"{batch}: starting at row {batch.rows_done}")
+        start = time.perf_counter()
+        try:
+            rate = run_import(batch, chunk_size=options['chunk_size'], progress=self.report)
+        except Exception as exc:
+            raise CommandError(
+                f"{batch} failed after {batch.rows_done} rows: {exc}. "
+                f"Fix the cause and rerun with --resume {batch.pk}."
+            )
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"{batch.imported} imported, {batch.rejected} rejected of {batch.rows_done} rows "
+            f"in {elapsed:.2f}s ({rate:,.0f} rows/s)"
+        ))
+        if batch.rejected:
+            self.stdout.write(f"Rejected rows: {batch.rejects.path}")
+
+    def report(self, batch, rate):
+        if self.verbosity >= 2:
+            self.stdout.write(f"  {batch.rows_done} rows, {batch.rejected} rejected ({rate:,.0f} rows/s)")
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bitmaps import check_attendance_bitmaps, rebuild_attendance_bitmaps
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-term AttendanceBitmap rows from Attendance, or check them against it."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only compare stored bitmaps with ones packed from Attendance; exit non-zero on drift.',
+        )
+        parser.add_argument(
+            '--repair', action='store_true',
+            help='With --check, rewrite only the bitmaps that drifted.',
+        )
+        parser.add_argument(
+            '--student-batch', type=int, default=500,
+            help='Students whose attendance is read and packed at a time (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if not options['check']:
+            written, deleted = rebuild_attendance_bitmaps(student_batch=options['student_batch'])
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(
+                f"{written} bitmaps written, {deleted} stale removed in {elapsed:.2f}s"
+            ))
+            return
+
+        checked, drifted, orphaned = check_attendance_bitmaps(
+            student_batch=options['student_batch'], repair=options['repair'],
+        )
+        elapsed = time.perf_counter() - start
+        summary = f"{checked} bitmaps checked, {drifted} drifted, {orphaned} orphaned in {elapsed:.2f}s"
+        if (drifted or orphaned) and not options['repair']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary + (' (repaired)' if drifted or orphaned else '')))
@@ -0,0 +1,95 @@
+import os
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.models import SummaryRebuild
+from core.summaries import (
+    DEFAULT_CHUNK_SIZE, SHARD_SIZE, plan_rebuild, rebuild_attendance_summaries, run_rebuild,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every AttendanceSummary from one grouped aggregate and a chunked bulk upsert, "
+        "or shard by student id ranges across worker processes with --workers/--shard-size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help='Rows per bulk upsert statement (default: %(default)s).',
+        )
+        parser.add_argument(
+            '--workers', type=int,
+            help='Processes rebuilding shards concurrently, each on its own connection (default: one per CPU).',
+        )
+        parser.add_argument(
+            '--shard-size', type=int,
+            help=f'Students per shard, rebuilt and checkpointed in one transaction (default: {SHARD_SIZE}).',
+        )
+        parser.add_argument(
+            '--resume', type=int, metavar='REBUILD_ID',
+            help='Finish an interrupted or failed sharded rebuild, skipping the shards it committed.',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if not any(options[name] for name in ('workers', 'shard_size', 'resume')):
+            written, deleted = rebuild_attendance_summaries(chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(
+                f"{written} summaries written, {deleted} stale removed in {elapsed:.2f}s"
+            ))
+            return
+
+        if options['resume']:
+            try:
+                rebuild = SummaryRebuild.objects.get(pk=options['resume'])
+            except SummaryRebuild.DoesNotExist:
+                raise CommandError(f"No summary rebuild #{options['resume']}.")
+            if rebuild.status == 'done':
+                raise CommandError(f"{rebuild} has already finished.")
+        else:
+            rebuild = plan_rebuild(options['shard_size'] or SHARD_SIZE)
+        workers = options['workers'] or os.cpu_count() or 1
+        if connection.vendor == 'sqlite' and workers > 1:
+            self.stdout.write(self.style.WARNING("SQLite allows one writer at a time; running shards inline."))
+            workers = 1
+        shards = {shard.pk: shard for shard in rebuild.shards.all()}
+        pending = sum(not shard.done for shard in shards.values())
+        self.stdout.write(
+            f"{rebuild}: {pending} of {len(shards)} shard(s) of {rebuild.shard_size} students to go, "
+            f"{workers} worker(s)"
+        )
+
+        timings = []
+
+        def report(outcome):
+            pk, written, deleted, seconds = outcome
+            timings.append(seconds)
+            if options['verbosity'] >= 2:
+                shard = shards[pk]
+                self.stdout.write(
+                    f"  students {shard.first_student}-{shard.last_student or ''}: "
+                    f"{written} written, {deleted} removed in {seconds:.2f}s"
+                )
+
+        try:
+            written, deleted = run_rebuild(rebuild, workers=workers, chunk_size=options['chunk_size'], progress=report)
+        except Exception as exc:
+            raise CommandError(
+                f"Summary rebuild #{rebuild.pk} failed after {len(timings)} more shard(s): {exc}. "
+                f"Fix the cause and rerun with --resume {rebuild.pk}."
+            )
+        elapsed = time.perf_counter() - start
+        if timings:
+            self.stdout.write(
+                f"shard seconds: min {min(timings):.2f}, median {statistics.median(timings):.2f}, "
+                f"max {max(timings):.2f}, sum {sum(timings):.2f}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{written} summaries written, {deleted} stale removed in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.proceedings import DEFAULT_CHUNK_SIZE, check_class_proceedings, rebuild_class_proceedings
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized ClassProceeding rows, or check them against the live Attendance aggregate."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help='Rows per bulk upsert statement (default: %(default)s).',
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only compare stored rows with the live aggregate; exit non-zero on drift.',
+        )
+        parser.add_argument(
+            '--repair', action='store_true',
+            help='With --check, rewrite only the rows that drifted.',
+        )
+        parser.add_argument(
+            '--student-batch', type=int, default=500,
+            help='Students compared per aggregate query with --check (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if not options['check']:
+            written, deleted = rebuild_class_proceedings(chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(
+                f"{written} proceedings written, {deleted} stale removed in {elapsed:.2f}s"
+            ))
+            return
+
+        checked, drifted, orphaned = check_class_proceedings(
+            student_batch=options['student_batch'], repair=options['repair'],
+        )
+        elapsed = time.perf_counter() - start
+        summary = f"{checked} proceedings checked, {drifted} drifted, {orphaned} orphaned in {elapsed:.2f}s"
+        if (drifted or orphaned) and not options['repair']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary + (' (repaired)' if drifted or orphaned else '')))
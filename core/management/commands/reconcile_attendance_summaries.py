@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.summaries import reconcile_attendance_summaries
+
+
+class Command(BaseCommand):
+    help = "Detect and repair drift between AttendanceSummary counters and Attendance rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--student-batch', type=int, default=500,
+            help='Students checked per aggregate query (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        checked, repaired, removed = reconcile_attendance_summaries(student_batch=options['student_batch'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"{checked} summaries checked, {repaired} repaired, {removed} stale removed in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.ledger import reconcile_fee_ledger
+
+
+class Command(BaseCommand):
+    help = "Detect and repair drift between the fee ledger's balances and its fees and payments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only compare; exit non-zero on drift instead of repairing it.',
+        )
+        parser.add_argument(
+            '--student-batch', type=int, default=500,
+            help='Students checked per batch of aggregate queries (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        counts = reconcile_fee_ledger(student_batch=options['student_batch'], repair=not options['check'])
+        elapsed = time.perf_counter() - start
+        summary = ', '.join(f"{checked} {name} checked ({drifted} drifted)" for name, (checked, drifted) in counts.items())
+        summary += f" in {elapsed:.2f}s"
+        drifted = any(drifted for _, drifted in counts.values())
+        if drifted and options['check']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary + (' (repaired)' if drifted else '')))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from core.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = "Run queued and periodic jobs (core/tasks.py) on a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, help='Pool size (default: JOB_WORKER setting, else one per CPU).')
+        parser.add_argument('--poll-interval', type=float, help='Seconds between queue checks while idle.')
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is due or running.')
+        parser.add_argument(
+            '--no-schedule', action='store_true',
+            help='Only run queued jobs; leave periodic scheduling to other workers.',
+        )
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] >= 2 else None
+        worker = Worker(
+            processes=options['processes'], poll_interval=options['poll_interval'],
+            schedule=not options['no_schedule'], log=log,
+        )
+        worker.install_signal_handlers()
+        self.stdout.write(f"Worker {worker.name} running {worker.processes} process(es)")
+        worker.run(once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker.name} stopped"))
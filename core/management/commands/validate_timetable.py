@@ -0,0 +1,32 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from core.conflicts import validate_timetable
+
+
+class Command(BaseCommand):
+    help = "Find overlapping timetable slots per teacher, room and class in one sweep-line pass."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the conflicts as a JSON list.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        conflicts = validate_timetable()
+        elapsed = time.perf_counter() - start
+
+        if options['json']:
+            self.stdout.write(json.dumps(conflicts, cls=DjangoJSONEncoder, indent=2))
+        else:
+            for c in conflicts:
+                self.stdout.write(
+                    f"{c['day']} {c['dimension']}={c['value']}: entry {c['entry']} overlaps "
+                    f"{c['conflicts_with']} ({c['subject']} {c['start_time']:%H:%M}-{c['end_time']:%H:%M})"
+                )
+        summary = f"{len(conflicts)} conflict(s) found in {elapsed:.2f}s"
+        if conflicts:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
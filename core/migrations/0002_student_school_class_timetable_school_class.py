@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def assign_timetable_classes(apps, schema_editor):
+    """
+    Point each existing timetable entry at a SchoolClass named after its
+    free-text section (created, with the entry's teacher, if missing), so
+    the column can become non-null without inventing a class id.
+    """
+    SchoolClass = apps.get_model('core', 'SchoolClass')
+    Timetable = apps.get_model('core', 'Timetable')
+    classes = {}
+    for entry in Timetable.objects.filter(school_class__isnull=True).order_by('pk'):
+        name = (entry.section or 'Unassigned')[:50]
+        if name not in classes:
+            classes[name] = (
+                SchoolClass.objects.filter(name=name).order_by('pk').first()
+                or SchoolClass.objects.create(name=name, teacher_id=entry.teacher_id)
+            )
+        entry.school_class = classes[name]
+        entry.save(update_fields=['school_class'])
+    if schema_editor.connection.vendor == 'postgresql':
+        # The AlterField below cannot run with deferred FK checks pending
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='timetable',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='school_class',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.schoolclass'),
+        ),
+        migrations.AddField(
+            model_name='timetable',
+            name='school_class',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='timetable_entries', to='core.schoolclass'),
+        ),
+        migrations.RunPython(assign_timetable_classes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='timetable',
+            name='school_class',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timetable_entries', to='core.schoolclass'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timetable',
+            unique_together={('day', 'start_time', 'school_class')},
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:08
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_counters(apps, schema_editor):
+    """Fill the new counters (and percentage) from the live Attendance aggregate."""
+    Attendance = apps.get_model('core', 'Attendance')
+    AttendanceSummary = apps.get_model('core', 'AttendanceSummary')
+
+    totals = (
+        Attendance.objects.values_list('student_id', 'course_id')
+        .annotate(total=Count('id'), present=Count('id', filter=Q(status='Present')))
+        .order_by()
+    )
+    batch = []
+    for student_id, course_id, total, present in totals.iterator(chunk_size=2000):
+        batch.append(AttendanceSummary(
+            student_id=student_id, course_id=course_id, total=total, present=present,
+            percentage=(Decimal(present * 100) / Decimal(total)).quantize(Decimal('0.01')),
+        ))
+        if len(batch) >= 2000:
+            AttendanceSummary.objects.bulk_create(
+                batch, update_conflicts=True, unique_fields=['student', 'course'],
+                update_fields=['total', 'present', 'percentage', 'last_updated'],
+            )
+            batch = []
+    if batch:
+        AttendanceSummary.objects.bulk_create(
+            batch, update_conflicts=True, unique_fields=['student', 'course'],
+            update_fields=['total', 'present', 'percentage', 'last_updated'],
+        )
+    # Summaries for pairs without attendance were zero-filled by the old task.
+    AttendanceSummary.objects.filter(total=0).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_student_school_class_timetable_school_class'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancesummary',
+            name='present',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='attendancesummary',
+            name='total',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_attendancesummary_counters'),
+    ]
+
+    # Build the composite/covering indexes before dropping the single-column
+    # FK indexes they replace.
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['student', 'course', 'date'], name='attendance_student_course_date'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['student', 'status'], name='attendance_student_status'),
+        ),
+        migrations.AddIndex(
+            model_name='fee',
+            index=models.Index(fields=['student'], include=('amount', 'paid'), name='fee_student_cover'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['student'], include=('subject', 'date', 'score'), name='quiz_student_cover'),
+        ),
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['student'], include=('subject', 'score', 'grade'), name='result_student_cover'),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='attendances', to='core.student'),
+        ),
+        migrations.AlterField(
+            model_name='fee',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.student'),
+        ),
+        migrations.AlterField(
+            model_name='quiz',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.student'),
+        ),
+        migrations.AlterField(
+            model_name='result',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.student'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Q
+
+
+def drop_unkeyed_rows(apps, schema_editor):
+    # Rows entered by hand through the admin belong to no student or course.
+    apps.get_model('core', 'ClassProceeding').objects.all().delete()
+
+
+def backfill_proceedings(apps, schema_editor):
+    """Materialize one row per (student, course) pair from the live Attendance aggregate."""
+    Attendance = apps.get_model('core', 'Attendance')
+    ClassProceeding = apps.get_model('core', 'ClassProceeding')
+
+    totals = (
+        Attendance.objects.values_list('student_id', 'course_id')
+        .annotate(
+            subject=F('course__subject'),
+            teacher_first_name=F('course__teacher__first_name'),
+            teacher_last_name=F('course__teacher__last_name'),
+            section=F('student__school_class__name'),
+            total=Count('id'),
+            attended=Count('id', filter=Q(status='Present')),
+        )
+        .order_by()
+        .values_list(
+            'student_id', 'course_id', 'subject', 'teacher_first_name', 'teacher_last_name',
+            'section', 'total', 'attended',
+        )
+    )
+    batch = []
+    for student_id, course_id, subject, first_name, last_name, section, total, attended in totals.iterator(chunk_size=2000):
+        batch.append(ClassProceeding(
+            student_id=student_id, course_id=course_id, subject=subject,
+            teacher=f"{first_name} {last_name}", section=section or 'N/A',
+            total_classes=total, attended=attended, absent=total - attended,
+        ))
+        if len(batch) >= 2000:
+            ClassProceeding.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        ClassProceeding.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_delta_sync'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_unkeyed_rows, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='classproceeding',
+            name='course',
+            field=models.ForeignKey(default=0, on_delete=django.db.models.deletion.CASCADE, to='core.course'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='classproceeding',
+            name='student',
+            field=models.ForeignKey(default=0, on_delete=django.db.models.deletion.CASCADE, related_name='proceedings', to='core.student'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='classproceeding',
+            name='absent',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='classproceeding',
+            name='attended',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='classproceeding',
+            name='subject',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='classproceeding',
+            name='total_classes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='classproceeding',
+            unique_together={('student', 'course')},
+        ),
+        migrations.RunPython(backfill_proceedings, migrations.RunPython.noop),
+    ]
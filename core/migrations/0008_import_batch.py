@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_materialized_class_proceedings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('students', 'Students'), ('attendance', 'Attendance'), ('results', 'Results'), ('quizzes', 'Quizzes'), ('fees', 'Fees')], max_length=20)),
+                ('source', models.FileField(upload_to='imports/')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('rows_done', models.IntegerField(default=0)),
+                ('imported', models.IntegerField(default=0)),
+                ('rejected', models.IntegerField(default=0)),
+                ('rejects', models.FileField(blank=True, upload_to='imports/rejects/')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
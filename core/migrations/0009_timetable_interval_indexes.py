@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_import_batch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timetable',
+            index=models.Index(fields=['day', 'teacher', 'start_time'], name='timetable_day_teacher'),
+        ),
+        migrations.AddIndex(
+            model_name='timetable',
+            index=models.Index(fields=['day', 'room', 'start_time'], name='timetable_day_room'),
+        ),
+        migrations.AddIndex(
+            model_name='timetable',
+            index=models.Index(fields=['day', 'school_class', 'start_time'], name='timetable_day_class'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummaryRebuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard_size', models.IntegerField()),
+                ('status', models.CharField(choices=[('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='running', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SummaryRebuildShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_student', models.BigIntegerField()),
+                ('last_student', models.BigIntegerField(blank=True, null=True)),
+                ('done', models.BooleanField(default=False)),
+                ('written', models.IntegerField(default=0)),
+                ('deleted', models.IntegerField(default=0)),
+                ('seconds', models.FloatField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('rebuild', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='core.summaryrebuild')),
+            ],
+            options={
+                'ordering': ['first_student'],
+            },
+        ),
+    ]
@@ -0,0 +1,144 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:06
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def backfill_ledger(apps, schema_editor):
+    """
+    A fee marked paid before the ledger gets one payment for its full
+    amount; then amount_paid and the student and class balances are filled.
+    """
+    Fee = apps.get_model('core', 'Fee')
+    FeePayment = apps.get_model('core', 'FeePayment')
+    Student = apps.get_model('core', 'Student')
+    StudentBalance = apps.get_model('core', 'StudentBalance')
+    ClassBalance = apps.get_model('core', 'ClassBalance')
+
+    FeePayment.objects.bulk_create(
+        (
+            FeePayment(fee_id=pk, student_id=student_id, amount=amount, paid_at=updated_at,
+                       method='other', reference='Marked paid before the ledger')
+            for pk, student_id, amount, updated_at in Fee.objects.filter(paid=True)
+            .values_list('pk', 'student_id', 'amount', 'updated_at').iterator(chunk_size=2000)
+        ),
+        batch_size=2000,
+    )
+    Fee.objects.filter(paid=True).update(amount_paid=F('amount'))
+
+    totals = {
+        student_id: (charged, paid)
+        for student_id, charged, paid in Fee.objects.values_list('student_id')
+        .annotate(Sum('amount'), Sum('amount_paid')).order_by()
+    }
+    class_totals = defaultdict(lambda: (Decimal('0.00'), Decimal('0.00')))
+    balances = []
+    for student_id, school_class_id in Student.objects.values_list('pk', 'school_class_id').iterator(chunk_size=2000):
+        charged, paid = totals.get(student_id, (Decimal('0.00'), Decimal('0.00')))
+        balances.append(StudentBalance(
+            student_id=student_id, school_class_id=school_class_id,
+            charged=charged, paid=paid, outstanding=charged - paid,
+        ))
+        if school_class_id is not None:
+            class_charged, class_paid = class_totals[school_class_id]
+            class_totals[school_class_id] = (class_charged + charged, class_paid + paid)
+    StudentBalance.objects.bulk_create(balances, batch_size=2000)
+    ClassBalance.objects.bulk_create(
+        [
+            ClassBalance(school_class_id=pk, charged=charged, paid=paid, outstanding=charged - paid)
+            for pk, (charged, paid) in class_totals.items()
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_summary_rebuild_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassBalance',
+            fields=[
+                ('school_class', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='core.schoolclass')),
+                ('charged', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FeePayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('method', models.CharField(choices=[('cash', 'Cash'), ('card', 'Card'), ('transfer', 'Bank transfer'), ('other', 'Other')], default='cash', max_length=10)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('paid_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StudentBalance',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='balance', serialize=False, to='core.student')),
+                ('charged', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fee',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='fee',
+            name='term',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='fee',
+            constraint=models.UniqueConstraint(condition=models.Q(('term', ''), _negated=True), fields=('student', 'term'), name='fee_unique_student_term'),
+        ),
+        migrations.AddIndex(
+            model_name='classbalance',
+            index=models.Index(fields=['-outstanding', 'school_class'], name='class_balance_outstanding'),
+        ),
+        migrations.AddField(
+            model_name='feepayment',
+            name='fee',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='core.fee'),
+        ),
+        migrations.AddField(
+            model_name='feepayment',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.student'),
+        ),
+        migrations.AddField(
+            model_name='studentbalance',
+            name='school_class',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.schoolclass'),
+        ),
+        migrations.AddIndex(
+            model_name='feepayment',
+            index=models.Index(fields=['student', 'paid_at'], name='payment_student_paid_at'),
+        ),
+        migrations.AddIndex(
+            model_name='studentbalance',
+            index=models.Index(fields=['-outstanding', 'student'], name='balance_outstanding'),
+        ),
+        migrations.AddIndex(
+            model_name='studentbalance',
+            index=models.Index(fields=['school_class', '-outstanding', 'student'], name='balance_class_outstanding'),
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:43
+
+from datetime import date
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copy of core.bitmaps as it stood when this migration was written,
+# so later changes there cannot alter it.
+def term_of(day):
+    """(label, start, days) of the term the day falls in."""
+    starts = [tuple(start) for start in getattr(settings, 'ATTENDANCE_TERM_STARTS', ((1, 1), (5, 1), (9, 1)))]
+    year, number = day.year, len(starts)
+    while number and (day.month, day.day) < starts[number - 1]:
+        number -= 1
+    if not number:
+        year, number = year - 1, len(starts)
+    start = date(year, *starts[number - 1])
+    end = date(year, *starts[number]) if number < len(starts) else date(year + 1, *starts[0])
+    return f'{year}-T{number}', start, (end - start).days
+
+
+def pack_bitmaps(rows):
+    """
+    (held, present) bit strings, LSB first, per (student_id, course_id,
+    label, start) of (student_id, course_id, date, status) rows.
+    """
+    bitmaps = {}
+    for student_id, course_id, day, status in rows:
+        label, start, days = term_of(day)
+        held, present = bitmaps.setdefault(
+            (student_id, course_id, label, start), (bytearray((days + 7) // 8), bytearray((days + 7) // 8)),
+        )
+        bit = (day - start).days
+        held[bit // 8] |= 1 << bit % 8
+        if status == 'Present':
+            present[bit // 8] |= 1 << bit % 8
+    return bitmaps
+
+
+def backfill_bitmaps(apps, schema_editor):
+    """Pack the existing attendance into bitmaps, 500 students at a time."""
+    Attendance = apps.get_model('core', 'Attendance')
+    AttendanceBitmap = apps.get_model('core', 'AttendanceBitmap')
+    Student = apps.get_model('core', 'Student')
+
+    student_ids = list(Student.objects.order_by('pk').values_list('pk', flat=True))
+    for offset in range(0, len(student_ids), 500):
+        batch = student_ids[offset:offset + 500]
+        rows = Attendance.objects.filter(student_id__gte=batch[0], student_id__lte=batch[-1]).order_by()
+        AttendanceBitmap.objects.bulk_create(
+            [
+                AttendanceBitmap(
+                    student_id=student_id, course_id=course_id, term=label, start=start,
+                    held=bytes(held), present=bytes(present),
+                )
+                for (student_id, course_id, label, start), (held, present) in pack_bitmaps(
+                    rows.values_list('student_id', 'course_id', 'date', 'status').iterator()
+                ).items()
+            ],
+            batch_size=2000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_fee_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=10)),
+                ('start', models.DateField()),
+                ('held', models.BinaryField()),
+                ('present', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.course')),
+                ('student', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_bitmaps', to='core.student')),
+            ],
+            options={
+                'unique_together': {('student', 'course', 'term')},
+            },
+        ),
+        migrations.RunPython(backfill_bitmaps, migrations.RunPython.noop),
+    ]
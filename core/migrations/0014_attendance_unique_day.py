@@ -0,0 +1,111 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:57
+
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+# Frozen copies of core.bitmaps and core.summaries as they stood when this
+# migration was written, so later changes there cannot alter it.
+def term_of(day):
+    """(label, start, days) of the term the day falls in."""
+    starts = [tuple(start) for start in getattr(settings, 'ATTENDANCE_TERM_STARTS', ((1, 1), (5, 1), (9, 1)))]
+    year, number = day.year, len(starts)
+    while number and (day.month, day.day) < starts[number - 1]:
+        number -= 1
+    if not number:
+        year, number = year - 1, len(starts)
+    start = date(year, *starts[number - 1])
+    end = date(year, *starts[number]) if number < len(starts) else date(year + 1, *starts[0])
+    return f'{year}-T{number}', start, (end - start).days
+
+
+def pack_bitmaps(rows):
+    """{(label, start): (held, present)} bit strings of one pair's (date, status) rows, LSB first."""
+    bitmaps = {}
+    for day, status in rows:
+        label, start, days = term_of(day)
+        held, present = bitmaps.setdefault((label, start), (bytearray((days + 7) // 8), bytearray((days + 7) // 8)))
+        bit = (day - start).days
+        held[bit // 8] |= 1 << bit % 8
+        if status == 'Present':
+            present[bit // 8] |= 1 << bit % 8
+    return bitmaps
+
+
+def attendance_percentage(total, present):
+    if not total:
+        return Decimal('0.00')
+    return (Decimal(present * 100) / Decimal(total)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def drop_duplicate_days(apps, schema_editor):
+    """
+    Keep the newest mark of each (student, course, date) that was recorded
+    more than once, tombstone the others for delta sync, and recount the
+    summaries, proceedings and bitmaps of the pairs that lost rows.
+    """
+    Attendance = apps.get_model('core', 'Attendance')
+    AttendanceBitmap = apps.get_model('core', 'AttendanceBitmap')
+    AttendanceSummary = apps.get_model('core', 'AttendanceSummary')
+    ClassProceeding = apps.get_model('core', 'ClassProceeding')
+    Tombstone = apps.get_model('core', 'Tombstone')
+
+    duplicates = (
+        Attendance.objects.values('student_id', 'course_id', 'date')
+        .annotate(rows=Count('id'), keep=Max('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    pairs = set()
+    for key in duplicates.iterator():
+        extra = list(
+            Attendance.objects.filter(student_id=key['student_id'], course_id=key['course_id'], date=key['date'])
+            .exclude(pk=key['keep']).values_list('pk', flat=True)
+        )
+        Tombstone.objects.bulk_create([
+            Tombstone(model='core.attendance', object_id=pk, student_id=key['student_id']) for pk in extra
+        ])
+        Attendance.objects.filter(pk__in=extra).delete()
+        pairs.add((key['student_id'], key['course_id']))
+
+    for student_id, course_id in pairs:
+        rows = Attendance.objects.filter(student_id=student_id, course_id=course_id).order_by()
+        totals = rows.aggregate(total=Count('id'), present=Count('id', filter=Q(status='Present')))
+        AttendanceSummary.objects.filter(student_id=student_id, course_id=course_id).update(
+            total=totals['total'], present=totals['present'],
+            percentage=attendance_percentage(totals['total'], totals['present']),
+        )
+        ClassProceeding.objects.filter(student_id=student_id, course_id=course_id).update(
+            total_classes=totals['total'], attended=totals['present'], absent=totals['total'] - totals['present'],
+        )
+        AttendanceBitmap.objects.filter(student_id=student_id, course_id=course_id).delete()
+        AttendanceBitmap.objects.bulk_create([
+            AttendanceBitmap(
+                student_id=student_id, course_id=course_id, term=label, start=start,
+                held=bytes(held), present=bytes(present),
+            )
+            for (label, start), (held, present) in pack_bitmaps(rows.values_list('date', 'status')).items()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_attendance_bitmaps'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_days, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='attendance',
+            name='attendance_student_course_date',
+        ),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(fields=('student', 'course', 'date'), name='attendance_student_course_date'),
+        ),
+    ]
@@ -0,0 +1,222 @@
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .cache import is_process_local
+from .models import Student
+from .serializers import requested_fields
+from .sync import changes_since
+from .versions import etag_for
+
+# Students are re-linked to users rarely; keep resolved lookups for 10 minutes
+# in a shared cache. forget_students() cannot reach other workers' in-process
+# caches, so there a re-linked Student is only served for a few seconds.
+STUDENT_CACHE_TIMEOUT = 600
+LOCAL_STUDENT_CACHE_TIMEOUT = 5
+
+# Cached when the user has no Student, so the miss is not repeated either.
+NO_STUDENT = 'none'
+
+
+def student_cache_key(request):
+    """Cache key for the request's credentials: the auth token, or the user id for session/forced auth."""
+    token_key = getattr(request.auth, 'key', None)
+    if token_key:
+        return f'student-for-token:{token_key}'
+    return f'student-for-user:{request.user.pk}'
+
+
+def resolve_student(request):
+    """
+    Return the Student linked to request.user, with school_class preloaded.
+
+    The result is attached to the request (so every later lookup in the same
+    request is free) and to the shared cache keyed by token (so repeat
+    requests skip the query entirely). Returns None for users without a
+    Student record.
+    """
+    if hasattr(request, 'student'):
+        return request.student
+    student = None
+    # CachedTokenAuthentication already knows whether the user has a Student.
+    known_student_id = getattr(request.auth, 'student_id', NO_STUDENT)
+    if request.user.is_authenticated and known_student_id is not None:
+        key = student_cache_key(request)
+        student = cache.get(key)
+        if student is None:
+            student = (
+                Student.objects.select_related('school_class').filter(user_id=request.user.pk).first()
+                or NO_STUDENT
+            )
+            cache.set(
+                key, student, LOCAL_STUDENT_CACHE_TIMEOUT if is_process_local() else STUDENT_CACHE_TIMEOUT,
+            )
+        if student == NO_STUDENT:
+            student = None
+    request.student = student
+    # Also visible to middleware, which only sees the Django HttpRequest.
+    getattr(request, '_request', request).student = student
+    return student
+
+
+def forget_students(user_ids, token_keys=()):
+    """Drop cached Student lookups for the given users (all their tokens and the user-id key)."""
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    token_keys = list(token_keys)
+    if user_ids:
+        token_keys += Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True)
+    keys = [f'student-for-token:{token_key}' for token_key in token_keys]
+    keys += [f'student-for-user:{user_id}' for user_id in user_ids]
+    if keys:
+        cache.delete_many(keys)
+
+
+class StudentResolverMixin:
+    """Resolves request.student once, right after authentication."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        resolve_student(request)
+
+
+class StudentScopedMixin(StudentResolverMixin):
+    """
+    Scopes the queryset to request.student by `student_field` directly
+    instead of joining through auth_user. Views without a linked Student
+    get an empty queryset.
+    """
+    student_field = 'student_id'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.student is None:
+            return queryset.none()
+        return queryset.filter(**{self.student_field: self.request.student.pk})
+
+
+class SparseFieldsMixin:
+    """
+    Narrows the SELECT to the columns behind the serializer fields kept by
+    ?fields= (see SparseFieldsetMixin in core/serializers.py). Falls back to
+    full rows when a kept field is computed (source='*' or a property).
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if requested_fields(self.request) is None or not isinstance(queryset, QuerySet):
+            return queryset
+
+        model_fields = {field.name: field for field in queryset.model._meta.concrete_fields}
+        columns = {ordering.lstrip('-') for ordering in getattr(self, 'keyset_ordering', ())}
+        related = set()
+        for field in self.get_serializer().fields.values():
+            head, _, rest = field.source.partition('.')
+            if field.source == '*' or head not in model_fields:
+                return queryset
+            if rest and model_fields[head].is_relation:
+                related.add(head)
+                columns.add(f"{head}__{rest.replace('.', '__')}")
+            else:
+                columns.add(head)
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
+
+
+class DeltaSyncMixin:
+    """
+    ?since=<token> turns list into a delta sync: only rows changed after the
+    token, ids deleted after it, and a new token to send next time. An empty
+    token (?since=) is an initial full sync.
+
+    The changed rows are paged with the view's keyset pagination; `next`
+    carries the cursor and the sync's token (?sync_token=), and deleted ids
+    come with the first page only. Clients follow `next` to the end before
+    storing `token`.
+    """
+    sync_token_query_param = 'sync_token'
+
+    def get_sync_scope(self):
+        """Tombstone filter matching what this user can see (see core.models.Tombstone)."""
+        student = self.request.student
+        return {'student_id': student.pk if student else None}
+
+    def list(self, request, *args, **kwargs):
+        if 'since' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        changed, deleted, token, reset = changes_since(
+            self.filter_queryset(self.get_queryset()), request.query_params['since'], self.get_sync_scope(),
+            issued=request.query_params.get(self.sync_token_query_param),
+        )
+        page = self.paginate_queryset(changed)
+        next_link = self.paginator.get_next_link()
+        if next_link:
+            next_link = replace_query_param(next_link, self.sync_token_query_param, token)
+        return Response({
+            'token': token,
+            'reset': reset,
+            'changed': self.get_serializer(page, many=True).data,
+            'deleted': [] if request.query_params.get(self.paginator.cursor_query_param) else deleted,
+            'next': next_link,
+        })
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+    default_detail = ''
+
+
+class ConditionalGetMixin:
+    """
+    Answers If-None-Match with 304 straight after authentication, before
+    any queryset or serializer runs, using the version stamps in
+    core/versions.py. Views list what they depend on in
+    get_version_dependencies(); returning None opts a request out.
+
+    Must come before the Student mixins so request.student is resolved.
+    """
+    version_resources = ()
+
+    def get_version_dependencies(self):
+        """
+        `version_resources` entries are either a resource name, scoped to
+        request.student, or a fixed (resource, scope) pair such as CATALOG.
+        """
+        student = getattr(self.request, 'student', None)
+        scope = student.pk if student else 'none'
+        return [
+            resource if isinstance(resource, tuple) else (resource, scope)
+            for resource in self.version_resources
+        ]
+
+    def get_etag_variant(self):
+        return ''
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        if request.method not in ('GET', 'HEAD'):
+            return
+        dependencies = self.get_version_dependencies()
+        if dependencies is None:
+            return
+        self.etag = etag_for(request, dependencies, self.get_etag_variant())
+        if self.etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': self.etag})
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'etag', None) and response.status_code == status.HTTP_200_OK:
+            response['ETag'] = self.etag
+        return response
@@ -1,5 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .querysets import AttendanceQuerySet, LedgerQuerySet, TrackedQuerySet
 
 class Teacher(models.Model):
     first_name = models.CharField(max_length=50)
@@ -43,15 +46,130 @@ class SchoolClass(models.Model):
         return self.name
 
 class Attendance(models.Model):
-    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="attendances")
+    objects = AttendanceQuerySet.as_manager()
+
+    # student is indexed through the composite indexes below, which lead with it.
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="attendances", db_index=False)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     date = models.DateField()
     status = models.CharField(max_length=10, choices=[("Present", "Present"), ("Absent", "Absent")], default="Present")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Delta sync: a student's rows changed since a token
+            models.Index(fields=['student', 'updated_at'], name='attendance_student_updated'),
+            models.Index(fields=['student', 'status'], name='attendance_student_status'),
+            # Keyset pagination of a student's attendance by (date, id)
+            models.Index(fields=['student', 'date', 'id'], name='attendance_student_date'),
+        ]
+        constraints = [
+            # One mark per student, course and day; the roll call upserts on it.
+            # Its index also serves student-scoped listings and the per-course
+            # GROUP BY behind ClassProceeding.
+            models.UniqueConstraint(fields=['student', 'course', 'date'], name='attendance_student_course_date'),
+        ]
 
 class Fee(models.Model):
-    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    objects = LedgerQuerySet.as_manager()
+
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, db_index=False)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Sum of the FeePayment rows against this fee, kept by core/ledger.py;
+    # `paid` follows it (amount_paid >= amount). Neither is written directly.
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     paid = models.BooleanField(default=False)
+    # Set on fees issued to a whole class at once (core/ledger.py issue_term_fees)
+    term = models.CharField(max_length=20, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'updated_at'], name='fee_student_updated'),
+            # Covering index for FeeViewSet (INCLUDE columns are PostgreSQL-only)
+            models.Index(fields=['student'], include=['amount', 'paid'], name='fee_student_cover'),
+        ]
+        constraints = [
+            # A class is billed once per term; re-issuing skips students already billed.
+            models.UniqueConstraint(
+                fields=['student', 'term'], condition=~models.Q(term=''), name='fee_unique_student_term',
+            ),
+        ]
+
+
+class FeePayment(models.Model):
+    """A payment against one Fee. The ledger's balances are sums of these."""
+    METHOD_CHOICES = [
+        ('cash', 'Cash'),
+        ('card', 'Card'),
+        ('transfer', 'Bank transfer'),
+        ('other', 'Other'),
+    ]
+
+    objects = LedgerQuerySet.as_manager()
+
+    fee = models.ForeignKey(Fee, on_delete=models.CASCADE, related_name='payments')
+    # Copied from the fee, so a student's payments are listed without a join
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, db_index=False)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    method = models.CharField(max_length=10, choices=METHOD_CHOICES, default='cash')
+    reference = models.CharField(max_length=100, blank=True)
+    paid_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'paid_at'], name='payment_student_paid_at'),
+        ]
+
+
+class StudentBalance(models.Model):
+    """
+    Running fee totals of one student (outstanding = charged - paid),
+    shifted in the same transaction as every Fee and FeePayment write
+    (core/ledger.py). Stored rather than summed so that "who owes the most"
+    is read off an index.
+    """
+    # Not CASCADE: the balance outlives the student's fees and payments
+    # while a delete cascades through them, and is dropped afterwards
+    # (core/signals.py). The FK constraint is checked at commit.
+    student = models.OneToOneField(
+        Student, on_delete=models.DO_NOTHING, primary_key=True, related_name='balance',
+    )
+    # The class whose ClassBalance this balance is counted in
+    school_class = models.ForeignKey(SchoolClass, on_delete=models.SET_NULL, null=True, blank=True, db_index=False)
+    charged = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-outstanding', 'student'], name='balance_outstanding'),
+            models.Index(fields=['school_class', '-outstanding', 'student'], name='balance_class_outstanding'),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id}: {self.outstanding}"
+
+
+class ClassBalance(models.Model):
+    """The StudentBalance totals of one class's members."""
+    school_class = models.OneToOneField(
+        SchoolClass, on_delete=models.CASCADE, primary_key=True, related_name='balance',
+    )
+    charged = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-outstanding', 'school_class'], name='class_balance_outstanding'),
+        ]
+
+    def __str__(self):
+        return f"{self.school_class_id}: {self.outstanding}"
 
 # In core/models.py
 class Timetable(models.Model):
@@ -66,6 +184,8 @@ class Timetable(models.Model):
         ('Sun', 'Sunday'),
     ]
     
+    objects = TrackedQuerySet.as_manager()
+
     # CRITICAL FIX: The link to SchoolClass must exist for filtering!
     school_class = models.ForeignKey(SchoolClass, on_delete=models.CASCADE, related_name="timetable_entries")
     
@@ -82,38 +202,77 @@ class Timetable(models.Model):
     section = models.CharField(max_length=50, blank=True, null=True)
     courseCode = models.CharField(max_length=15, blank=True, null=True) 
     status = models.CharField(max_length=10, blank=True, null=True) 
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         # Note: If you add 'school_class' here, you must run migrations.
         unique_together = ('day', 'start_time', 'school_class') 
         ordering = ['day', 'start_time']
+        indexes = [
+            models.Index(fields=['school_class', 'updated_at'], name='timetable_class_updated'),
+            # Interval lookups for conflict detection (core/conflicts.py)
+            models.Index(fields=['day', 'teacher', 'start_time'], name='timetable_day_teacher'),
+            models.Index(fields=['day', 'room', 'start_time'], name='timetable_day_room'),
+            models.Index(fields=['day', 'school_class', 'start_time'], name='timetable_day_class'),
+        ]
 
     def __str__(self):
         teacher_name = f"{self.teacher.first_name} {self.teacher.last_name}" if self.teacher else "No teacher"
         return f"{self.day} - {self.subject} ({teacher_name}) {self.start_time}-{self.end_time}"
         
 class ClassProceeding(models.Model):
-    subject = models.CharField(max_length=100)
+    # Materialized per-(student, course) rollup of Attendance behind
+    # /api/proceedings/, maintained on every Attendance write (core/proceedings.py).
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="proceedings")
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+
+    # Display fields, copied from Course / Teacher / SchoolClass and kept in step by signals
+    subject = models.CharField(max_length=200)
     teacher = models.CharField(max_length=100)
     section = models.CharField(max_length=50)
-    total_classes = models.IntegerField()
-    attended = models.IntegerField()
-    absent = models.IntegerField()
+
+    total_classes = models.IntegerField(default=0)
+    attended = models.IntegerField(default=0)
+    absent = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('student', 'course')
+
+    def __str__(self):
+        return f"{self.student} - {self.subject}: {self.attended}/{self.total_classes}"
 
 class Result(models.Model):
-    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    objects = TrackedQuerySet.as_manager()
+
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, db_index=False)
     subject = models.CharField(max_length=100)
     score = models.IntegerField()
     grade = models.CharField(max_length=10)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'updated_at'], name='result_student_updated'),
+            models.Index(fields=['student'], include=['subject', 'score', 'grade'], name='result_student_cover'),
+        ]
 
     def __str__(self):
         return f"{self.student}'s result for {self.subject}"
 
 class Quiz(models.Model):
-    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    objects = TrackedQuerySet.as_manager()
+
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, db_index=False)
     subject = models.CharField(max_length=100)
     date = models.DateField()
     score = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'updated_at'], name='quiz_student_updated'),
+            models.Index(fields=['student'], include=['subject', 'date', 'score'], name='quiz_student_cover'),
+        ]
 
     def __str__(self):
         return f"{self.student}'s quiz in {self.subject}"
@@ -125,7 +284,11 @@ class AttendanceSummary(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     course = models.ForeignKey(Course, on_delete=models.CASCADE) 
     
-    # The final, calculated percentage
+    # Running counters, kept current on every Attendance write (see core/signals.py)
+    total = models.IntegerField(default=0)
+    present = models.IntegerField(default=0)
+
+    # The final, calculated percentage (derived from the counters above)
     percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0.0) 
     last_updated = models.DateTimeField(auto_now=True)
 
@@ -134,4 +297,174 @@ class AttendanceSummary(models.Model):
         unique_together = ('student', 'course') 
 
     def __str__(self):
-        return f"{self.student.first_name} - {self.course.name}: {self.percentage}%"
\ No newline at end of file
+        return f"{self.student.first_name} - {self.course.name}: {self.percentage}%"
+
+class AttendanceBitmap(models.Model):
+    """
+    One student's attendance in one course over one term, a bit per
+    calendar day of the term (core/bitmaps.py): `held` when the course
+    took attendance that day, `present` when the student was there. Kept
+    in step with Attendance on every write, like AttendanceSummary.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='attendance_bitmaps', db_index=False)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    # 'YYYY-Tn', as Fee.term; `start` is the term's first day (bit 0)
+    term = models.CharField(max_length=10)
+    start = models.DateField()
+    held = models.BinaryField()
+    present = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('student', 'course', 'term')
+
+    def __str__(self):
+        return f"{self.student_id} - {self.course_id} ({self.term})"
+
+class Tombstone(models.Model):
+    """
+    Marks a deleted Attendance/Result/Quiz/Fee/Timetable row so delta sync
+    (?since=) can tell clients to drop it. Scoped by the student (or, for
+    timetables, the class) that could see the row.
+    """
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    student_id = models.BigIntegerField(null=True, blank=True)
+    school_class_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'student_id', 'deleted_at'], name='tombstone_student'),
+            models.Index(fields=['model', 'school_class_id', 'deleted_at'], name='tombstone_class'),
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_at'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted at {self.deleted_at}"
+
+class ImportBatch(models.Model):
+    """
+    One bulk import of a CSV/JSONL file (core/imports.py). `rows_done` is the
+    checkpoint: it is saved in the same transaction as each chunk's rows, so
+    a failed or interrupted import resumes after the last committed chunk.
+    """
+    KIND_CHOICES = [
+        ('students', 'Students'),
+        ('attendance', 'Attendance'),
+        ('results', 'Results'),
+        ('quizzes', 'Quizzes'),
+        ('fees', 'Fees'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    source = models.FileField(upload_to='imports/')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+
+    rows_done = models.IntegerField(default=0)
+    imported = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+    # Bad rows, in the source's format with an `error` column; fix and re-import.
+    rejects = models.FileField(upload_to='imports/rejects/', blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} import #{self.pk} ({self.status})"
+
+class Job(models.Model):
+    """
+    One run of a registered job (core/jobs.py), claimed and executed by the
+    run_worker process pool. Periodic runs carry a `dedupe_key` of the job
+    name and schedule slot, so each slot is queued once however many
+    schedulers are running. Partitioned jobs queue one child per slice of
+    student ids, linked through `parent`.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    run_at = models.DateTimeField()
+    dedupe_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='parts')
+
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    # Renewed by the worker's heartbeat while the job runs; once it lapses
+    # any worker may requeue the job (core.jobs.release_abandoned).
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Claiming: the oldest due jobs still queued
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at'),
+            # Metrics: recently finished runs
+            models.Index(fields=['finished_at'], name='job_finished_at'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+class SummaryRebuild(models.Model):
+    """
+    One sharded rebuild of AttendanceSummary (rebuild_attendance_summaries
+    --workers/--shard-size). Its shards are the checkpoints: each is marked
+    done in the transaction that rewrites it, so a resumed rebuild only
+    redoes the shards that had not committed.
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    shard_size = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Summary rebuild #{self.pk} ({self.status})"
+
+class SummaryRebuildShard(models.Model):
+    """
+    A contiguous, inclusive range of student ids within a SummaryRebuild.
+    The last shard has no `last_student`: it also covers students created
+    after the plan, so a resumed rebuild reaches them too.
+    """
+    rebuild = models.ForeignKey(SummaryRebuild, on_delete=models.CASCADE, related_name='shards')
+    first_student = models.BigIntegerField()
+    last_student = models.BigIntegerField(null=True, blank=True)
+    done = models.BooleanField(default=False)
+
+    written = models.IntegerField(default=0)
+    deleted = models.IntegerField(default=0)
+    seconds = models.FloatField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['first_student']
+
+    def __str__(self):
+        return f"Students {self.first_student}-{self.last_student or ''} of rebuild #{self.rebuild_id}"
@@ -0,0 +1,135 @@
+import base64
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _encode(values):
+    plain = [value.isoformat() if isinstance(value, (date, datetime, time)) else value for value in values]
+    plain = [str(value) if isinstance(value, Decimal) else value for value in plain]
+    return base64.urlsafe_b64encode(json.dumps(plain, separators=(',', ':')).encode()).decode()
+
+
+def _decode(cursor, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise NotFound('Invalid cursor.')
+    if not isinstance(values, list) or len(values) != length:
+        raise NotFound('Invalid cursor.')
+    return values
+
+
+def _split(ordering):
+    return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+
+def keyset_filter(ordering, values):
+    """
+    Q for rows strictly after `values` in `ordering`, i.e. the expanded form of
+    (a, b, c) > (va, vb, vc), honouring descending fields.
+    """
+    fields = _split(ordering)
+    condition = Q()
+    for index, (name, descending) in enumerate(fields):
+        step = Q(**{f'{name}__{"lt" if descending else "gt"}': values[index]})
+        for previous, (previous_name, _) in enumerate(fields[:index]):
+            step &= Q(**{previous_name: values[previous]})
+        condition |= step
+    return condition
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a stable, indexed ordering with no OFFSET.
+
+    The cursor is the ordering values of the last row served, and the next
+    page is fetched with a row-value comparison against it. Views choose the
+    ordering with `keyset_ordering` (it must end in a unique column, e.g.
+    ('-date', '-id')). Responses look like {"next": url|null, "results": [...]}.
+
+    Also paginates plain lists of serialized dicts, e.g. cached payloads,
+    using the same keys.
+    """
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('id',)
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'keyset_ordering', self.ordering))
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size, cursor, names = self._start(request, view)
+
+        if isinstance(queryset, list):
+            if any(descending for _, descending in _split(self.ordering)):
+                raise ImproperlyConfigured('Cached lists can only be paginated in ascending order.')
+            rows = sorted(queryset, key=lambda row: self._sort_key(row, names))
+            if cursor:
+                after = self._sort_key(dict(zip(names, _decode(cursor, len(names)))), names)
+                rows = [row for row in rows if self._sort_key(row, names) > after]
+            return self._finish(rows[:page_size + 1], page_size, names, dict.__getitem__)
+
+        rows = list(self._page_queryset(queryset, cursor, names, page_size))
+        return self._finish(rows, page_size, names, getattr)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views: the page is read with async iteration."""
+        page_size, cursor, names = self._start(request, view)
+        rows = [row async for row in self._page_queryset(queryset, cursor, names, page_size)]
+        return self._finish(rows, page_size, names, getattr)
+
+    def _start(self, request, view):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        names = [name for name, _ in _split(self.ordering)]
+        return self.get_page_size(request), request.query_params.get(self.cursor_query_param), names
+
+    def _page_queryset(self, queryset, cursor, names, page_size):
+        if cursor:
+            queryset = queryset.filter(keyset_filter(self.ordering, _decode(cursor, len(names))))
+        return queryset.order_by(*self.ordering)[:page_size + 1]
+
+    def _finish(self, rows, page_size, names, value_of):
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_values = [value_of(rows[-1], name) for name in names] if self.has_next else None
+        return rows
+
+    def _sort_key(self, row, names):
+        return tuple(row[name] for name in names)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, _encode(self.next_values))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
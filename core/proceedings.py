@@ -0,0 +1,224 @@
+"""
+Class proceedings: per-(student, course) attendance totals with the subject,
+teacher and section names, materialized in ClassProceeding.
+
+Rows are kept in step with Attendance by the same write paths that maintain
+AttendanceSummary (core/summaries.py calls in here), and the display names
+by the Course / Teacher / SchoolClass / Student signals, so serving
+/api/proceedings/ is a single indexed lookup on student.
+"""
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+
+from .models import Attendance, ClassProceeding, Student
+from .versions import bump_everything
+
+DEFAULT_CHUNK_SIZE = 2000
+NO_SECTION = 'N/A'
+
+# Counters and names compared by the consistency check, in row order.
+COMPARED_FIELDS = ('subject', 'teacher', 'section', 'total_classes', 'attended', 'absent')
+
+
+def teacher_name(first_name, last_name):
+    return f"{first_name} {last_name}"
+
+
+def proceeding_totals(queryset=None):
+    """
+    The live aggregate: one grouped query over Attendance yielding
+    (student_id, course_id, subject, teacher, section, total, attended, absent).
+    """
+    if queryset is None:
+        queryset = Attendance.objects.all()
+    rows = (
+        queryset
+        .values_list('student_id', 'course_id')
+        .annotate(
+            subject=F('course__subject'),
+            teacher_first_name=F('course__teacher__first_name'),
+            teacher_last_name=F('course__teacher__last_name'),
+            section=F('student__school_class__name'),
+            total=Count('id'),
+            attended=Count('id', filter=Q(status='Present')),
+        )
+        .order_by()
+        .values_list(
+            'student_id', 'course_id', 'subject', 'teacher_first_name', 'teacher_last_name',
+            'section', 'total', 'attended',
+        )
+    )
+    for student_id, course_id, subject, first_name, last_name, section, total, attended in rows.iterator():
+        yield (
+            student_id, course_id, subject, teacher_name(first_name, last_name),
+            section or NO_SECTION, total, attended, total - attended,
+        )
+
+
+def upsert_proceedings(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Bulk upsert rows shaped like proceeding_totals() into ClassProceeding, chunk by chunk."""
+    written = 0
+    batch = []
+    for student_id, course_id, subject, teacher, section, total, attended, absent in rows:
+        batch.append(ClassProceeding(
+            student_id=student_id, course_id=course_id, subject=subject, teacher=teacher,
+            section=section, total_classes=total, attended=attended, absent=absent,
+        ))
+        if len(batch) >= chunk_size:
+            written += _flush(batch)
+            batch = []
+    if batch:
+        written += _flush(batch)
+    return written
+
+
+def _flush(batch):
+    ClassProceeding.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=['student', 'course'],
+        update_fields=list(COMPARED_FIELDS),
+    )
+    return len(batch)
+
+
+def delete_orphan_proceedings(queryset=None):
+    """Remove rows for (student, course) pairs that no longer have any attendance."""
+    if queryset is None:
+        queryset = ClassProceeding.objects.all()
+    has_attendance = Attendance.objects.filter(
+        student_id=OuterRef('student_id'), course_id=OuterRef('course_id'),
+    )
+    deleted, _ = queryset.filter(~Exists(has_attendance)).delete()
+    return deleted
+
+
+def rebuild_class_proceedings(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Recompute every ClassProceeding from the live aggregate. Returns (written, deleted)."""
+    with transaction.atomic():
+        written = upsert_proceedings(proceeding_totals(), chunk_size=chunk_size)
+        deleted = delete_orphan_proceedings()
+    bump_everything()
+    return written, deleted
+
+
+def apply_proceeding_delta(student_id, course_id, total_delta, attended_delta):
+    """Shift the counters of one row in a single UPDATE; see apply_attendance_delta()."""
+    rows = ClassProceeding.objects.filter(student_id=student_id, course_id=course_id)
+    updated = rows.update(
+        total_classes=F('total_classes') + total_delta,
+        attended=F('attended') + attended_delta,
+        absent=F('absent') + (total_delta - attended_delta),
+    )
+    if updated:
+        if total_delta < 0:
+            rows.filter(total_classes__lte=0).delete()
+    elif total_delta > 0:
+        # First attendance for this pair: the aggregate also fills in the names.
+        refresh_proceedings([(student_id, course_id)])
+
+
+def refresh_proceedings(pairs, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Recompute the rows of the given (student_id, course_id) pairs from their attendance."""
+    pairs = set(pairs)
+    if not pairs:
+        return 0
+    student_ids = {student_id for student_id, _ in pairs}
+    course_ids = {course_id for _, course_id in pairs}
+    rows = (
+        row for row in proceeding_totals(
+            Attendance.objects.filter(student_id__in=student_ids, course_id__in=course_ids)
+        )
+        if (row[0], row[1]) in pairs
+    )
+    with transaction.atomic():
+        written = upsert_proceedings(rows, chunk_size=chunk_size)
+        delete_orphan_proceedings(
+            ClassProceeding.objects.filter(student_id__in=student_ids, course_id__in=course_ids)
+        )
+    return written
+
+
+def student_batches(student_range=None, student_batch=500):
+    """
+    Student ids in ascending batches, optionally limited to an inclusive
+    (first, last) id range so that several workers can split the table.
+    """
+    students = Student.objects.all()
+    last_id = 0
+    if student_range is not None:
+        first, last = student_range
+        students = students.filter(pk__lte=last)
+        last_id = first - 1
+    while True:
+        student_ids = list(
+            students.filter(pk__gt=last_id).order_by('pk')
+            .values_list('pk', flat=True)[:student_batch]
+        )
+        if not student_ids:
+            return
+        last_id = student_ids[-1]
+        yield student_ids
+
+
+def student_ranges(size):
+    """Inclusive (first, last) student id pairs covering every student, `size` students each."""
+    pks = list(Student.objects.order_by('pk').values_list('pk', flat=True))
+    return [(pks[i], pks[min(i + size, len(pks)) - 1]) for i in range(0, len(pks), size)]
+
+
+def check_class_proceedings(student_batch=500, repair=False, student_range=None):
+    """
+    Compare ClassProceeding against the live aggregate, students in id batches
+    (within `student_range`, an inclusive pair of student ids, if given).
+
+    Returns (checked, drifted, orphaned): rows that exist in the aggregate,
+    rows missing or differing from it, and stored rows without attendance.
+    With `repair`, drifted rows are rewritten and orphans removed.
+    """
+    checked = drifted = orphaned = 0
+    for student_ids in student_batches(student_range, student_batch):
+        last_id = student_ids[-1]
+
+        live = {
+            (row[0], row[1]): row
+            for row in proceeding_totals(
+                Attendance.objects.filter(student_id__gte=student_ids[0], student_id__lte=last_id)
+            )
+        }
+        stored = {
+            (student_id, course_id): (pk, values)
+            for pk, student_id, course_id, *values in ClassProceeding.objects.filter(
+                student_id__gte=student_ids[0], student_id__lte=last_id,
+            ).values_list('pk', 'student_id', 'course_id', *COMPARED_FIELDS)
+        }
+        checked += len(live)
+
+        stale = [row for pair, row in live.items() if stored.get(pair, (None, None))[1] != list(row[2:])]
+        orphans = [pk for pair, (pk, _) in stored.items() if pair not in live]
+        drifted += len(stale)
+        orphaned += len(orphans)
+        if repair and (stale or orphans):
+            with transaction.atomic():
+                upsert_proceedings(stale)
+                ClassProceeding.objects.filter(pk__in=orphans).delete()
+    if repair and (drifted or orphaned):
+        bump_everything()
+    return checked, drifted, orphaned
+
+
+def student_proceedings(student):
+    return (
+        ClassProceeding.objects.filter(student_id=student.pk)
+        .order_by('subject')
+        .values('subject', 'teacher', 'total_classes', 'attended', 'absent', 'section')
+    )
+
+
+def class_proceedings(student):
+    """Per-course attendance totals for one student, as served by /api/proceedings/."""
+    return list(student_proceedings(student))
+
+
+async def aclass_proceedings(student):
+    return [row async for row in student_proceedings(student)]
@@ -0,0 +1,191 @@
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .versions import SCOPED_MODELS, bump_model
+
+# Fields whose change moves an Attendance row between summaries (or bitmap
+# days, core/bitmaps.py) or flips its status.
+SUMMARY_FIELDS = {'student', 'student_id', 'course', 'course_id', 'status', 'date'}
+
+# Fields of Fee and FeePayment whose change moves money between balances.
+LEDGER_FIELDS = {'student', 'student_id', 'fee', 'fee_id', 'amount'}
+
+
+class TrackedQuerySet(models.QuerySet):
+    """
+    Change tracking for the bulk write paths, which skip save() and its
+    signals: bumps `updated_at` (auto_now only fires on save()) so delta
+    sync sees the rows, and bumps the version stamps of the touched scopes
+    (core/versions.py) so conditional GETs do not serve stale 304s.
+    """
+
+    def _scope_field(self):
+        return SCOPED_MODELS.get(self.model._meta.label_lower, (None, None))[1]
+
+    def _bump(self, objs):
+        field = self._scope_field()
+        bump_model(self.model, [getattr(obj, field) for obj in objs] if field else [])
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        created = super().bulk_create(objs, *args, **kwargs)
+        self._bump(objs)
+        return created
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        field = self._scope_field()
+        scopes = set(self.order_by().values_list(field, flat=True).distinct()) if field else set()
+        computed = field in kwargs and hasattr(kwargs[field], 'resolve_expression')
+        pks = list(self.values_list('pk', flat=True)) if computed else None
+        updated = super().update(**kwargs)
+        if computed:
+            # Set per row by an expression: read the new scopes back.
+            scopes.update(self.model.objects.filter(pk__in=pks).values_list(field, flat=True).distinct())
+        elif field in kwargs:
+            scopes.add(kwargs[field])
+        bump_model(self.model, scopes)
+        return updated
+    update.alters_data = True
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        now = timezone.now()
+        for obj in objs:
+            obj.updated_at = now
+        fields = [*fields, 'updated_at'] if 'updated_at' not in fields else fields
+        updated = super().bulk_update(objs, fields, *args, **kwargs)
+        self._bump(objs)
+        return updated
+
+
+class AttendanceQuerySet(TrackedQuerySet):
+    """
+    Keeps AttendanceSummary counters in step with the bulk write paths.
+
+    Per-row saves and deletes are handled by the signals in core/signals.py;
+    the methods here batch the touched (student, course) pairs and refresh
+    them once, after the write, inside the same transaction.
+    """
+
+    def _pairs(self):
+        return set(self.order_by().values_list('student_id', 'course_id').distinct())
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .summaries import deferred_summaries
+
+        objs = list(objs)
+        with transaction.atomic(using=self.db), deferred_summaries() as pairs:
+            created = super().bulk_create(objs, *args, **kwargs)
+            pairs.update((obj.student_id, obj.course_id) for obj in objs)
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from .summaries import deferred_summaries
+
+        objs = list(objs)
+        if not SUMMARY_FIELDS.intersection(fields):
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        with transaction.atomic(using=self.db), deferred_summaries() as pairs:
+            pairs.update(self.model.objects.filter(pk__in=[obj.pk for obj in objs])._pairs())
+            updated = super().bulk_update(objs, fields, *args, **kwargs)
+            pairs.update((obj.student_id, obj.course_id) for obj in objs)
+        return updated
+
+    def update(self, **kwargs):
+        from .summaries import deferred_summaries
+
+        if not SUMMARY_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db), deferred_summaries() as pairs:
+            pks = list(self.values_list('pk', flat=True))
+            pairs.update(self._pairs())
+            updated = super().update(**kwargs)
+            pairs.update(self.model.objects.filter(pk__in=pks)._pairs())
+        return updated
+    update.alters_data = True
+
+    def delete(self):
+        from .summaries import deferred_summaries
+
+        with transaction.atomic(using=self.db), deferred_summaries():
+            return super().delete()
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+class LedgerQuerySet(TrackedQuerySet):
+    """
+    Keeps the fee ledger (Fee.amount_paid, StudentBalance, ClassBalance) in
+    step with the bulk write paths of Fee and FeePayment, as
+    AttendanceQuerySet does for summaries: the touched students and fees
+    are collected and refreshed once, in the same transaction.
+    """
+
+    def _fee_field(self):
+        return 'pk' if self.model._meta.model_name == 'fee' else 'fee_id'
+
+    def _moves_fees(self, fields):
+        return self.model._meta.model_name == 'fee' and not {'student', 'student_id'}.isdisjoint(fields)
+
+    def _move_payments(self, fee_pks):
+        # Payments carry their fee's student; follow fees moved to another student.
+        from .models import FeePayment
+
+        FeePayment.objects.filter(fee_id__in=fee_pks).update(student_id=Subquery(
+            self.model.objects.filter(pk=OuterRef('fee_id')).values('student_id')[:1]
+        ))
+
+    def _collect(self, touched, queryset):
+        for student_id, fee_id in queryset.order_by().values_list('student_id', self._fee_field()).distinct():
+            touched.students.add(student_id)
+            touched.fees.add(fee_id)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .ledger import deferred_ledger
+
+        objs = list(objs)
+        with transaction.atomic(using=self.db), deferred_ledger() as touched:
+            created = super().bulk_create(objs, *args, **kwargs)
+            for obj in objs:
+                touched.students.add(obj.student_id)
+                touched.fees.add(getattr(obj, self._fee_field()))
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from .ledger import deferred_ledger
+
+        objs = list(objs)
+        if not LEDGER_FIELDS.intersection(fields):
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        with transaction.atomic(using=self.db), deferred_ledger() as touched:
+            self._collect(touched, self.model.objects.filter(pk__in=[obj.pk for obj in objs]))
+            updated = super().bulk_update(objs, fields, *args, **kwargs)
+            self._collect(touched, self.model.objects.filter(pk__in=[obj.pk for obj in objs]))
+            if self._moves_fees(fields):
+                self._move_payments([obj.pk for obj in objs])
+        return updated
+
+    def update(self, **kwargs):
+        from .ledger import deferred_ledger
+
+        if not LEDGER_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db), deferred_ledger() as touched:
+            pks = list(self.values_list('pk', flat=True))
+            self._collect(touched, self)
+            updated = super().update(**kwargs)
+            self._collect(touched, self.model.objects.filter(pk__in=pks))
+            if self._moves_fees(kwargs):
+                self._move_payments(pks)
+        return updated
+    update.alters_data = True
+
+    def delete(self):
+        from .ledger import deferred_ledger
+
+        with transaction.atomic(using=self.db), deferred_ledger():
+            return super().delete()
+    delete.alters_data = True
+    delete.queryset_only = True
@@ -0,0 +1,469 @@
+"""
+Timetable generation: place every weekly lesson of every class in a
+(day, period) slot and a room so that no class, teacher or room is booked
+twice at once and teachers are only used when available.
+
+The solver is pure Python: a greedy construction (most loaded teachers
+first) followed by min-conflicts local search with random-walk noise and,
+once only soft penalties are left, swaps between lessons of one class;
+it is bounded by a time budget and/or an iteration count. Slot occupancy is kept
+in flat counters, so evaluating a move is a few list lookups. Rooms are
+interchangeable, so the room constraint is a per-slot capacity; actual rooms
+are handed out once slots are fixed. Everything random goes through one
+seeded generator: with `max_iterations` (and no time budget cutting in
+first) a seed always gives the same timetable.
+"""
+import json
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import time as clock
+
+from django.db import transaction
+from django.db.models import Q
+
+from .conflicts import ENTRY_FIELDS, sweep_conflicts
+from .models import Course, SchoolClass, Teacher, Timetable
+from .timetables import forget_class_timetables
+from .versions import bump_model
+
+# Penalty per broken hard constraint, against 1 per soft one (a class
+# having the same course twice on one day).
+HARD = 1000
+
+# Chance that a local-search step moves a lesson to a random slot instead of the best one.
+NOISE = 0.1
+
+
+@dataclass
+class Lesson:
+    school_class: int
+    course: int
+    teacher: int
+    subject: str
+
+
+@dataclass
+class Problem:
+    """
+    What to schedule. `days` are Timetable day codes, `periods` (start, end)
+    times shared by every day, `unavailable` a set of (teacher id, day,
+    period index) the teacher cannot be used in, and `busy_rooms` a set of
+    (room, day, period index) already taken by entries that stay.
+    """
+    days: list
+    periods: list
+    rooms: list
+    lessons: list
+    unavailable: set = field(default_factory=set)
+    busy_rooms: set = field(default_factory=set)
+
+    @property
+    def slots(self):
+        return len(self.days) * len(self.periods)
+
+    def slot_time(self, slot):
+        day, period = divmod(slot, len(self.periods))
+        return self.days[day], self.periods[period]
+
+
+@dataclass
+class Solution:
+    slots: list
+    rooms: list
+    hard_violations: int
+    soft_penalty: int
+    iterations: int
+    construction_seconds: float
+    search_seconds: float
+
+
+class _State:
+    """Occupancy counters for one assignment of lessons to slots."""
+
+    def __init__(self, problem):
+        self.problem = problem
+        self.slot_count = problem.slots
+        self.period_count = len(problem.periods)
+        self.classes = {pk: i for i, pk in enumerate(sorted({l.school_class for l in problem.lessons}))}
+        self.teachers = {pk: i for i, pk in enumerate(sorted({l.teacher for l in problem.lessons}))}
+        self.groups = {}  # (class, course) -> dense id
+
+        lessons = problem.lessons
+        self.lesson_class = [self.classes[l.school_class] for l in lessons]
+        self.lesson_teacher = [self.teachers[l.teacher] for l in lessons]
+        self.lesson_group = [self.groups.setdefault((l.school_class, l.course), len(self.groups)) for l in lessons]
+
+        slots = self.slot_count
+        self.class_at = [0] * (len(self.classes) * slots)
+        self.teacher_at = [0] * (len(self.teachers) * slots)
+        self.rooms_used = [0] * slots
+        # Rooms free in each slot: all of them, less those held by kept entries
+        self.capacity = [len(problem.rooms)] * slots
+        for room, day, period in problem.busy_rooms:
+            if room in problem.rooms and day in problem.days and 0 <= period < self.period_count:
+                self.capacity[problem.days.index(day) * self.period_count + period] -= 1
+        self.group_day = [0] * (len(self.groups) * len(problem.days))
+        self.blocked = [False] * (len(self.teachers) * slots)
+        day_index = {day: i for i, day in enumerate(problem.days)}
+        for teacher, day, period in problem.unavailable:
+            if teacher in self.teachers and day in day_index and 0 <= period < self.period_count:
+                self.blocked[self.teachers[teacher] * slots + day_index[day] * self.period_count + period] = True
+
+        self.slot_of = [None] * len(lessons)
+        self.occupants = [set() for _ in range(slots)]
+        self.class_lessons = defaultdict(list)
+        for lesson, school_class in enumerate(self.lesson_class):
+            self.class_lessons[school_class].append(lesson)
+
+    def cost(self, lesson, slot):
+        """Penalty `lesson` adds by sitting in `slot` (with itself removed from the counters)."""
+        slots = self.slot_count
+        teacher = self.lesson_teacher[lesson] * slots + slot
+        hard = (
+            self.class_at[self.lesson_class[lesson] * slots + slot]
+            + self.teacher_at[teacher]
+            + self.blocked[teacher]
+            + (self.rooms_used[slot] >= self.capacity[slot])
+        )
+        soft = self.group_day[self.lesson_group[lesson] * len(self.problem.days) + slot // self.period_count]
+        return hard * HARD + soft
+
+    def _shift(self, lesson, slot, delta):
+        slots = self.slot_count
+        self.class_at[self.lesson_class[lesson] * slots + slot] += delta
+        self.teacher_at[self.lesson_teacher[lesson] * slots + slot] += delta
+        self.rooms_used[slot] += delta
+        self.group_day[self.lesson_group[lesson] * len(self.problem.days) + slot // self.period_count] += delta
+
+    def place(self, lesson, slot):
+        self._shift(lesson, slot, 1)
+        self.slot_of[lesson] = slot
+        self.occupants[slot].add(lesson)
+
+    def remove(self, lesson):
+        slot = self.slot_of[lesson]
+        self._shift(lesson, slot, -1)
+        self.slot_of[lesson] = None
+        self.occupants[slot].discard(lesson)
+        return slot
+
+    def current_cost(self, lesson):
+        slot = self.remove(lesson)
+        cost = self.cost(lesson, slot)
+        self.place(lesson, slot)
+        return cost
+
+    def clashing(self, lesson, slot, joined):
+        """Lessons in `slot` whose cost may have changed because `lesson` just joined or left it."""
+        # Room capacity only matters to the others while the slot is over it.
+        capacity = self.capacity[slot]
+        over = self.rooms_used[slot] > capacity if joined else self.rooms_used[slot] >= capacity
+        if over:
+            return set(self.occupants[slot])
+        return {
+            other for other in self.occupants[slot]
+            if self.lesson_class[other] == self.lesson_class[lesson]
+            or self.lesson_teacher[other] == self.lesson_teacher[lesson]
+        }
+
+    def totals(self):
+        """(hard violations, soft penalty) of the whole assignment."""
+        hard = sum(count - 1 for count in self.class_at if count > 1)
+        hard += sum(count - 1 for count in self.teacher_at if count > 1)
+        hard += sum(used - capacity for used, capacity in zip(self.rooms_used, self.capacity) if used > capacity)
+        hard += sum(
+            1 for lesson, slot in enumerate(self.slot_of)
+            if self.blocked[self.lesson_teacher[lesson] * self.slot_count + slot]
+        )
+        soft = sum(count - 1 for count in self.group_day if count > 1)
+        return hard, soft
+
+
+def _best_swap(state, lesson, own_cost):
+    """
+    The lesson of the same class whose slot swap lowers the pair's combined
+    cost the most, or None. Used once single moves stop helping.
+    """
+    slot = state.slot_of[lesson]
+    best, best_gain = None, 0
+    for other in state.class_lessons[state.lesson_class[lesson]]:
+        other_slot = state.slot_of[other]
+        if other_slot == slot or state.lesson_group[other] == state.lesson_group[lesson]:
+            continue
+        before = own_cost + state.current_cost(other)
+        state.remove(lesson)
+        state.remove(other)
+        after = state.cost(lesson, other_slot)
+        state.place(lesson, other_slot)
+        after += state.cost(other, slot)
+        state.remove(lesson)
+        state.place(lesson, slot)
+        state.place(other, other_slot)
+        if before - after > best_gain:
+            best, best_gain = other, before - after
+    return best
+
+
+def _best_slot(state, lesson, rng):
+    best_cost, best = None, []
+    for slot in range(state.slot_count):
+        cost = state.cost(lesson, slot)
+        if best_cost is None or cost < best_cost:
+            best_cost, best = cost, [slot]
+        elif cost == best_cost:
+            best.append(slot)
+    return rng.choice(best), best_cost
+
+
+def solve(problem, time_budget=10.0, max_iterations=None, seed=0):
+    """
+    Assign every lesson a slot and a room. Stops when nothing is left to
+    improve, when `time_budget` seconds have passed or after
+    `max_iterations` local-search steps, whichever comes first.
+    """
+    rng = random.Random(seed)
+    state = _State(problem)
+    start = time.perf_counter()
+    deadline = start + time_budget if time_budget else None
+
+    # Greedy construction: teachers with the most lessons have the fewest options.
+    load = defaultdict(int)
+    for teacher in state.lesson_teacher:
+        load[teacher] += 1
+    order = list(range(len(problem.lessons)))
+    rng.shuffle(order)
+    order.sort(key=lambda lesson: -load[state.lesson_teacher[lesson]])
+    for lesson in order:
+        slot, _ = _best_slot(state, lesson, rng)
+        state.place(lesson, slot)
+    construction_seconds = time.perf_counter() - start
+
+    # Min-conflicts local search over the lessons that still cost something.
+    search_start = time.perf_counter()
+    pending = _RandomSet(lesson for lesson in range(len(problem.lessons)) if state.current_cost(lesson))
+    iterations = 0
+    while pending:
+        if max_iterations is not None and iterations >= max_iterations:
+            break
+        if deadline is not None and iterations % 100 == 0 and time.perf_counter() >= deadline:
+            break
+        iterations += 1
+        lesson = pending.choice(rng)
+        old_slot = state.remove(lesson)
+        old_cost = state.cost(lesson, old_slot)
+        if old_cost >= HARD and rng.random() < NOISE:
+            slot = rng.randrange(state.slot_count)
+            cost = state.cost(lesson, slot)
+        else:
+            slot, cost = _best_slot(state, lesson, rng)
+            if old_cost < HARD and cost >= old_cost:
+                # Only soft penalties left and no better slot: swap with a
+                # lesson of the same class if that helps, else settle here.
+                state.place(lesson, old_slot)
+                other = _best_swap(state, lesson, old_cost)
+                if other is None:
+                    pending.discard(lesson)
+                    continue
+                other_slot = state.remove(other)
+                state.remove(lesson)
+                state.place(other, old_slot)
+                pending.add(other)
+                affected = state.clashing(lesson, old_slot, joined=False) | state.clashing(other, old_slot, joined=True)
+                state.place(lesson, other_slot)
+                affected |= state.clashing(lesson, other_slot, joined=True)
+                for neighbour in affected:
+                    pending.add(neighbour)
+                continue
+        affected = state.clashing(lesson, old_slot, joined=False)
+        state.place(lesson, slot)
+        affected |= state.clashing(lesson, slot, joined=True)
+        for other in affected:
+            pending.add(other)
+        if cost == 0:
+            pending.discard(lesson)
+    search_seconds = time.perf_counter() - search_start
+
+    hard, soft = state.totals()
+    return Solution(
+        slots=state.slot_of,
+        rooms=_assign_rooms(problem, state),
+        hard_violations=hard,
+        soft_penalty=soft,
+        iterations=iterations,
+        construction_seconds=construction_seconds,
+        search_seconds=search_seconds,
+    )
+
+
+class _RandomSet:
+    """A set with O(1) add, discard and uniform random choice."""
+
+    def __init__(self, items=()):
+        self.items = []
+        self.positions = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item):
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        position = self.positions.pop(item, None)
+        if position is None:
+            return
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def choice(self, rng):
+        return self.items[rng.randrange(len(self.items))]
+
+
+def _assign_rooms(problem, state):
+    """Rooms per lesson, handed out slot by slot; None where a slot is over capacity."""
+    rooms = [None] * len(problem.lessons)
+    for slot, occupants in enumerate(state.occupants):
+        day, period = divmod(slot, state.period_count)
+        free = [room for room in problem.rooms if (room, problem.days[day], period) not in problem.busy_rooms]
+        for room, lesson in zip(free, sorted(occupants)):
+            rooms[lesson] = room
+    return rooms
+
+
+# --- Database input and output ---------------------------------------------
+
+def load_problem(spec):
+    """
+    A Problem from a spec dict (usually JSON), resolved against the database:
+
+        {"days": ["Mon", ...], "periods": [["08:00", "08:45"], ...],
+         "rooms": ["R1", ...],
+         "requirements": [{"school_class": "7A", "course": "Maths", "hours": 4}, ...],
+         "unavailable": [{"teacher": "ada@school.local", "day": "Mon", "periods": [0, 1]}, ...]}
+
+    Classes and courses are matched by name, teachers by email; each lesson
+    is taught by its course's teacher. The timetable entries of other
+    classes are kept by write_timetable(), so their teachers and rooms are
+    marked taken where they overlap a period.
+    """
+    classes = dict(SchoolClass.objects.values_list('name', 'pk'))
+    courses = {name: (pk, teacher_id, subject) for name, pk, teacher_id, subject
+               in Course.objects.values_list('name', 'pk', 'teacher_id', 'subject')}
+    teachers = dict(Teacher.objects.values_list('email', 'pk'))
+
+    errors = []
+    lessons = []
+    for number, requirement in enumerate(spec.get('requirements', [])):
+        school_class = classes.get(requirement.get('school_class'))
+        course = courses.get(requirement.get('course'))
+        if school_class is None:
+            errors.append(f"requirements[{number}]: unknown class {requirement.get('school_class')!r}")
+        if course is None:
+            errors.append(f"requirements[{number}]: unknown course {requirement.get('course')!r}")
+        if school_class is None or course is None:
+            continue
+        course_id, teacher_id, subject = course
+        lessons.extend(
+            Lesson(school_class, course_id, teacher_id, subject) for _ in range(int(requirement.get('hours', 1)))
+        )
+
+    unavailable = set()
+    for number, entry in enumerate(spec.get('unavailable', [])):
+        teacher = teachers.get(entry.get('teacher'))
+        if teacher is None:
+            errors.append(f"unavailable[{number}]: unknown teacher {entry.get('teacher')!r}")
+            continue
+        unavailable.update((teacher, entry['day'], period) for period in entry.get('periods', []))
+
+    if errors:
+        raise ValueError('; '.join(errors))
+    days = list(spec.get('days', ['Mon', 'Tue', 'Wed', 'Thu', 'Fri']))
+    periods = [(clock.fromisoformat(start), clock.fromisoformat(end)) for start, end in spec['periods']]
+    rooms = list(spec['rooms'])
+
+    # Entries of classes outside the spec stay: the periods they overlap
+    # are taken for their teachers and rooms.
+    teacher_ids = {lesson.teacher for lesson in lessons}
+    busy_rooms = set()
+    kept = (
+        Timetable.objects.filter(Q(teacher_id__in=teacher_ids) | Q(room__in=rooms), day__in=days)
+        .exclude(school_class_id__in={lesson.school_class for lesson in lessons})
+        .values_list('teacher_id', 'room', 'day', 'start_time', 'end_time')
+    )
+    for teacher, room, day, start, end in kept:
+        for period, (period_start, period_end) in enumerate(periods):
+            if start < period_end and end > period_start:
+                if teacher in teacher_ids:
+                    unavailable.add((teacher, day, period))
+                if room in rooms:
+                    busy_rooms.add((room, day, period))
+
+    return Problem(
+        days=days, periods=periods, rooms=rooms, lessons=lessons, unavailable=unavailable, busy_rooms=busy_rooms,
+    )
+
+
+def load_problem_file(path):
+    """load_problem() for a JSON file."""
+    with open(path, encoding='utf-8') as handle:
+        return load_problem(json.load(handle))
+
+
+def timetable_entries(problem, solution):
+    """Unsaved Timetable rows for a solution."""
+    entries = []
+    for lesson, slot, room in zip(problem.lessons, solution.slots, solution.rooms):
+        day, (start, end) = problem.slot_time(slot)
+        entries.append(Timetable(
+            school_class_id=lesson.school_class, teacher_id=lesson.teacher, subject=lesson.subject,
+            day=day, start_time=start, end_time=end, room=room,
+        ))
+    return entries
+
+
+def write_timetable(problem, solution, replace=True):
+    """
+    Store a solution with one bulk insert, in one transaction. With
+    `replace`, the classes' existing entries are deleted first. The new
+    entries are checked once more with the sweep-line validator, against
+    each other and against every stored entry that stays and shares a
+    class, teacher or room with them.
+    """
+    entries = timetable_entries(problem, solution)
+    class_ids = {lesson.school_class for lesson in problem.lessons}
+    with transaction.atomic():
+        if replace:
+            Timetable.objects.filter(school_class_id__in=class_ids).delete()
+        kept = Timetable.objects.filter(
+            Q(school_class_id__in=class_ids)
+            | Q(teacher_id__in={entry.teacher_id for entry in entries if entry.teacher_id is not None})
+            | Q(room__in={entry.room for entry in entries if entry.room}),
+            day__in=problem.days,
+        ).values(*ENTRY_FIELDS)
+        # New entries get negative ids, apart from the stored ones
+        proposed = [
+            {'id': -number, 'day': e.day, 'start_time': e.start_time, 'end_time': e.end_time, 'subject': e.subject,
+             'teacher_id': e.teacher_id, 'room': e.room, 'school_class_id': e.school_class_id}
+            for number, e in enumerate(entries, start=1)
+        ]
+        conflicts = [
+            found for found in sweep_conflicts(sorted(
+                [*kept, *proposed], key=lambda entry: (entry['day'], entry['start_time'], entry['id']),
+            ))
+            if found['entry'] < 0 or found['conflicts_with'] < 0
+        ]
+        if conflicts:
+            raise ValueError(f'Refusing to write a timetable with {len(conflicts)} conflict(s).')
+        Timetable.objects.bulk_create(entries, batch_size=2000)
+    # bulk_create sends no post_save, so the caches are dropped here.
+    forget_class_timetables(class_ids)
+    bump_model(Timetable, class_ids)
+    return len(entries)
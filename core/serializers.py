@@ -1,13 +1,42 @@
+from decimal import Decimal
+
+from django.db import transaction
 from rest_framework import serializers
 
 # Import ALL models that are used in the serializers below
 from .models import (
     Student, Teacher, SchoolClass, Attendance, Fee, Timetable,
-    Result, Quiz, Course, AttendanceSummary # <--- ADDED Course and AttendanceSummary
+    Result, Quiz, Course, AttendanceSummary, # <--- ADDED Course and AttendanceSummary
+    ClassBalance, FeePayment, StudentBalance,
 )
+from .conflicts import find_conflicts
+from .instrumentation import InstrumentedSerializerMixin
+from .summaries import deferred_summaries
+
+def requested_fields(request):
+    """Field names from ?fields=a,b,c, or None when the client wants everything."""
+    if request is None:
+        return None
+    raw = request.query_params.get('fields') if hasattr(request, 'query_params') else None
+    if not raw:
+        return None
+    return {name.strip() for name in raw.split(',') if name.strip()}
+
+class SparseFieldsetMixin:
+    """
+    Sparse fieldsets: ?fields=id,date,status keeps only those fields in the
+    output ('id' is always kept; unknown names are ignored). The viewsets use
+    the remaining fields' sources to narrow the SELECT (see core/mixins.py).
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = requested_fields(self.context.get('request'))
+        if requested:
+            for name in set(self.fields) - requested - {'id'}:
+                self.fields.pop(name)
 
 # ------------------- Student, Teacher, Class -------------------
-class StudentSerializer(serializers.ModelSerializer):
+class StudentSerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     # CRITICAL FIX: Include the SchoolClass name for easy display in Flutter
     school_class_name = serializers.CharField(source='school_class.name', read_only=True)
     
@@ -15,29 +44,123 @@ class StudentSerializer(serializers.ModelSerializer):
         model = Student
         fields = '__all__'
 
-class TeacherSerializer(serializers.ModelSerializer):
+class TeacherSerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Teacher
         fields = '__all__'
 
-class SchoolClassSerializer(serializers.ModelSerializer):
+class SchoolClassSerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = SchoolClass
         fields = '__all__'
 
 # ------------------- Attendance & Fee -------------------
-class AttendanceSerializer(serializers.ModelSerializer):
+class AttendanceSerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Attendance
         fields = '__all__'
 
-class FeeSerializer(serializers.ModelSerializer):
+class RollCallEntrySerializer(serializers.Serializer):
+    # A plain id, not PrimaryKeyRelatedField: membership is checked for the
+    # whole list in one query by RollCallSerializer.validate().
+    student = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Attendance._meta.get_field('status').choices)
+
+class RollCallSerializer(serializers.Serializer):
+    """Marks a whole SchoolClass for one Course on one date."""
+    school_class = serializers.PrimaryKeyRelatedField(queryset=SchoolClass.objects.all())
+    course = serializers.PrimaryKeyRelatedField(queryset=Course.objects.all())
+    date = serializers.DateField()
+    entries = RollCallEntrySerializer(many=True, allow_empty=False)
+
+    def validate(self, attrs):
+        student_ids = [entry['student'] for entry in attrs['entries']]
+        members = set(
+            Student.objects.filter(school_class=attrs['school_class'], pk__in=student_ids)
+            .values_list('pk', flat=True)
+        )
+        errors = {}
+        seen = set()
+        for index, student_id in enumerate(student_ids):
+            if student_id in seen:
+                errors[index] = {'student': ['Duplicate entry for this student.']}
+            elif student_id not in members:
+                errors[index] = {'student': ['Student is not in this class.']}
+            seen.add(student_id)
+        if errors:
+            raise serializers.ValidationError({'entries': errors})
+        return attrs
+
+    def save(self):
+        """
+        Upserts one Attendance per entry, keyed on (student, course, date), in
+        a single statement. Re-sending the same roll call changes nothing, and
+        two roll calls racing on a new date both land on the same rows.
+        Returns a list of (student_id, attendance_id, result) tuples.
+        """
+        course = self.validated_data['course']
+        day = self.validated_data['date']
+        entries = self.validated_data['entries']
+
+        with transaction.atomic(), deferred_summaries():
+            existing = {
+                attendance.student_id: attendance
+                for attendance in Attendance.objects.select_for_update().filter(
+                    course=course, date=day, student_id__in=[entry['student'] for entry in entries],
+                )
+            }
+
+            to_write, results = [], []
+            for entry in entries:
+                attendance = existing.get(entry['student'])
+                if attendance is not None and attendance.status == entry['status']:
+                    results.append((entry['student'], attendance, 'unchanged'))
+                    continue
+                written = Attendance(student_id=entry['student'], course=course, date=day, status=entry['status'])
+                to_write.append(written)
+                results.append((entry['student'], written, 'created' if attendance is None else 'updated'))
+
+            if to_write:
+                Attendance.objects.bulk_create(
+                    to_write, update_conflicts=True, unique_fields=['student', 'course', 'date'],
+                    update_fields=['status', 'updated_at'],
+                )
+
+        return [(student_id, attendance.pk, result) for student_id, attendance, result in results]
+
+class FeeSerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Fee
         fields = '__all__'
+        # Derived from the fee's payments (core/ledger.py)
+        read_only_fields = ('amount_paid', 'paid')
+
+# ------------------- Fee ledger -------------------
+class FeePaymentSerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+
+    class Meta:
+        model = FeePayment
+        fields = '__all__'
+        read_only_fields = ('student', 'paid_at')
+
+class StudentBalanceSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = StudentBalance
+        fields = '__all__'
+
+class ClassBalanceSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ClassBalance
+        fields = '__all__'
+
+class IssueFeesSerializer(serializers.Serializer):
+    """One fee of `amount` for `term` to each member of a class (issue_term_fees)."""
+    term = serializers.CharField(max_length=20)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
 
 # ------------------- Timetable -------------------
-class TimetableSerializer(serializers.ModelSerializer):
+class TimetableSerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     # CRITICAL FIX: Return the teacher's full name instead of just the ID.
     teacher_name = serializers.SerializerMethodField()
     
@@ -51,19 +174,40 @@ class TimetableSerializer(serializers.ModelSerializer):
             return f"{obj.teacher.first_name} {obj.teacher.last_name}"
         return "TBD"
 
+    def validate(self, attrs):
+        """Reject slots that end before they start or overlap the teacher's, room's or class's other slots."""
+        def current(field):
+            return attrs[field] if field in attrs else getattr(self.instance, field, None)
+
+        entry = {
+            'id': self.instance.pk if self.instance else None,
+            'day': current('day'),
+            'start_time': current('start_time'),
+            'end_time': current('end_time'),
+            'teacher_id': current('teacher').pk if current('teacher') else None,
+            'room': current('room'),
+            'school_class_id': current('school_class').pk if current('school_class') else None,
+        }
+        if entry['start_time'] >= entry['end_time']:
+            raise serializers.ValidationError({'end_time': ['Must be later than start_time.']})
+        conflicts = find_conflicts(entry)
+        if conflicts:
+            raise serializers.ValidationError({'conflicts': conflicts}, code='timetable_conflict')
+        return attrs
+
 # ------------------- Results & Quizzes -------------------
-class ResultSerializer(serializers.ModelSerializer):
+class ResultSerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Result
         fields = '__all__'
 
-class QuizSerializer(serializers.ModelSerializer):
+class QuizSerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Quiz
         fields = '__all__'
 
-# ------------------- ClassProceeding (computed, not model) -------------------
-class ClassProceedingSerializer(serializers.Serializer):
+# ------------------- ClassProceeding (materialized, see core/proceedings.py) -------------------
+class ClassProceedingSerializer(InstrumentedSerializerMixin, serializers.Serializer):
     subject = serializers.CharField(max_length=100)
     teacher = serializers.CharField(max_length=100)
     section = serializers.CharField(max_length=50)
@@ -72,7 +216,7 @@ class ClassProceedingSerializer(serializers.Serializer):
     absent = serializers.IntegerField()
 
 # ------------------- Automated Attendance Summary -------------------
-class AttendanceSummarySerializer(serializers.ModelSerializer):
+class AttendanceSummarySerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     # CRITICAL FIX: The source field must match the model relationship (course)
     # The output field name should be clear, like 'subject_name'
     subject_name = serializers.CharField(source='course.name', read_only=True)
@@ -80,4 +224,4 @@ class AttendanceSummarySerializer(serializers.ModelSerializer):
     class Meta:
         model = AttendanceSummary
         # Use the corrected field name
-        fields = ['id', 'subject_name', 'percentage', 'last_updated']
\ No newline at end of file
+        fields = ['id', 'subject_name', 'total', 'present', 'percentage', 'last_updated']
\ No newline at end of file
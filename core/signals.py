@@ -0,0 +1,326 @@
+from decimal import Decimal
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens, invalidate_users
+from .bitmaps import mark_days
+from .ledger import apply_ledger_delta, apply_payment_delta, deferred_ledger, refresh_balances, refresh_class_balances
+from .mixins import forget_students
+from .proceedings import NO_SECTION
+from .models import (
+    Attendance, ClassProceeding, Course, Fee, FeePayment, Quiz, Result, SchoolClass, Student, StudentBalance,
+    Teacher, Timetable,
+)
+from .summaries import apply_attendance_delta, deferred_pairs
+from .sync import record_tombstone
+from .timetables import forget_class_timetables
+from .versions import bump_instance
+
+
+def _is_present(status):
+    return 1 if status == 'Present' else 0
+
+
+@receiver(pre_save, sender=Attendance)
+def remember_previous_attendance(sender, instance, raw=False, **kwargs):
+    """Stash the stored (student, course, status, date) so post_save can undo its contribution."""
+    instance._summary_previous = None
+    if raw or instance.pk is None:
+        return
+    instance._summary_previous = (
+        Attendance.objects.filter(pk=instance.pk)
+        .values_list('student_id', 'course_id', 'status', 'date')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Attendance)
+def update_summary_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_summary_previous', None)
+    if previous is not None:
+        student_id, course_id, status, _ = previous
+        if (student_id, course_id) == (instance.student_id, instance.course_id):
+            # Same summary: only a Present <-> Absent flip changes anything.
+            apply_attendance_delta(
+                student_id, course_id, 0, _is_present(instance.status) - _is_present(status),
+            )
+            return
+        apply_attendance_delta(student_id, course_id, -1, -_is_present(status))
+    apply_attendance_delta(instance.student_id, instance.course_id, 1, _is_present(instance.status))
+
+
+@receiver(post_delete, sender=Attendance)
+def update_summary_on_delete(sender, instance, **kwargs):
+    apply_attendance_delta(instance.student_id, instance.course_id, -1, -_is_present(instance.status))
+
+
+def _mark_attendance_days(days):
+    # Inside a bulk path the pairs are refreshed whole with the summaries;
+    # a date-only change shifts no counter, so add its pair here.
+    pending = deferred_pairs()
+    if pending is not None:
+        pending.update((student_id, course_id) for student_id, course_id, _ in days)
+        return
+    mark_days(days)
+
+
+@receiver(post_save, sender=Attendance)
+def update_bitmap_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    days = {(instance.student_id, instance.course_id, instance.date)}
+    previous = getattr(instance, '_summary_previous', None)
+    if previous is not None:
+        student_id, course_id, _, day = previous
+        days.add((student_id, course_id, day))
+    _mark_attendance_days(days)
+
+
+@receiver(post_delete, sender=Attendance)
+def update_bitmap_on_delete(sender, instance, **kwargs):
+    _mark_attendance_days([(instance.student_id, instance.course_id, instance.date)])
+
+
+# --- Fee ledger balances (core/ledger.py) ------------------------------------
+
+@receiver(pre_save, sender=Fee)
+def remember_previous_fee(sender, instance, raw=False, **kwargs):
+    """
+    Stash the stored (student, amount) for post_save, and keep amount_paid
+    and paid derived from the payments whatever the caller set.
+    """
+    instance._ledger_previous = None
+    if raw:
+        return
+    if instance.pk is not None:
+        instance._ledger_previous = (
+            Fee.objects.filter(pk=instance.pk).values_list('student_id', 'amount', 'amount_paid').first()
+        )
+    instance.amount_paid = instance._ledger_previous[2] if instance._ledger_previous else Decimal('0.00')
+    instance.paid = instance.amount_paid >= Decimal(str(instance.amount))
+
+
+@receiver(post_save, sender=Fee)
+def update_ledger_on_fee_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    amount = Decimal(str(instance.amount))
+    previous = getattr(instance, '_ledger_previous', None)
+    if previous is None:
+        apply_ledger_delta(instance.student_id, charged=amount)
+        return
+    student_id, previous_amount, _ = previous
+    if student_id == instance.student_id:
+        apply_ledger_delta(student_id, charged=amount - previous_amount)
+        return
+    # Moved to another student, payments and all.
+    with deferred_ledger() as touched:
+        FeePayment.objects.filter(fee=instance).update(student_id=instance.student_id)
+        touched.students.update({student_id, instance.student_id})
+
+
+@receiver(post_delete, sender=Fee)
+def update_ledger_on_fee_delete(sender, instance, **kwargs):
+    # Its payments are deleted first and take back what they paid.
+    apply_ledger_delta(instance.student_id, charged=-Decimal(str(instance.amount)))
+
+
+@receiver(pre_save, sender=FeePayment)
+def remember_previous_payment(sender, instance, raw=False, **kwargs):
+    """Stash the stored (fee, student, amount); a new payment defaults to its fee's student."""
+    instance._ledger_previous = None
+    if raw:
+        return
+    if instance.student_id is None and instance.fee_id is not None:
+        instance.student_id = instance.fee.student_id
+    if instance.pk is not None:
+        instance._ledger_previous = (
+            FeePayment.objects.filter(pk=instance.pk).values_list('fee_id', 'student_id', 'amount').first()
+        )
+
+
+@receiver(post_save, sender=FeePayment)
+def update_ledger_on_payment_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    amount = Decimal(str(instance.amount))
+    previous = getattr(instance, '_ledger_previous', None)
+    if previous is not None:
+        fee_id, student_id, previous_amount = previous
+        if (fee_id, student_id) == (instance.fee_id, instance.student_id):
+            apply_payment_delta(fee_id, student_id, amount - previous_amount)
+            return
+        apply_payment_delta(fee_id, student_id, -previous_amount)
+    apply_payment_delta(instance.fee_id, instance.student_id, amount)
+
+
+@receiver(post_delete, sender=FeePayment)
+def update_ledger_on_payment_delete(sender, instance, **kwargs):
+    apply_payment_delta(instance.fee_id, instance.student_id, -Decimal(str(instance.amount)))
+
+
+@receiver(post_save, sender=Student)
+def move_balance_of_student(sender, instance, created, raw=False, **kwargs):
+    # The balance moves to the new class's ClassBalance with the student.
+    if not created and not raw and (
+        StudentBalance.objects.filter(student=instance).exclude(school_class_id=instance.school_class_id).exists()
+    ):
+        refresh_balances([instance.pk])
+
+
+@receiver(post_delete, sender=Student)
+def drop_balance_of_student(sender, instance, **kwargs):
+    # Not removed by CASCADE: the fee and payment deletes before this one still shift it.
+    balance = StudentBalance.objects.filter(student_id=instance.pk)
+    class_ids = list(balance.values_list('school_class_id', flat=True))
+    balance.delete()
+    refresh_class_balances(class_ids)
+
+
+# --- Cached Student lookups and token auth (core/mixins.py, core/authentication.py)
+
+@receiver(pre_save, sender=Student)
+def remember_previous_student_user(sender, instance, raw=False, **kwargs):
+    instance._previous_user_id = None
+    if not raw and instance.pk is not None:
+        instance._previous_user_id = (
+            Student.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def forget_cached_student(sender, instance, **kwargs):
+    user_ids = {instance.user_id, getattr(instance, '_previous_user_id', None)}
+    forget_students(user_ids)
+    # The auth cache carries the linked Student id too.
+    invalidate_users(user_ids)
+
+
+@receiver(post_save, sender=SchoolClass)
+def forget_cached_class_members(sender, instance, created, raw=False, **kwargs):
+    # The cached Student carries its school_class; a rename must not serve the old name.
+    if not created and not raw:
+        forget_students(instance.student_set.values_list('user_id', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def forget_cached_token(sender, instance, **kwargs):
+    forget_students([instance.user_id], token_keys=[instance.key])
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def forget_cached_user(sender, instance, created, raw=False, **kwargs):
+    # Covers deactivation (is_active=False) and any other change to the cached User.
+    if not created and not raw:
+        invalidate_users([instance.pk])
+
+
+# --- Per-class timetable cache (core/timetables.py) ------------------------
+
+@receiver(pre_save, sender=Timetable)
+def remember_previous_timetable_class(sender, instance, raw=False, **kwargs):
+    instance._previous_school_class_id = None
+    if not raw and instance.pk is not None:
+        instance._previous_school_class_id = (
+            Timetable.objects.filter(pk=instance.pk).values_list('school_class_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Timetable)
+@receiver(post_delete, sender=Timetable)
+def forget_cached_timetable(sender, instance, **kwargs):
+    forget_class_timetables({
+        instance.school_class_id, getattr(instance, '_previous_school_class_id', None),
+    })
+
+
+@receiver(post_save, sender=Teacher)
+@receiver(pre_delete, sender=Teacher)
+def forget_timetables_of_teacher(sender, instance, created=False, raw=False, **kwargs):
+    # Cached entries embed teacher_name (and deleting a teacher nulls it without signals).
+    if not created and not raw:
+        forget_class_timetables(
+            Timetable.objects.filter(teacher=instance).values_list('school_class_id', flat=True).distinct()
+        )
+
+
+# --- Display names in materialized class proceedings (core/proceedings.py)
+
+@receiver(post_save, sender=Course)
+def rename_proceedings_of_course(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        ClassProceeding.objects.filter(course=instance).update(
+            subject=instance.subject, teacher=str(instance.teacher),
+        )
+
+
+@receiver(post_save, sender=Teacher)
+def rename_proceedings_of_teacher(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        ClassProceeding.objects.filter(course__teacher=instance).update(teacher=str(instance))
+
+
+@receiver(post_save, sender=SchoolClass)
+def rename_proceedings_of_class(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        ClassProceeding.objects.filter(student__school_class=instance).update(section=instance.name)
+
+
+@receiver(pre_delete, sender=SchoolClass)
+def clear_proceedings_of_class(sender, instance, **kwargs):
+    # Members are detached with SET_NULL, which does not send Student signals.
+    ClassProceeding.objects.filter(student__school_class=instance).update(section=NO_SECTION)
+
+
+@receiver(post_save, sender=Student)
+def move_proceedings_of_student(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        section = instance.school_class.name if instance.school_class_id else NO_SECTION
+        ClassProceeding.objects.filter(student=instance).exclude(section=section).update(section=section)
+
+
+# --- Delta sync tombstones (core/sync.py) ----------------------------------
+
+@receiver(post_delete, sender=Attendance)
+@receiver(post_delete, sender=Result)
+@receiver(post_delete, sender=Quiz)
+@receiver(post_delete, sender=Fee)
+def record_student_tombstone(sender, instance, **kwargs):
+    record_tombstone(instance, student_id=instance.student_id)
+
+
+@receiver(post_delete, sender=Timetable)
+def record_timetable_tombstone(sender, instance, **kwargs):
+    record_tombstone(instance, school_class_id=instance.school_class_id)
+
+
+# --- Conditional GET version stamps (core/versions.py) ---------------------
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+@receiver(post_save, sender=Result)
+@receiver(post_delete, sender=Result)
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+@receiver(post_save, sender=Fee)
+@receiver(post_delete, sender=Fee)
+@receiver(post_save, sender=Timetable)
+@receiver(post_delete, sender=Timetable)
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=SchoolClass)
+@receiver(post_delete, sender=SchoolClass)
+def bump_version_stamp(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_instance(instance)
@@ -0,0 +1,341 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from decimal import ROUND_HALF_UP, Decimal
+
+import django
+from django.db import connection, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Sum, Value, When
+from django.utils import timezone
+
+from .bitmaps import refresh_bitmaps
+from .models import Attendance, AttendanceSummary, SummaryRebuild, SummaryRebuildShard
+from .proceedings import apply_proceeding_delta, refresh_proceedings, student_batches, student_ranges
+from .versions import bump_everything
+
+DEFAULT_CHUNK_SIZE = 2000
+TWO_PLACES = Decimal('0.01')
+
+
+def attendance_percentage(total, present):
+    """
+    Percentage of classes attended to two places, rounding halves up.
+
+    apply_attendance_delta() computes the same figure in SQL; the two must
+    agree to the last digit or reconcile would flag every tie as drift.
+    """
+    if not total:
+        return Decimal('0.00')
+    return (Decimal(present * 100) / Decimal(total)).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+
+def attendance_totals(queryset=None):
+    """
+    One grouped aggregate over Attendance: a row of
+    (student_id, course_id, total, present) per pair that has attendance.
+    """
+    if queryset is None:
+        queryset = Attendance.objects.all()
+    return (
+        queryset
+        .values_list('student_id', 'course_id')
+        .annotate(total=Count('id'), present=Count('id', filter=Q(status='Present')))
+        .order_by()
+    )
+
+
+def upsert_summaries(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Bulk upsert (student_id, course_id, total, present) rows into AttendanceSummary, chunk by chunk."""
+    written = 0
+    batch = []
+    for student_id, course_id, total, present in rows:
+        batch.append(AttendanceSummary(
+            student_id=student_id,
+            course_id=course_id,
+            total=total,
+            present=present,
+            percentage=attendance_percentage(total, present),
+        ))
+        if len(batch) >= chunk_size:
+            written += _flush(batch)
+            batch = []
+    if batch:
+        written += _flush(batch)
+    return written
+
+
+def _flush(batch):
+    AttendanceSummary.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=['student', 'course'],
+        update_fields=['total', 'present', 'percentage', 'last_updated'],
+    )
+    return len(batch)
+
+
+def delete_orphan_summaries(queryset=None):
+    """Remove summaries for (student, course) pairs that no longer have any attendance."""
+    if queryset is None:
+        queryset = AttendanceSummary.objects.all()
+    has_attendance = Attendance.objects.filter(
+        student_id=OuterRef('student_id'), course_id=OuterRef('course_id'),
+    )
+    deleted, _ = queryset.filter(~Exists(has_attendance)).delete()
+    return deleted
+
+
+def rebuild_attendance_summaries(chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Recompute every AttendanceSummary from a single grouped aggregate.
+
+    Only pairs that actually have attendance get a row. Returns a
+    (written, deleted) tuple.
+    """
+    with transaction.atomic():
+        rows = attendance_totals().iterator(chunk_size=chunk_size)
+        written = upsert_summaries(rows, chunk_size=chunk_size)
+        deleted = delete_orphan_summaries()
+    bump_everything()
+    return written, deleted
+
+
+# --- Sharded rebuild -----------------------------------------------------
+
+SHARD_SIZE = 5000
+
+
+def rebuild_student_range(first, last, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    rebuild_attendance_summaries() for students `first`..`last` (ids,
+    inclusive; no `last` for every id from `first` up) only: the range's
+    aggregate, upsert and orphan removal. Returns a (written, deleted) tuple.
+    """
+    in_range = Q(student_id__gte=first) if last is None else Q(student_id__gte=first, student_id__lte=last)
+    with transaction.atomic():
+        attendance = Attendance.objects.filter(in_range)
+        written = upsert_summaries(attendance_totals(attendance).iterator(chunk_size=chunk_size), chunk_size)
+        deleted = delete_orphan_summaries(AttendanceSummary.objects.filter(in_range))
+    return written, deleted
+
+
+def plan_rebuild(shard_size=SHARD_SIZE):
+    """
+    A new SummaryRebuild with one shard per `shard_size` students. The
+    last shard is open-ended, for students created before it runs.
+    """
+    rebuild = SummaryRebuild.objects.create(shard_size=shard_size)
+    ranges = student_ranges(shard_size) or [(0, None)]
+    ranges[-1] = (ranges[-1][0], None)
+    SummaryRebuildShard.objects.bulk_create(
+        SummaryRebuildShard(rebuild=rebuild, first_student=first, last_student=last)
+        for first, last in ranges
+    )
+    return rebuild
+
+
+def rebuild_shard(shard_pk, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Rebuild one shard and mark it done in the same transaction; a shard
+    already done is skipped. In a pool process this runs on that process's
+    own connection. Returns the shard's (pk, written, deleted, seconds).
+    """
+    start = time.perf_counter()
+    with transaction.atomic():
+        shard = SummaryRebuildShard.objects.select_for_update().get(pk=shard_pk)
+        if not shard.done:
+            shard.written, shard.deleted = rebuild_student_range(
+                shard.first_student, shard.last_student, chunk_size,
+            )
+            shard.done = True
+            shard.seconds = time.perf_counter() - start
+            shard.finished_at = timezone.now()
+            shard.save()
+    return shard.pk, shard.written, shard.deleted, shard.seconds
+
+
+def run_rebuild(rebuild, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Run the shards of `rebuild` that are not done yet, `workers` at a time
+    in separate processes (or inline with one worker). `progress`, if
+    given, is called with each shard's (pk, written, deleted, seconds) as
+    it finishes. Returns the rebuild's (written, deleted) totals.
+
+    SQLite takes one writer at a time, so there the shards always run
+    inline; concurrent shards would only fail on its write lock.
+    """
+    if connection.vendor == 'sqlite':
+        workers = 1
+    pending = list(rebuild.shards.filter(done=False).values_list('pk', flat=True))
+    SummaryRebuild.objects.filter(pk=rebuild.pk).update(status='running', error='')
+    try:
+        if workers <= 1:
+            for pk in pending:
+                outcome = rebuild_shard(pk, chunk_size)
+                if progress:
+                    progress(outcome)
+        else:
+            # 'spawn': every process sets Django up and connects on its own.
+            pool = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+            )
+            try:
+                futures = [pool.submit(rebuild_shard, pk, chunk_size) for pk in pending]
+                for future in as_completed(futures):
+                    outcome = future.result()
+                    if progress:
+                        progress(outcome)
+            finally:
+                # On failure, shards not started yet are dropped rather than run.
+                pool.shutdown(cancel_futures=True)
+    except BaseException as exc:
+        # Finished shards stay done; resume picks up the rest.
+        SummaryRebuild.objects.filter(pk=rebuild.pk).update(status='failed', error=repr(exc))
+        raise
+
+    totals = rebuild.shards.aggregate(written=Sum('written'), deleted=Sum('deleted'))
+    SummaryRebuild.objects.filter(pk=rebuild.pk).update(status='done', finished_at=timezone.now())
+    bump_everything()
+    return totals['written'] or 0, totals['deleted'] or 0
+
+
+# --- Incremental maintenance ---------------------------------------------
+
+_deferred = threading.local()
+
+
+def apply_attendance_delta(student_id, course_id, total_delta, present_delta):
+    """
+    Shift the counters of one summary by the given deltas in a single UPDATE.
+
+    The percentage is recomputed in the same statement so it is always in
+    step with the counters. A summary whose total drops to zero is removed.
+    The matching ClassProceeding row is shifted alongside.
+    """
+    if not total_delta and not present_delta:
+        return
+    pending = getattr(_deferred, 'pairs', None)
+    if pending is not None:
+        pending.add((student_id, course_id))
+        return
+    apply_proceeding_delta(student_id, course_id, total_delta, present_delta)
+
+    summary = AttendanceSummary.objects.filter(student_id=student_id, course_id=course_id)
+    new_total = F('total') + total_delta
+    new_present = F('present') + present_delta
+    # Hundredths of a percent, rounded half up in integer arithmetic: a float
+    # ROUND() would disagree with attendance_percentage() on ties like 1/32.
+    hundredths = (new_present * 20000 + new_total) / (new_total * 2)
+    changes = {
+        'total': new_total,
+        'present': new_present,
+        'percentage': Case(
+            When(total__gt=-total_delta, then=hundredths / Value(100.0)),
+            default=Value(0.0),
+        ),
+        'last_updated': timezone.now(),
+    }
+    if summary.update(**changes):
+        if total_delta < 0:
+            summary.filter(total__lte=0).delete()
+        return
+    if total_delta > 0:
+        # First attendance for this pair; tolerate a concurrent writer creating it too.
+        AttendanceSummary.objects.bulk_create(
+            [AttendanceSummary(student_id=student_id, course_id=course_id)], ignore_conflicts=True,
+        )
+        summary.update(**changes)
+
+
+def refresh_summaries(pairs, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Recompute the summaries (class proceedings and bitmaps too) of the given (student_id, course_id) pairs."""
+    pairs = set(pairs)
+    if not pairs:
+        return 0
+    refresh_proceedings(pairs, chunk_size=chunk_size)
+    refresh_bitmaps(pairs)
+    student_ids = {student_id for student_id, _ in pairs}
+    course_ids = {course_id for _, course_id in pairs}
+    rows = (
+        row for row in attendance_totals(
+            Attendance.objects.filter(student_id__in=student_ids, course_id__in=course_ids)
+        )
+        if (row[0], row[1]) in pairs
+    )
+    with transaction.atomic():
+        written = upsert_summaries(rows, chunk_size=chunk_size)
+        delete_orphan_summaries(
+            AttendanceSummary.objects.filter(student_id__in=student_ids, course_id__in=course_ids)
+        )
+    return written
+
+
+def deferred_pairs():
+    """The pairs collected by the enclosing deferred_summaries() block, or None outside one."""
+    return getattr(_deferred, 'pairs', None)
+
+
+@contextmanager
+def deferred_summaries():
+    """
+    Collect the pairs touched by Attendance writes in the block and refresh
+    them once at the end, instead of applying one delta per row.
+
+    Used by the bulk paths (bulk_create, bulk_update, queryset update/delete).
+    Nested blocks share the outermost collection.
+    """
+    if getattr(_deferred, 'pairs', None) is not None:
+        yield _deferred.pairs
+        return
+    _deferred.pairs = pairs = set()
+    try:
+        yield pairs
+    finally:
+        _deferred.pairs = None
+    refresh_summaries(pairs)
+
+
+def reconcile_attendance_summaries(student_batch=500, student_range=None):
+    """
+    Detect and repair drift between AttendanceSummary counters and Attendance,
+    and stored percentages that do not match their counters.
+
+    Students are walked in id batches; each batch costs one grouped aggregate
+    and one read of the stored counters, and only drifted rows are written.
+    `student_range` limits the walk to one (first, last) slice of student ids.
+    Returns a (checked, repaired, removed) tuple.
+    """
+    checked = repaired = removed = 0
+    for student_ids in student_batches(student_range, student_batch):
+        last_id = student_ids[-1]
+
+        live = {
+            (student_id, course_id): (total, present)
+            for student_id, course_id, total, present in attendance_totals(
+                Attendance.objects.filter(student_id__gte=student_ids[0], student_id__lte=last_id)
+            )
+        }
+        stored = {
+            (student_id, course_id): (pk, total, present, percentage)
+            for pk, student_id, course_id, total, present, percentage in AttendanceSummary.objects.filter(
+                student_id__gte=student_ids[0], student_id__lte=last_id,
+            ).values_list('pk', 'student_id', 'course_id', 'total', 'present', 'percentage')
+        }
+        checked += len(live)
+
+        drifted = [
+            (student_id, course_id, total, present)
+            for (student_id, course_id), (total, present) in live.items()
+            if stored.get((student_id, course_id), (None,))[1:]
+            != (total, present, attendance_percentage(total, present))
+        ]
+        orphans = [pk for pair, (pk, *_) in stored.items() if pair not in live]
+        with transaction.atomic():
+            repaired += upsert_summaries(drifted)
+            if orphans:
+                removed += AttendanceSummary.objects.filter(pk__in=orphans).delete()[0]
+    if repaired or removed:
+        bump_everything()
+    return checked, repaired, removed
@@ -1,65 +1,60 @@
 # C:\Users\Fast\Desktop\school_backend\core\tasks.py
 
-from background_task import background
-from django.utils import timezone
-from django.db.models import Q
-# FIX 1: Import the CORRECT models you defined in models.py
-# (Student, Course, Attendance, AttendanceSummary)
-from .models import Student, Course, Attendance, AttendanceSummary 
+from .bitmaps import check_attendance_bitmaps
+from .imports import run_import
+from .jobs import job, purge_finished
+from .ledger import reconcile_fee_ledger
+from .models import ImportBatch
+from .proceedings import check_class_proceedings
+from .summaries import reconcile_attendance_summaries
+from .sync import purge_tombstones
 
-# Schedule to run every 12 hours (43200 seconds). 
-@background(schedule=43200, name='calculate_all_attendance_summary') 
-def calculate_all_attendance():
+# Jobs run in the run_worker process pool (core/jobs.py). Periodic ones are
+# queued by the worker once per slot; importing this module queues nothing.
+
+# AttendanceSummary counters are maintained on every Attendance write
+# (core/signals.py and core/querysets.py), so there is no periodic full
+# recompute any more. This job only detects and repairs drift, e.g. from
+# raw SQL or writes that bypassed the ORM. Every 12 hours it fans out into
+# one job per 5000 students, which the pool checks in parallel.
+@job(name='reconcile_attendance_summaries', every=43200, partition=5000)
+def reconcile_attendance(student_range):
     """
-    Calculates the aggregate attendance percentage for all students 
-    and updates the AttendanceSummary table.
+    Compares AttendanceSummary counters against the live Attendance
+    aggregate and rewrites only the summaries that drifted.
     """
-    print(f"--- Starting Attendance Calculation at {timezone.now()} ---")
-    
-    # Check if the models exist and have data
-    # FIX 2: Check Student and Course existence (using the correct model names)
-    if not Student.objects.exists() or not Course.objects.exists():
-        print("Required Student or Course data is missing. Task aborted.")
-        return
+    checked, repaired, removed = reconcile_attendance_summaries(student_range=student_range)
+
+    # The materialized class proceedings and the bitmaps ride on the same write paths.
+    proceedings = check_class_proceedings(repair=True, student_range=student_range)
+    bitmaps = check_attendance_bitmaps(repair=True, student_range=student_range)
+    return {
+        'summaries': {'checked': checked, 'repaired': repaired, 'removed': removed},
+        'proceedings': dict(zip(('checked', 'repaired', 'removed'), proceedings)),
+        'bitmaps': dict(zip(('checked', 'repaired', 'removed'), bitmaps)),
+    }
+
+# Fee balances are shifted on every write (core/ledger.py); this only
+# catches drift, as above.
+@job(name='reconcile_fee_ledger', every=86400)
+def reconcile_ledger():
+    return {
+        name: {'checked': checked, 'drifted': drifted}
+        for name, (checked, drifted) in reconcile_fee_ledger().items()
+    }
 
-    # Iterate through all students and all courses
-    for student in Student.objects.all():
-        for course in Course.objects.all():
-            
-            # 1. Total Classes Held (Denominator)
-            # Count all attendance records for this student and course
-            total_classes = Attendance.objects.filter(
-                student=student, 
-                course=course
-            ).count()
-            
-            # 2. Classes Attended (Numerator)
-            # Count only the 'Present' records for this student and course
-            classes_attended = Attendance.objects.filter(
-                student=student, 
-                course=course,
-                status='Present' # This status value is correct
-            ).count()
-            
-            
-            # 3. Calculate percentage
-            if total_classes > 0:
-                percentage = (classes_attended / total_classes) * 100
-            else:
-                percentage = 0.0
-                
-            # 4. Update or create the summary record
-            # FIX 3: Use 'course' instead of 'subject' in update_or_create
-            summary, created = AttendanceSummary.objects.update_or_create(
-                student=student, 
-                course=course,
-                defaults={'percentage': percentage}
-            )
-            print(f"[{'CREATED' if created else 'UPDATED'}] {student.first_name} - {course.name}: {percentage:.2f}%")
+# Delta-sync tombstones only need to outlive the oldest token we honour.
+@job(name='purge_sync_tombstones', every=86400)
+def purge_old_tombstones():
+    return {'deleted': purge_tombstones()}
 
-    print("--- Attendance Calculation Finished ---")
+@job(name='purge_finished_jobs', every=86400)
+def purge_finished_jobs():
+    return {'deleted': purge_finished()}
 
-# Schedule the task to run for the first time 
-# We'll set the repeat to 10 seconds for initial testing, then switch to 43200.
-# Set the initial run time to 60 seconds after startup.
-calculate_all_attendance(schedule=60, repeat=43200, repeat_until=None)
\ No newline at end of file
+# Bulk imports queued from the admin (ImportBatchAdmin.run_imports).
+@job(name='run_import_batch')
+def run_import_batch(batch_id):
+    batch = ImportBatch.objects.get(pk=batch_id)
+    rate = run_import(batch)
+    return {'imported': batch.imported, 'rejected': batch.rejected, 'rows_per_second': round(rate)}
@@ -1,3 +1,1406 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import re
+import shutil
+import sys
+import tempfile
+import time as time_module
+from datetime import date, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import authentication
+from .analytics import competition_ranks, describe, group_by, trend_slopes
+from .authentication import CachedTokenAuthentication, invalidate_users
+from .bench import ENDPOINTS, generate_school
+from .bitmaps import class_attendance, parse_term, student_calendar, student_terms, term_of
+from .conflicts import find_conflicts, validate_timetable
+from .dashboard import WEEKDAY_CODES, abuild_dashboard, build_dashboard
+from . import exports
+from .exports import Export
+from .imports import create_batch, run_import
+from .jobs import Worker, claim, release_lapsed
+from .instrumentation import Registry, RequestStats, prometheus_text, registry
+from .ledger import LedgerError, issue_term_fees, reconcile_fee_ledger, record_payment
+from .models import (
+    Attendance, AttendanceSummary, ClassBalance, ClassProceeding, Course, Fee, FeePayment, ImportBatch, Job,
+    Quiz, Result, SchoolClass, Student, StudentBalance, SummaryRebuild, Teacher, Timetable, Tombstone,
+)
+from .proceedings import check_class_proceedings, rebuild_class_proceedings
+from .scheduling import load_problem, solve, write_timetable
+from .summaries import plan_rebuild, rebuild_attendance_summaries, reconcile_attendance_summaries, run_rebuild
+from .sync import TOMBSTONE_RETENTION, make_token, purge_tombstones
+
+# Tables that grow with the school; a full scan of any of them is a regression.
+HOT_TABLES = {
+    'core_student', 'core_attendance', 'core_attendancesummary',
+    'core_fee', 'core_result', 'core_quiz', 'core_classproceeding',
+    'core_feepayment', 'core_studentbalance', 'core_attendancebitmap',
+}
+
+
+def explain(sql):
+    """EXPLAIN a captured query with the current backend's syntax."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Tiny test tables always favour a seq scan; ask whether an index *could* serve the query.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql)
+        else:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+
+def sequential_scans(plan):
+    """Hot tables read without an index in an EXPLAIN plan (SQLite or PostgreSQL)."""
+    if connection.vendor == 'postgresql':
+        tables = re.findall(r'Seq Scan on (\w+)', plan)
+    else:
+        # "SCAN t USING [COVERING] INDEX ..." walks a whole index; plain "SCAN t" walks the table.
+        tables = re.findall(r'\bSCAN (\w+)(?! USING)', plan)
+    return sorted(set(tables) & HOT_TABLES)
+
+
+class SchoolFixtureMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student', 'student@school.local', 'pass')
+        teacher = Teacher.objects.create(first_name='Ada', last_name='Byron', email='ada@school.local')
+        cls.school_class = SchoolClass.objects.create(name='7A', teacher=teacher)
+        cls.course = Course.objects.create(teacher=teacher, name='Maths', subject='Mathematics')
+        cls.student = Student.objects.create(
+            user=cls.user, first_name='Sam', last_name='Lee', email='sam@school.local',
+            grade='7', school_class=cls.school_class,
+        )
+        Attendance.objects.bulk_create([
+            Attendance(student=cls.student, course=cls.course, date=date(2024, 1, day),
+                       status='Present' if day % 3 else 'Absent')
+            for day in range(1, 11)
+        ])
+        Fee.objects.create(student=cls.student, amount='150.00')
+        Result.objects.create(student=cls.student, subject='Mathematics', score=88, grade='A')
+        Quiz.objects.create(student=cls.student, subject='Mathematics', date=date(2024, 1, 5), score=9)
+        rebuild_attendance_summaries()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class QueryPlanTests(SchoolFixtureMixin, TestCase):
+    """Every student-facing endpoint must reach its rows through an index."""
+
+    def endpoints(self):
+        return [
+            '/api/students/',
+            '/api/fees/',
+            '/api/payments/',
+            '/api/results/',
+            '/api/quizzes/',
+            '/api/attendances/',
+            '/api/proceedings/',
+            f'/api/students/{self.student.pk}/attendancesummary/',
+            '/api/attendance-terms/',
+            '/api/attendance-calendar/?month=2024-01',
+        ]
+
+    def assert_indexed(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            plan = explain(sql)
+            self.assertEqual(sequential_scans(plan), [], f'{url}\n{sql}\n{plan}')
+
+    def test_no_sequential_scans(self):
+        for url in self.endpoints():
+            with self.subTest(url=url):
+                self.assert_indexed(url)
+
+    def test_outstanding_balances_are_read_off_an_index(self):
+        self.client.force_authenticate(User.objects.create_user('staff', 'staff@school.local', 'pass', is_staff=True))
+        for url in ['/api/ledger/students/', f'/api/ledger/students/?school_class={self.school_class.pk}']:
+            with self.subTest(url=url):
+                self.assert_indexed(url)
+
+
+# --- Query budgets -------------------------------------------------------
+
+# Every list an endpoint serves holds this many rows in turn; the query count
+# of each request must not move between them.
+VOLUMES = (1, 100, 1000)
+
+# A multi-row INSERT; the backend splits a bulk_create into batches of these.
+BULK_INSERT = re.compile(r'INSERT (?:OR \w+ )?INTO "(\w+)" .* VALUES \(.*\), \(', re.S)
+
+
+def query_count(captured):
+    """
+    Queries in `captured`, counting consecutive batches of one bulk INSERT
+    (INSERT OR IGNORE too) once: their number follows the backend's
+    parameter limit (999 on SQLite), not the access pattern.
+    """
+    count, previous = 0, None
+    for query in captured:
+        match = BULK_INSERT.match(query['sql'])
+        table = match and match.group(1)
+        if table is None or table != previous:
+            count += 1
+        previous = table
+    return count
+
+
+def seed_school(rows):
+    """
+    A school in which every list an endpoint serves has `rows` rows: the
+    student's fees, results, quizzes, attendance and summaries (one course
+    each), their class's timetable and classmates, and the teacher and
+    class catalogs.
+    """
+    staff = User.objects.create_user('staff', 'staff@school.local', 'pass', is_staff=True)
+    user = User.objects.create_user('student', 'student@school.local', 'pass')
+    teachers = Teacher.objects.bulk_create([
+        Teacher(first_name='Teacher', last_name=str(i), email=f'teacher{i}@school.local') for i in range(rows)
+    ])
+    classes = SchoolClass.objects.bulk_create([
+        SchoolClass(name=f'Class {i}', teacher=teacher) for i, teacher in enumerate(teachers)
+    ])
+    courses = Course.objects.bulk_create([
+        Course(teacher=teacher, name=f'Course {i}', subject=f'Subject {i}') for i, teacher in enumerate(teachers)
+    ])
+    student = Student.objects.create(
+        user=user, first_name='Sam', last_name='Lee', email='sam@school.local',
+        grade='7', school_class=classes[0],
+    )
+    classmates = Student.objects.bulk_create([
+        Student(first_name='Pupil', last_name=str(i), email=f'pupil{i}@school.local', grade='7',
+                school_class=classes[0])
+        for i in range(rows - 1)
+    ])
+    Attendance.objects.bulk_create([
+        Attendance(student=student, course=course, date=date(2024, 1, 8), status='Present' if i % 4 else 'Absent')
+        for i, course in enumerate(courses)
+    ])
+    others = Student.objects.bulk_create([
+        Student(first_name='Pupil', last_name=str(i), email=f'other{i}@school.local', grade='8',
+                school_class=school_class)
+        for i, school_class in enumerate(classes[1:])
+    ])
+    fees = Fee.objects.bulk_create([Fee(student=student, amount=100 + i) for i in range(rows)])
+    FeePayment.objects.bulk_create([FeePayment(fee=fee, student=student, amount=50) for fee in fees])
+    # Someone owing in every class, and as many owing students as rows
+    Fee.objects.bulk_create([Fee(student=pupil, amount=200, term='2024-T1') for pupil in [*classmates, *others]])
+    Result.objects.bulk_create(
+        [Result(student=student, subject=f'Subject {i}', score=i % 100, grade='B') for i in range(rows)]
+        + [Result(student=pupil, subject='Subject 0', score=50, grade='C') for pupil in classmates]
+    )
+    Quiz.objects.bulk_create([
+        Quiz(student=student, subject=f'Subject {i}', date=date(2024, 1, 1 + i % 28), score=i % 10)
+        for i in range(rows)
+    ])
+    # Today's weekday, so the dashboard's timetable section grows as well
+    day = timezone.localdate().strftime('%a')
+    Timetable.objects.bulk_create([
+        Timetable(school_class=classes[0], day=day, subject=f'Subject {i}', teacher=teachers[i],
+                  start_time=time(i // 60 % 24, i % 60), end_time=time(i // 60 % 24, i % 60, 30))
+        for i in range(rows)
+    ])
+    rebuild_attendance_summaries()
+    rebuild_class_proceedings()
+
+    ids = {
+        'student': student.pk,
+        'fee': Fee.objects.filter(student=student).values_list('pk', flat=True).first(),
+        'payment': FeePayment.objects.filter(student=student).values_list('pk', flat=True).first(),
+        'result': Result.objects.filter(student=student).values_list('pk', flat=True).first(),
+        'quiz': Quiz.objects.filter(student=student).values_list('pk', flat=True).first(),
+        'attendance': Attendance.objects.filter(student=student).values_list('pk', flat=True).first(),
+        'summary': AttendanceSummary.objects.filter(student=student).values_list('pk', flat=True).first(),
+        'teacher': teachers[0].pk,
+        'school_class': classes[0].pk,
+        'timetable': Timetable.objects.values_list('pk', flat=True).first(),
+    }
+    payloads = {
+        '/api/auth/': {'username': 'student', 'password': 'pass'},
+        '/api/attendances/roll-call/': {
+            'school_class': classes[0].pk,
+            'course': courses[0].pk,
+            'date': '2024-02-05',
+            'entries': [{'student': pupil.pk, 'status': 'Present'} for pupil in [student, *classmates]],
+        },
+        '/api/payments/': {'fee': fees[0].pk, 'amount': '10.00', 'method': 'card'},
+        f'/api/ledger/classes/{classes[0].pk}/issue-fees/': {'term': '2025-T1', 'amount': '120.00'},
+    }
+    return {'student': user, 'staff': staff, None: None}, ids, payloads
+
+
+class SchoolGeneratorTests(TestCase):
+    def generate(self):
+        """generate_school() in a rolled-back transaction: its rows, with ids replaced by their rank."""
+        with transaction.atomic():
+            created = generate_school(
+                students=6, courses=4, classes=2, days=5, attendance_ratio=0.5, results=2, quizzes=3, fees=2,
+                timetable=True, seed=7, batch_size=7,
+            )
+            students, courses = (
+                {pk: rank for rank, pk in enumerate(model.objects.order_by('pk').values_list('pk', flat=True))}
+                for model in (Student, Course)
+            )
+            counts = [model.objects.count() for model in (Result, Quiz, Fee, Timetable, AttendanceSummary)]
+            self.assertEqual(reconcile_attendance_summaries()[1:], (0, 0))
+            self.assertEqual(check_class_proceedings()[1:], (0, 0))
+            rows = sorted(
+                (students[student_id], courses[course_id], day, status)
+                for student_id, course_id, day, status
+                in Attendance.objects.values_list('student_id', 'course_id', 'date', 'status')
+            )
+            transaction.set_rollback(True)
+        return created, counts, rows
+
+    def test_a_seed_always_gives_the_same_school(self):
+        created, counts, rows = self.generate()
+        # 6 students x 2 of 4 courses x 5 days; 2 classes x 5 days x 6 periods of timetable
+        self.assertEqual((created, len(rows)), (60, 60))
+        self.assertEqual(counts, [12, 18, 12, 60, 12])
+        self.assertEqual(self.generate(), (created, counts, rows))
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Calls every API route at each of VOLUMES and fails when a request's
+    query count grows with the data (an N+1) or exceeds its budget. Prints
+    the queries and wall time per endpoint, to compare across commits.
+    """
+
+    def measure(self, rows):
+        """{(method, url template): (status, queries, milliseconds)} at one volume."""
+        users, ids, payloads = seed_school(rows)
+        measured = {}
+        for method, template, role, _ in ENDPOINTS:
+            # Every request starts cold, so earlier ones cannot hide queries.
+            cache.clear()
+            client = APIClient()
+            if users[role] is not None:
+                client.force_authenticate(users[role])
+            url = template.format(**ids)
+            started = time_module.perf_counter()
+            with CaptureQueriesContext(connection) as ctx:
+                if method == 'POST':
+                    response = client.post(url, payloads[url], format='json')
+                else:
+                    response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            elapsed = (time_module.perf_counter() - started) * 1000
+            measured[method, template] = (response.status_code, query_count(ctx.captured_queries), elapsed)
+        return measured
+
+    def test_every_route_has_a_budget(self):
+        covered = set()
+        for _, template, _, _ in ENDPOINTS:
+            path = template.split('?')[0].format(**dict.fromkeys(
+                (
+                    'student', 'fee', 'payment', 'result', 'quiz', 'attendance', 'summary', 'teacher',
+                    'school_class', 'timetable',
+                ), 1,
+            ))
+            covered.add(resolve(path).route)
+
+        def routes(patterns, prefix=''):
+            for pattern in patterns:
+                # Joined the way resolve() joins them: nested regexes lose their '^'
+                route = prefix + str(pattern.pattern).removeprefix('^' if prefix else '')
+                if isinstance(pattern, URLResolver):
+                    yield from routes(pattern.url_patterns, route)
+                else:
+                    yield route
+
+        missing = [
+            route for route in routes(get_resolver().url_patterns)
+            if not route.startswith('admin/') and 'format' not in route
+        ]
+        self.assertEqual(sorted(set(missing) - covered), [])
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        results = {}
+        for rows in VOLUMES:
+            with transaction.atomic():
+                results[rows] = self.measure(rows)
+                transaction.set_rollback(True)
+
+        lines = [f"{'endpoint':<60}" + ''.join(f'{f"{rows} rows":>18}' for rows in VOLUMES)]
+        for method, template, _, budget in ENDPOINTS:
+            cells = ''.join(
+                f'{f"{results[rows][method, template][1]} q {results[rows][method, template][2]:7.1f} ms":>18}' for rows in VOLUMES
+            )
+            lines.append(f'{method + " " + template:<60}{cells}')
+        print('\n' + '\n'.join(lines), file=sys.stderr)
+
+        for method, template, _, budget in ENDPOINTS:
+            with self.subTest(endpoint=f'{method} {template}'):
+                statuses = {results[rows][method, template][0] for rows in VOLUMES}
+                self.assertTrue(all(200 <= code < 300 for code in statuses), statuses)
+                counts = [results[rows][method, template][1] for rows in VOLUMES]
+                self.assertEqual(len(set(counts)), 1, f'query count grows with rows: {dict(zip(VOLUMES, counts))}')
+                self.assertLessEqual(max(counts), budget)
+
+
+class SummaryRebuildTests(SchoolFixtureMixin, TestCase):
+    def test_rebuild_recomputes_every_pair_from_attendance(self):
+        science = Course.objects.create(teacher=self.course.teacher, name='Science', subject='Science')
+        # Drift the rebuild must repair: wrong counters, a missing row and an orphan.
+        AttendanceSummary.objects.filter(course=self.course).update(total=3, present=3, percentage=Decimal('100'))
+        AttendanceSummary.objects.create(student=self.student, course=science, total=4, present=1)
+        classmate = Student.objects.create(
+            first_name='Ali', last_name='Khan', email='ali@school.local', grade='7', school_class=self.school_class,
+        )
+        Attendance.objects.bulk_create([
+            Attendance(student=classmate, course=self.course, date=date(2024, 1, day), status=status)
+            for day, status in ((1, 'Present'), (2, 'Absent'), (3, 'Present'))
+        ])
+        AttendanceSummary.objects.filter(student=classmate).delete()
+
+        self.assertEqual(rebuild_attendance_summaries(chunk_size=1), (2, 1))
+        self.assertEqual(
+            sorted(AttendanceSummary.objects.values_list('student_id', 'course_id', 'total', 'present', 'percentage')),
+            [
+                (self.student.pk, self.course.pk, 10, 7, Decimal('70.00')),
+                (classmate.pk, self.course.pk, 3, 2, Decimal('66.67')),
+            ],
+        )
+
+    def add_student(self, name, days):
+        pupil = Student.objects.create(
+            first_name=name, last_name='Lee', email=f'{name.lower()}@school.local', grade='7',
+            school_class=self.school_class,
+        )
+        # bulk_create skips the summary deltas, as a bulk load would
+        Attendance.objects.bulk_create([
+            Attendance(student=pupil, course=self.course, date=date(2024, 1, day), status='Present')
+            for day in range(1, days + 1)
+        ])
+        return pupil
+
+    def test_sharded_rebuild_resumes_after_a_failure(self):
+        self.add_student('Kim', 2)
+        AttendanceSummary.objects.all().delete()
+        rebuild = plan_rebuild(shard_size=1)
+        shards = list(rebuild.shards.values_list('first_student', 'last_student'))
+        self.assertEqual(len(shards), 2)
+        self.assertEqual(shards[0][0], shards[0][1])
+        self.assertIsNone(shards[-1][1])
+
+        def fail(outcome):
+            raise RuntimeError('worker lost')
+
+        with self.assertRaises(RuntimeError):
+            run_rebuild(rebuild, progress=fail)
+        rebuild.refresh_from_db()
+        self.assertEqual((rebuild.status, rebuild.shards.filter(done=True).count()), ('failed', 1))
+        self.assertEqual(AttendanceSummary.objects.count(), 1)
+
+        # A student created after the plan falls in the open-ended last shard
+        late = self.add_student('Lou', 3)
+        finished = []
+        self.assertEqual(run_rebuild(rebuild, progress=finished.append), (3, 0))
+        self.assertEqual(len(finished), 1)
+        self.assertEqual(SummaryRebuild.objects.get(pk=rebuild.pk).status, 'done')
+        self.assertEqual(AttendanceSummary.objects.get(student=late).total, 3)
+        self.assertEqual(reconcile_attendance_summaries()[1:], (0, 0))
+
+
+class StudentResolutionTests(SchoolFixtureMixin, TestCase):
+    def student_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, sum('FROM "core_student"' in query['sql'] for query in captured)
+
+    def test_student_is_resolved_once_and_rows_are_scoped_by_it(self):
+        other = Student.objects.create(
+            first_name='Kim', last_name='Park', email='kim@school.local', grade='7', school_class=self.school_class,
+        )
+        Fee.objects.create(student=other, amount='90.00')
+        response, queries = self.student_queries('/api/fees/')
+        self.assertEqual(queries, 1)
+        self.assertEqual([fee['amount'] for fee in response.json()['results']], ['150.00'])
+        # Cached for the next request
+        self.assertEqual(self.student_queries('/api/results/')[1], 0)
+
+    def test_linking_a_student_is_seen_at_once(self):
+        newcomer = User.objects.create_user('newcomer')
+        self.client.force_authenticate(newcomer)
+        self.assertEqual(self.client.get('/api/fees/').json()['results'], [])
+        self.student.user = newcomer
+        self.student.save()
+        self.assertEqual(len(self.client.get('/api/fees/').json()['results']), 1)
+
+
+class DashboardTests(SchoolFixtureMixin, TestCase):
+    def test_every_section_in_one_response(self):
+        weekday = timezone.localdate().weekday()
+        today, tomorrow = WEEKDAY_CODES[weekday], WEEKDAY_CODES[(weekday + 1) % 7]
+        for day, subject in ((today, 'Mathematics'), (tomorrow, 'Art')):
+            Timetable.objects.create(
+                school_class=self.school_class, subject=subject, day=day, start_time=time(9), end_time=time(10),
+            )
+        payload = self.client.get('/api/dashboard/').json()
+        self.assertEqual(
+            set(payload), {'profile', 'fees', 'results', 'quizzes', 'proceedings', 'attendance_summary', 'timetable'},
+        )
+        self.assertEqual(payload['profile']['id'], self.student.pk)
+        self.assertEqual([fee['amount'] for fee in payload['fees']], ['150.00'])
+        self.assertEqual([summary['percentage'] for summary in payload['attendance_summary']], ['70.00'])
+        self.assertEqual([entry['subject'] for entry in payload['timetable']], ['Mathematics'])
+
+    def test_include_picks_sections(self):
+        payload = self.client.get('/api/dashboard/', {'include': 'fees, results'}).json()
+        self.assertEqual(set(payload), {'fees', 'results'})
+        response = self.client.get('/api/dashboard/', {'include': 'fees,grades'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('grades', response.json()['include'][0])
+
+
+class ClassTimetableTests(SchoolFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_class = SchoolClass.objects.create(name='7B')
+        for school_class, day, subject in (
+            (cls.school_class, 'Mon', 'Mathematics'), (cls.school_class, 'Tue', 'Art'),
+            (cls.other_class, 'Mon', 'Physics'),
+        ):
+            Timetable.objects.create(
+                school_class=school_class, subject=subject, day=day, start_time=time(9), end_time=time(10),
+            )
+
+    def subjects(self, params=None, client=None):
+        with CaptureQueriesContext(connection) as captured:
+            response = (client or self.client).get('/api/timetables/', params or {})
+        self.assertEqual(response.status_code, 200)
+        queries = sum('FROM "core_timetable"' in query['sql'] for query in captured)
+        return sorted(entry['subject'] for entry in response.json()['results']), queries
+
+    def test_students_get_their_class_from_the_cache(self):
+        self.assertEqual(self.subjects(), (['Art', 'Mathematics'], 1))
+        self.assertEqual(self.subjects({'day': 'Mon'}), (['Mathematics'], 0))
+        Timetable.objects.create(
+            school_class=self.school_class, subject='Music', day='Mon', start_time=time(11), end_time=time(12),
+        )
+        self.assertEqual(self.subjects({'day': 'Mon'}), (['Mathematics', 'Music'], 1))
+
+    def test_other_users_filter_by_class(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('office'))
+        self.assertEqual(self.subjects({'school_class': self.other_class.pk}, client)[0], ['Physics'])
+        self.assertEqual(self.subjects(client=client)[0], ['Art', 'Mathematics', 'Physics'])
+        self.assertEqual(client.get('/api/timetables/', {'school_class': '7B'}).status_code, 400)
+
+
+class KeysetPaginationTests(SchoolFixtureMixin, TestCase):
+    def test_pages_follow_the_cursor_without_overlap(self):
+        dates, url, pages = [], '/api/attendances/?page_size=4', 0
+        while url:
+            body = self.client.get(url).json()
+            dates += [row['date'] for row in body['results']]
+            url, pages = body['next'], pages + 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(dates, [date(2024, 1, day).isoformat() for day in range(10, 0, -1)])
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/api/attendances/', {'cursor': 'bm9wZQ=='}).status_code, 404)
+
+    def test_sparse_fieldsets_narrow_the_row_and_the_select(self):
+        with CaptureQueriesContext(connection) as captured:
+            body = self.client.get('/api/attendances/', {'fields': 'date,status,unknown'}).json()
+        self.assertEqual(set(body['results'][0]), {'id', 'date', 'status'})
+        select = next(query['sql'] for query in captured if 'FROM "core_attendance"' in query['sql'])
+        self.assertNotIn('"core_attendance"."course_id"', select)
+
+
+class ClassProceedingsTests(SchoolFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        rebuild_class_proceedings()
+
+    def proceedings(self):
+        response = self.client.get('/api/proceedings/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_rebuild_serves_the_aggregate(self):
+        self.assertEqual(self.proceedings(), [{
+            'subject': 'Mathematics', 'teacher': 'Ada Byron', 'total_classes': 10,
+            'attended': 7, 'absent': 3, 'section': '7A',
+        }])
+
+    def test_attendance_and_renames_keep_rows_in_step(self):
+        Attendance.objects.create(student=self.student, course=self.course, date=date(2024, 1, 11), status='Absent')
+        teacher = self.course.teacher
+        teacher.last_name = 'Lovelace'
+        teacher.save()
+        row, = self.proceedings()
+        self.assertEqual((row['teacher'], row['total_classes'], row['absent']), ('Ada Lovelace', 11, 4))
+        self.assertEqual(check_class_proceedings(), (1, 0, 0))
+
+    def test_check_reports_and_repairs_drift(self):
+        ClassProceeding.objects.update(attended=0)
+        ClassProceeding.objects.create(
+            student=self.student,
+            course=Course.objects.create(teacher=self.course.teacher, name='Art', subject='Art'),
+            subject='Art', teacher='Ada Byron', section='7A', total_classes=1, attended=1, absent=0,
+        )
+        self.assertEqual(check_class_proceedings(), (1, 1, 1))
+        self.assertEqual(check_class_proceedings(student_batch=1, repair=True), (1, 1, 1))
+        self.assertEqual(check_class_proceedings(), (1, 0, 0))
+        self.assertEqual(self.proceedings()[0]['attended'], 7)
+
+
+class ExportTests(SchoolFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(User.objects.create_user('office', is_staff=True))
+
+    def download(self, path):
+        response = self.client.get(f'/api/exports/{path}')
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_streams_every_row_with_flattened_headers(self):
+        response, content = self.download('attendance.csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertRegex(response['Content-Disposition'], r'attachment; filename="attendance-[\d-]+\.csv"')
+        header, *rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual(header[:3], ['id', 'student_id', 'student_email'])
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0][2:7], ['sam@school.local', str(self.course.pk), 'Maths', '2024-01-01', 'Present'])
+
+    def test_gzip_and_small_flushes_yield_the_same_bytes(self):
+        _, plain = self.download('fees.jsonl')
+        self.assertEqual(json.loads(plain.splitlines()[0])['amount'], '150.00')
+        response, compressed = self.download('fees.jsonl.gz')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(compressed), plain)
+        with mock.patch.object(exports, 'FLUSH_BYTES', 64):
+            export = Export('attendance', 'jsonl')
+            chunks = list(export)
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(export.rows, 10)
+        self.assertEqual(b''.join(chunks), self.download('attendance.jsonl')[1])
+
+    def test_students_cannot_export(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/exports/results.csv').status_code, 403)
+        with self.assertRaises(ValueError):
+            Export('users')
+
+
+class GradebookAnalyticsTests(SchoolFixtureMixin, TestCase):
+    def test_group_by_sorts_by_keys_then_values(self):
+        classes = np.array([2, 1, 2, 1, 2])
+        subjects = np.array([0, 1, 0, 1, 1])
+        scores = np.array([70.0, 40.0, 50.0, 90.0, 60.0])
+        order, starts, counts = group_by([classes, subjects], scores)
+        self.assertEqual(order.tolist(), [1, 3, 2, 0, 4])
+        self.assertEqual((starts.tolist(), counts.tolist()), ([0, 2, 4], [2, 2, 1]))
+
+    def test_describe_matches_numpy_per_group(self):
+        values = np.array([3.0, 1.0, 4.0, 1.0, 5.0, 9.0, 2.0, 6.0])
+        groups = np.array([0, 0, 0, 1, 1, 1, 1, 1])
+        order, starts, counts = group_by([groups], values)
+        stats = describe(values[order], starts, counts)
+        for group, count in enumerate(counts):
+            members = values[groups == group]
+            self.assertEqual(stats['count'][group], count)
+            self.assertAlmostEqual(stats['mean'][group], members.mean())
+            self.assertAlmostEqual(stats['median'][group], np.median(members))
+            self.assertAlmostEqual(stats['std'][group], members.std())
+            self.assertAlmostEqual(stats['p90'][group], np.percentile(members, 90))
+
+    def test_competition_ranks_share_ties_within_each_group(self):
+        scores = np.array([90.0, 90.0, 80.0, 70.0, 60.0, 60.0])
+        starts = np.array([0, 0, 0, 3, 3, 3])
+        self.assertEqual(competition_ranks(starts, -scores).tolist(), [1, 1, 3, 1, 2, 2])
+
+    def test_trend_slopes_are_points_per_thirty_days(self):
+        slopes = trend_slopes(
+            np.array([100, 110, 120, 105]), np.array([50.0, 60.0, 70.0, 80.0]), np.array([0, 0, 0, 1]), 2,
+        )
+        self.assertAlmostEqual(slopes[0], 30.0)
+        self.assertTrue(np.isnan(slopes[1]))
+
+    def test_ranking_and_statistics_endpoints(self):
+        for name, score in (('Kim', 88), ('Lou', 70)):
+            pupil = Student.objects.create(
+                first_name=name, last_name='Lee', email=f'{name.lower()}@school.local',
+                grade='7', school_class=self.school_class,
+            )
+            Result.objects.create(student=pupil, subject='Mathematics', score=score, grade='B')
+        self.client.force_authenticate(User.objects.create_user('office', is_staff=True))
+        ranking = self.client.get(f'/api/analytics/results/classes/{self.school_class.pk}/ranking/').json()
+        self.assertEqual(ranking['overall']['scores'], [88.0, 88.0, 70.0])
+        self.assertEqual(ranking['overall']['ranks'], [1, 1, 3])
+
+        row, = self.client.get('/api/analytics/results/').json()['by_subject']
+        self.assertEqual((row['count'], row['median'], row['max']), (3, 88.0, 88.0))
+        with self.captureOnCommitCallbacks(execute=True):
+            Result.objects.create(student=self.student, subject='Mathematics', score=40, grade='D')
+        row, = self.client.get('/api/analytics/results/').json()['by_subject']
+        self.assertEqual((row['count'], row['min']), (4, 40.0))
+
+
+class InstrumentationTests(SchoolFixtureMixin, TestCase):
+    def timing(self, user=None):
+        if user is not None:
+            self.client.force_authenticate(user)
+        return self.client.get('/api/fees/').headers.get('Server-Timing')
+
+    def test_server_timing_is_opt_in(self):
+        staff = User.objects.create_user('office', is_staff=True)
+        with self.settings(INSTRUMENTATION={'SERVER_TIMING': 'staff', 'SHARED_CACHE': None}):
+            self.assertIsNone(self.timing())
+            self.assertRegex(self.timing(staff), r'^db;dur=[\d.]+;desc="\d+ queries", view;dur=[\d.]+, ')
+        with self.settings(INSTRUMENTATION={'SERVER_TIMING': True, 'SHARED_CACHE': None}):
+            self.assertIn('total;dur=', self.timing(self.user))
+        with self.settings(INSTRUMENTATION={'SERVER_TIMING': False, 'SHARED_CACHE': None}):
+            self.assertIsNone(self.timing(staff))
+
+    def test_requests_are_counted_per_route(self):
+        before = registry.snapshot().get('GET api/fees/$', {'requests': 0, 'queries': 0})
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get('/api/fees/')
+        after = registry.snapshot()['GET api/fees/$']
+        self.assertEqual(after['requests'], before['requests'] + 1)
+        self.assertEqual(after['queries'], before['queries'] + len(captured))
+        self.assertEqual(after['statuses']['2xx'], before.get('statuses', {}).get('2xx', 0) + 1)
+
+    def test_scrape_sums_every_process_sharing_the_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        config = {'SHARED_CACHE': 'default', 'FLUSH_INTERVAL': 10, 'MAX_PROCESSES': 4}
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+        with self.settings(CACHES={'default': shared}, INSTRUMENTATION=config):
+            other = Registry()
+            other.key = 'instrumentation:other-worker'
+            stats = RequestStats()
+            stats.queries = 7
+            other.record('GET', 'api/probe/', 503, 0.02, stats, 10, [])
+            other.flush(caches['default'], config)
+
+            self.client.force_authenticate(User.objects.create_user('office', is_staff=True))
+            response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('school_http_requests_total{method="GET",route="api/probe/",status="5xx"} 1', text)
+        bucket = 'school_http_request_duration_seconds_bucket{method="GET",route="api/probe/",le='
+        self.assertIn(bucket + '"0.01"} 0', text)
+        self.assertIn(bucket + '"0.025"} 1', text)
+        self.assertIn('school_http_request_db_queries_total{method="GET",route="api/probe/"} 7', text)
+
+    def test_labels_are_escaped(self):
+        stats = RequestStats()
+        other = Registry()
+        other.record('GET', 'odd"route', 200, 0.001, stats, 0, [])
+        self.assertIn('route="odd\\"route",status="2xx"} 1', prometheus_text(other.snapshot()))
+
+
+class AttendanceSummaryTests(SchoolFixtureMixin, TestCase):
+    """The per-row signal path and the deferred bulk path must store the same figures."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.science = Course.objects.create(teacher=cls.course.teacher, name='Science', subject='Science')
+
+    def days(self, count):
+        return [date(2024, 3, 1) + timedelta(days=offset) for offset in range(count)]
+
+    def assertSummary(self, total, present, percentage):
+        summary = AttendanceSummary.objects.get(student=self.student, course=self.science)
+        self.assertEqual((summary.total, summary.present, summary.percentage), (total, present, Decimal(percentage)))
+        self.assertEqual(reconcile_attendance_summaries()[1:], (0, 0))
+
+    def test_signal_path(self):
+        rows = [
+            Attendance.objects.create(student=self.student, course=self.science, date=day,
+                                      status='Present' if index == 0 else 'Absent')
+            for index, day in enumerate(self.days(32))
+        ]
+        # 1/32 = 3.125%: a tie, rounded half up on both paths
+        self.assertSummary(32, 1, '3.13')
+        rows[1].status = 'Present'
+        rows[1].save()
+        self.assertSummary(32, 2, '6.25')
+        rows[2].delete()
+        self.assertSummary(31, 2, '6.45')
+        for row in rows[3:]:
+            row.delete()
+        rows[0].delete()
+        self.assertSummary(1, 1, '100.00')
+        rows[1].delete()
+        self.assertFalse(AttendanceSummary.objects.filter(student=self.student, course=self.science).exists())
+
+    def test_bulk_path(self):
+        Attendance.objects.bulk_create([
+            Attendance(student=self.student, course=self.science, date=day,
+                       status='Present' if index == 0 else 'Absent')
+            for index, day in enumerate(self.days(32))
+        ])
+        self.assertSummary(32, 1, '3.13')
+        rows = Attendance.objects.filter(student=self.student, course=self.science)
+        rows.filter(date=self.days(2)[1]).update(status='Present')
+        self.assertSummary(32, 2, '6.25')
+        rows.filter(date=self.days(3)[2]).delete()
+        self.assertSummary(31, 2, '6.45')
+        rows.filter(status='Absent').delete()
+        self.assertSummary(2, 2, '100.00')
+        rows.delete()
+        self.assertFalse(AttendanceSummary.objects.filter(student=self.student, course=self.science).exists())
+
+    def test_reconcile_repairs_a_stale_percentage(self):
+        AttendanceSummary.objects.filter(student=self.student, course=self.course).update(percentage=Decimal('1.00'))
+        self.assertEqual(reconcile_attendance_summaries()[1:], (1, 0))
+        summary = AttendanceSummary.objects.get(student=self.student, course=self.course)
+        self.assertEqual(summary.percentage, Decimal('70.00'))
+
+
+class TokenAuthCacheTests(SchoolFixtureMixin, TestCase):
+    """Cached token authentication, with a file-based cache standing in for a shared Redis tier."""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        caches = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory,
+        }})
+        caches.enable()
+        self.addCleanup(caches.disable)
+        authentication._local.clear()
+        self.addCleanup(authentication._local.clear)
+        self.client = self.client_for(self.user)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        return client
+
+    def statuses(self, url, client=None):
+        """Status codes in this process, then in another one that only shares the shared tier."""
+        client = client or self.client
+        here = client.get(url).status_code
+        authentication._local.clear()
+        return here, client.get(url).status_code
+
+    def test_deactivation(self):
+        self.assertEqual(self.statuses('/api/attendances/'), (200, 200))
+        self.assertGreater(authentication.token_cache_stats()['shared']['hits'], 0)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.statuses('/api/attendances/'), (401, 401))
+
+    def test_token_deletion(self):
+        self.assertEqual(self.statuses('/api/attendances/'), (200, 200))
+        Token.objects.filter(user=self.user).get().delete()
+        self.assertEqual(self.statuses('/api/attendances/'), (401, 401))
+
+    def test_staff_demotion(self):
+        bursar = User.objects.create_user('bursar', is_staff=True)
+        client = self.client_for(bursar)
+        self.assertEqual(self.statuses('/api/ledger/students/', client), (200, 200))
+        bursar.is_staff = False
+        bursar.save()
+        self.assertEqual(self.statuses('/api/ledger/students/', client), (403, 403))
+
+    def test_a_lookup_racing_an_invalidation_is_not_cached(self):
+        load = CachedTokenAuthentication._load
+
+        def deactivated_while_loading(auth, key):
+            entry = load(auth, key)
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+            invalidate_users([self.user.pk])
+            return entry
+
+        with mock.patch.object(CachedTokenAuthentication, '_load', deactivated_while_loading):
+            self.assertEqual(self.client.get('/api/attendances/').status_code, 200)
+        self.assertEqual(self.statuses('/api/attendances/'), (401, 401))
+
+    def test_request_user_loads_the_row_only_when_needed(self):
+        key = Token.objects.get(user=self.user).key
+        CachedTokenAuthentication().authenticate_credentials(key)
+        with self.assertNumQueries(0):
+            user, token = CachedTokenAuthentication().authenticate_credentials(key)
+            self.assertEqual(
+                (user.pk, bool(user), user.is_authenticated, user.is_staff, token.student_id),
+                (self.user.pk, True, True, False, self.student.pk),
+            )
+        with self.assertNumQueries(1):
+            self.assertEqual((user.username, user.email), ('student', 'student@school.local'))
+
+    def test_shared_ttl_is_capped(self):
+        with override_settings(TOKEN_AUTH_CACHE={'SHARED_TTL': 3600}):
+            self.assertEqual(authentication._shared_ttl(), authentication.MAX_SHARED_TTL)
+
+
+class DeltaSyncTests(SchoolFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # The fixture was written an hour ago, well before any token handed out here.
+        Attendance.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        self.fixture_ids = sorted(Attendance.objects.values_list('pk', flat=True))
+
+    def sync(self, since, **params):
+        return self.client.get('/api/attendances/', {'since': since, **params}).json()
+
+    def follow(self, page):
+        """Follow `next` to the end: (token, changed ids, deleted ids, pages)."""
+        token, changed, deleted, pages = page['token'], [], page['deleted'], 0
+        while page:
+            pages += 1
+            self.assertEqual(page['token'], token)
+            changed += [row['id'] for row in page['changed']]
+            page = page['next'] and self.client.get(page['next']).json()
+        return token, sorted(changed), deleted, pages
+
+    def test_paged_sync_hands_out_the_first_pages_token(self):
+        first = self.sync('', page_size=4)
+        self.assertTrue(first['reset'])
+        added = Attendance.objects.create(student=self.student, course=self.course, date=date(2024, 2, 1))
+        token, changed, deleted, pages = self.follow(first)
+        self.assertEqual((changed, deleted, pages), (self.fixture_ids, [], 3))
+        # Written while the client was paging: comes with the next sync, not lost
+        delta = self.sync(token)
+        self.assertFalse(delta['reset'])
+        self.assertEqual(self.follow(delta)[1:], ([added.pk], [], 1))
+
+    def test_deletes_come_back_as_tombstones(self):
+        other = Student.objects.create(
+            first_name='Kim', last_name='Park', email='kim@school.local', grade='7', school_class=self.school_class,
+        )
+        elsewhere = Attendance.objects.create(student=other, course=self.course, date=date(2024, 1, 1))
+        token = self.follow(self.sync(''))[0]
+        single = Attendance.objects.get(student=self.student, date=date(2024, 1, 1))
+        bulk = Attendance.objects.filter(student=self.student, date__gte=date(2024, 1, 9))
+        gone = sorted([single.pk, *bulk.values_list('pk', flat=True)])
+        single.delete()
+        bulk.delete()
+        elsewhere.delete()
+        _, changed, deleted, _ = self.follow(self.sync(token))
+        self.assertEqual((changed, sorted(deleted)), ([], gone))
+
+    def test_purge_tombstones(self):
+        Attendance.objects.filter(student=self.student, date__lte=date(2024, 1, 2)).delete()
+        expired = timezone.now() - TOMBSTONE_RETENTION - timedelta(days=1)
+        Tombstone.objects.filter(pk=Tombstone.objects.order_by('pk')[0].pk).update(deleted_at=expired)
+        self.assertEqual(purge_tombstones(), 1)
+        self.assertEqual(Tombstone.objects.count(), 1)
+        # A token from before the retention window forces a full resync
+        page = self.sync(make_token(expired))
+        self.assertTrue(page['reset'])
+        self.assertEqual(self.follow(page)[1], self.fixture_ids[2:])
+
+
+class ConditionalGetTests(SchoolFixtureMixin, TestCase):
+    def get(self, etag=None, client=None, **headers):
+        if etag:
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        return (client or self.client).get('/api/attendances/', **headers)
+
+    def test_a_committed_write_turns_a_304_into_a_200(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Attendance.objects.create(student=self.student, course=self.course, date=date(2024, 2, 1))
+            # Stamps move on commit, not before: a reader could still see the old rows.
+            self.assertEqual(self.get(etag).status_code, 304)
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.get(response['ETag']).status_code, 304)
+
+    def test_etag_varies_by_accept_and_by_user(self):
+        etag = self.get(HTTP_ACCEPT='application/json')['ETag']
+        self.assertEqual(self.get(etag, HTTP_ACCEPT='application/json').status_code, 304)
+        browsable = self.get(etag, HTTP_ACCEPT='text/html')
+        self.assertEqual(browsable.status_code, 200)
+        self.assertNotEqual(browsable['ETag'], etag)
+
+        classmate = Student.objects.create(
+            user=User.objects.create_user('kim'), first_name='Kim', last_name='Park', email='kim@school.local',
+            grade='7', school_class=self.school_class,
+        )
+        client = APIClient()
+        client.force_authenticate(classmate.user)
+        # Same URL, same Accept, another student's rows
+        response = self.get(etag, client=client, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'], [])
+
+
+class ImportTests(SchoolFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        media = override_settings(MEDIA_ROOT=self.directory)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def batch(self, kind, name, lines):
+        path = f'{self.directory}/{name}'
+        with open(path, 'w') as source:
+            source.write('\n'.join(lines) + '\n')
+        return create_batch(kind, path)
+
+    def rejects(self, batch):
+        batch.refresh_from_db()
+        with batch.rejects.open('r') as handle:
+            return [(row['line'], row['email']) for row in csv.DictReader(handle)]
+
+    def test_resume_after_a_failed_chunk(self):
+        batch = self.batch('students', 'students.csv', [
+            'first_name,last_name,email,grade,school_class',
+            'Ann,One,ann@school.local,7,7A',
+            'Bad,Row,not-an-email,7,7A',
+            'Ben,Two,ben@school.local,7,7A',
+            'Bad,Class,bad@school.local,7,9Z',
+            'Cy,Three,cy@school.local,7,7A',
+        ])
+        save = ImportBatch.save
+
+        def failing_second_checkpoint(batch, *args, **kwargs):
+            # The chunk's rows and rejects are written by now; its checkpoint fails.
+            if batch.rows_done == 4 and 'rows_done' in kwargs.get('update_fields', ()):
+                raise RuntimeError('database went away')
+            save(batch, *args, **kwargs)
+
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch.object(ImportBatch, 'save', failing_second_checkpoint), \
+                self.assertRaises(RuntimeError):
+            run_import(batch, chunk_size=2)
+        batch.refresh_from_db()
+        self.assertEqual((batch.status, batch.rows_done, batch.imported, batch.rejected), ('failed', 2, 1, 1))
+        # The rolled-back chunk left nothing in the reject file
+        self.assertEqual(self.rejects(batch), [('3', 'not-an-email')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            run_import(batch, chunk_size=2)
+        batch.refresh_from_db()
+        self.assertEqual((batch.status, batch.rows_done, batch.imported, batch.rejected), ('done', 5, 3, 2))
+        self.assertEqual(self.rejects(batch), [('3', 'not-an-email'), ('5', 'bad@school.local')])
+        self.assertEqual(
+            sorted(Student.objects.filter(email__in=['ann@school.local', 'ben@school.local', 'cy@school.local'])
+                   .values_list('first_name', flat=True)),
+            ['Ann', 'Ben', 'Cy'],
+        )
+
+    def test_student_upserts_touch_the_class_only_when_given(self):
+        other_class = SchoolClass.objects.create(name='7B')
+        kept, moved, cleared = (
+            Student.objects.create(
+                first_name=name, last_name='Old', email=f'{name.lower()}@school.local', grade='7',
+                school_class=self.school_class,
+            )
+            for name in ('Kept', 'Moved', 'Cleared')
+        )
+        batch = self.batch('students', 'students.jsonl', [
+            json.dumps({'first_name': 'Kept', 'last_name': 'New', 'email': 'kept@school.local', 'grade': '8'}),
+            json.dumps({'first_name': 'Moved', 'last_name': 'New', 'email': 'moved@school.local', 'grade': '8',
+                        'school_class': '7B'}),
+            json.dumps({'first_name': 'Cleared', 'last_name': 'New', 'email': 'cleared@school.local', 'grade': '8',
+                        'school_class': ''}),
+            json.dumps({'first_name': 'Fresh', 'last_name': 'New', 'email': 'fresh@school.local', 'grade': '8'}),
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            run_import(batch)
+        self.assertEqual(
+            {
+                student.first_name: (student.last_name, student.grade, student.school_class_id)
+                for student in Student.objects.filter(last_name='New')
+            },
+            {
+                'Kept': ('New', '8', self.school_class.pk),
+                'Moved': ('New', '8', other_class.pk),
+                'Cleared': ('New', '8', None),
+                'Fresh': ('New', '8', None),
+            },
+        )
+        self.assertEqual(Student.objects.filter(pk__in=[kept.pk, moved.pk, cleared.pk], last_name='New').count(), 3)
+
+
+class JobLeaseTests(TestCase):
+    def test_lapsed_leases_are_requeued_whatever_the_host(self):
+        now = timezone.now()
+        for name in ('lapsed', 'renewed', 'local'):
+            Job.objects.create(name=name, run_at=now - timedelta(minutes=5))
+        self.assertEqual(len(claim(3, 'elsewhere:1', now=now - timedelta(minutes=5))), 3)
+        worker = Worker(processes=1)
+        Job.objects.filter(name='local').update(worker=worker.name)
+
+        # Its own worker, on another host, keeps this one alive
+        Job.objects.filter(name='renewed').update(lease_expires_at=now + timedelta(seconds=30))
+        worker.heartbeat(now=now)
+        self.assertEqual(
+            dict(Job.objects.values_list('name', 'status')),
+            {'lapsed': 'queued', 'renewed': 'running', 'local': 'running'},
+        )
+        self.assertEqual(Job.objects.get(name='lapsed').worker, '')
+
+        # The heartbeat renewed only this worker's own lease
+        self.assertEqual(release_lapsed(now + timedelta(seconds=45)), 1)
+        self.assertEqual(Job.objects.get(name='renewed').status, 'queued')
+        self.assertEqual(Job.objects.get(name='local').status, 'running')
+
+
+class AsyncReadTests(SchoolFixtureMixin, TestCase):
+    def test_async_dashboard_matches_the_sync_one(self):
+        self.assertEqual(async_to_sync(abuild_dashboard)(self.student), build_dashboard(self.student))
+        sections = {'fees', 'timetable'}
+        self.assertEqual(
+            async_to_sync(abuild_dashboard)(self.student, sections), build_dashboard(self.student, sections),
+        )
+
+    def test_export_pages_without_server_side_cursors(self):
+        streamed = b''.join(Export('attendance', chunk_size=3))
+        settings_dict = connections['default'].settings_dict
+        settings_dict['DISABLE_SERVER_SIDE_CURSORS'] = True
+        self.addCleanup(settings_dict.pop, 'DISABLE_SERVER_SIDE_CURSORS')
+        export = Export('attendance', chunk_size=3)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(b''.join(export), streamed)
+        self.assertEqual((export.rows, len(captured)), (10, 5))
+
+
+class RollCallTests(SchoolFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(User.objects.create_user('registrar', is_staff=True))
+
+    def roll_call(self, status):
+        response = self.client.post('/api/attendances/roll-call/', {
+            'school_class': self.school_class.pk, 'course': self.course.pk, 'date': '2024-02-01',
+            'entries': [{'student': self.student.pk, 'status': status}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [entry['result'] for entry in response.json()['results']]
+
+    def test_roll_call_upserts_one_mark_per_day(self):
+        self.assertEqual(self.roll_call('Absent'), ['created'])
+        self.assertEqual(self.roll_call('Absent'), ['unchanged'])
+        self.assertEqual(self.roll_call('Present'), ['updated'])
+        marks = Attendance.objects.filter(student=self.student, course=self.course, date=date(2024, 2, 1))
+        self.assertEqual(list(marks.values_list('status', flat=True)), ['Present'])
+        summary = AttendanceSummary.objects.get(student=self.student, course=self.course)
+        self.assertEqual((summary.total, summary.present), (11, 8))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Attendance.objects.create(student=self.student, course=self.course, date=date(2024, 2, 1))
+
+    def test_students_cannot_take_the_roll(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        response = client.post('/api/attendances/roll-call/', {
+            'school_class': self.school_class.pk, 'course': self.course.pk, 'date': '2024-02-01',
+            'entries': [{'student': self.student.pk, 'status': 'Present'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Attendance.objects.filter(date=date(2024, 2, 1)).exists())
+
+
+class TimetableConflictTests(SchoolFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.teacher = cls.course.teacher
+        cls.other_class = SchoolClass.objects.create(name='7B')
+        cls.slot = Timetable.objects.create(
+            school_class=cls.school_class, teacher=cls.teacher, subject='Mathematics', day='Mon',
+            start_time=time(9), end_time=time(10), room='R1',
+        )
+
+    def proposed(self, start, end, school_class=None, teacher=None, room=None, pk=None):
+        return {
+            'id': pk, 'day': 'Mon', 'start_time': start, 'end_time': end,
+            'school_class_id': school_class, 'teacher_id': teacher, 'room': room,
+        }
+
+    def test_overlap_per_dimension(self):
+        other = self.other_class.pk
+        self.assertEqual(find_conflicts(self.proposed(time(10), time(11), teacher=self.teacher.pk, room='R1')), [])
+        self.assertEqual(find_conflicts(self.proposed(time(8), time(9), school_class=self.school_class.pk)), [])
+        found = find_conflicts(self.proposed(time(9, 30), time(10, 30), school_class=other, teacher=self.teacher.pk))
+        self.assertEqual(
+            [(c['dimension'], c['conflicts_with']) for c in found], [('teacher', self.slot.pk)],
+        )
+        found = find_conflicts(self.proposed(time(8), time(11), school_class=self.school_class.pk, room='R1'))
+        self.assertEqual([c['dimension'] for c in found], ['room', 'school_class'])
+        # Moving an entry within its own slot is not a conflict with itself
+        self.assertEqual(find_conflicts(self.proposed(
+            time(9), time(9, 45), school_class=self.school_class.pk, teacher=self.teacher.pk, room='R1',
+            pk=self.slot.pk,
+        )), [])
+
+    def test_overlapping_save_is_a_structured_error(self):
+        response = self.client.post('/api/timetables/', {
+            'school_class': self.other_class.pk, 'teacher': self.teacher.pk, 'subject': 'Physics',
+            'day': 'Mon', 'start_time': '09:30', 'end_time': '10:30', 'room': 'R2',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['conflicts'], [{
+            # ValidationError details are strings
+            'dimension': 'teacher', 'value': str(self.teacher.pk), 'day': 'Mon', 'conflicts_with': str(self.slot.pk),
+            'subject': 'Mathematics', 'start_time': '09:00:00', 'end_time': '10:00:00',
+        }])
+
+    def test_sweep_finds_every_overlapping_pair(self):
+        Timetable.objects.bulk_create([
+            Timetable(school_class=self.other_class, teacher=self.teacher, subject='Physics', day='Mon',
+                      start_time=time(9, 30), end_time=time(11), room='R2'),
+            Timetable(school_class=self.other_class, subject='Art', day='Mon',
+                      start_time=time(10), end_time=time(10, 30), room='R1'),
+            Timetable(school_class=self.school_class, subject='Music', day='Tue',
+                      start_time=time(9), end_time=time(10), room='R1'),
+        ])
+        self.assertEqual(
+            sorted((c['dimension'], c['subject']) for c in validate_timetable()),
+            [('school_class', 'Physics'), ('teacher', 'Mathematics')],
+        )
+
+
+class TimetableGeneratorTests(SchoolFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.teacher = cls.course.teacher
+        art_teacher = Teacher.objects.create(first_name='Bo', last_name='Ross', email='bo@school.local')
+        Course.objects.create(teacher=art_teacher, name='Art', subject='Art')
+        SchoolClass.objects.create(name='7B')
+        # Another class keeps its entry, which takes Ada and R1 on Tuesday's first period
+        Timetable.objects.create(
+            school_class=SchoolClass.objects.create(name='8A'), teacher=cls.teacher, subject='Mathematics',
+            day='Tue', start_time=time(8), end_time=time(8, 45), room='R1',
+        )
+        Timetable.objects.create(
+            school_class=cls.school_class, subject='Old', day='Wed', start_time=time(8), end_time=time(9),
+        )
+        cls.spec = {
+            'days': ['Mon', 'Tue'],
+            'periods': [['08:00', '08:45'], ['09:00', '09:45'], ['10:00', '10:45']],
+            'rooms': ['R1', 'R2'],
+            'requirements': [
+                {'school_class': name, 'course': course, 'hours': 2}
+                for name in ('7A', '7B') for course in ('Maths', 'Art')
+            ],
+            'unavailable': [{'teacher': 'ada@school.local', 'day': 'Mon', 'periods': [0]}],
+        }
+
+    def test_solution_respects_every_constraint(self):
+        problem = load_problem(self.spec)
+        self.assertIn(('R1', 'Tue', 0), problem.busy_rooms)
+        solution = solve(problem, time_budget=0, max_iterations=5000, seed=3)
+        self.assertEqual((solution.hard_violations, solution.soft_penalty), (0, 0))
+        ada = [problem.slot_time(slot) for lesson, slot in zip(problem.lessons, solution.slots)
+               if lesson.teacher == self.teacher.pk]
+        self.assertEqual(sorted(ada), sorted(
+            (day, problem.periods[period]) for day in ('Mon', 'Tue') for period in (1, 2)
+        ))
+        again = solve(load_problem(self.spec), time_budget=0, max_iterations=5000, seed=3)
+        self.assertEqual((again.slots, again.rooms), (solution.slots, solution.rooms))
+
+    def test_write_replaces_the_classes_entries(self):
+        problem = load_problem(self.spec)
+        self.assertEqual(self.client.get('/api/timetables/').json()['results'][0]['subject'], 'Old')
+        self.assertEqual(write_timetable(problem, solve(problem, time_budget=0, max_iterations=5000, seed=3)), 8)
+        self.assertEqual(validate_timetable(), [])
+        subjects = [entry['subject'] for entry in self.client.get('/api/timetables/').json()['results']]
+        self.assertEqual(sorted(subjects), ['Art', 'Art', 'Mathematics', 'Mathematics'])
+        self.assertEqual(Timetable.objects.filter(school_class__name='8A').count(), 1)
+
+    def test_unknown_names_are_reported_together(self):
+        spec = {**self.spec, 'requirements': [{'school_class': '9Z', 'course': 'Latin'}]}
+        with self.assertRaisesMessage(ValueError, "unknown class '9Z'; requirements[0]: unknown course 'Latin'"):
+            load_problem(spec)
+
+
+class LedgerTests(SchoolFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.fee = Fee.objects.get(student=cls.student)
+        cls.other_class = SchoolClass.objects.create(name='7B')
+        cls.other = Student.objects.create(
+            first_name='Kim', last_name='Park', email='kim@school.local', grade='7', school_class=cls.other_class,
+        )
+
+    def assertLedger(self, students, classes):
+        """Stored (charged, paid, outstanding) per student and class, and nothing for reconcile to repair."""
+        for student, figures in students.items():
+            balance = StudentBalance.objects.get(student=student)
+            self.assertEqual((balance.charged, balance.paid, balance.outstanding), tuple(map(Decimal, figures)))
+        for school_class, figures in classes.items():
+            balance = ClassBalance.objects.get(school_class=school_class)
+            self.assertEqual((balance.charged, balance.paid, balance.outstanding), tuple(map(Decimal, figures)))
+        self.assertTrue(all(drifted == 0 for _, drifted in reconcile_fee_ledger(repair=False).values()))
+
+    def test_payments_and_refunds(self):
+        first = record_payment(self.fee, '50')
+        self.assertLedger({self.student: ('150', '50', '100')}, {self.school_class: ('150', '50', '100')})
+        with self.assertRaises(LedgerError):
+            record_payment(self.fee, '101')
+        record_payment(self.fee, '100')
+        self.fee.refresh_from_db()
+        self.assertEqual((self.fee.amount_paid, self.fee.paid), (Decimal('150'), True))
+        first.delete()
+        self.fee.refresh_from_db()
+        self.assertEqual((self.fee.amount_paid, self.fee.paid), (Decimal('100'), False))
+        self.assertLedger({self.student: ('150', '100', '50')}, {self.school_class: ('150', '100', '50')})
+        self.fee.delete()
+        self.assertLedger({self.student: ('0', '0', '0')}, {self.school_class: ('0', '0', '0')})
+
+    def test_fee_moved_to_another_student(self):
+        payment = record_payment(self.fee, '40')
+        self.fee.student = self.other
+        self.fee.save()
+        payment.refresh_from_db()
+        self.assertEqual(payment.student_id, self.other.pk)
+        self.assertLedger(
+            {self.student: ('0', '0', '0'), self.other: ('150', '40', '110')},
+            {self.school_class: ('0', '0', '0'), self.other_class: ('150', '40', '110')},
+        )
+
+    def test_student_moved_to_another_class(self):
+        record_payment(self.fee, '30')
+        self.student.school_class = self.other_class
+        self.student.save()
+        self.assertLedger(
+            {self.student: ('150', '30', '120')},
+            {self.school_class: ('0', '0', '0'), self.other_class: ('150', '30', '120')},
+        )
+
+    def test_reconcile_repairs_drift(self):
+        StudentBalance.objects.filter(student=self.student).update(paid=Decimal('99'))
+        ClassBalance.objects.filter(school_class=self.school_class).update(charged=Decimal('1'))
+        report = reconcile_fee_ledger(repair=False)
+        self.assertEqual((report['students'][1], report['classes'][1]), (1, 1))
+        reconcile_fee_ledger()
+        self.assertLedger({self.student: ('150', '0', '150')}, {self.school_class: ('150', '0', '150')})
+
+    def test_issue_term_fees_bills_each_student_once(self):
+        self.assertEqual(issue_term_fees(self.school_class, '2024-T1', '200'), 1)
+        self.assertEqual(issue_term_fees(self.school_class.pk, '2024-T1', '200'), 0)
+        self.assertLedger({self.student: ('350', '0', '350')}, {self.school_class: ('350', '0', '350')})
+
+    def test_issue_term_fees_counts_only_the_fees_it_created(self):
+        classmate = Student.objects.create(
+            first_name='Ali', last_name='Khan', email='ali@school.local', grade='7', school_class=self.school_class,
+        )
+        Fee.objects.create(student=classmate, amount='180.00', term='2024-T1')
+        self.assertEqual(issue_term_fees(self.school_class, '2024-T1', '200'), 1)
+        self.assertEqual(
+            sorted(Fee.objects.filter(term='2024-T1').values_list('student_id', 'amount')),
+            [(self.student.pk, Decimal('200.00')), (classmate.pk, Decimal('180.00'))],
+        )
+        self.assertLedger(
+            {self.student: ('350', '0', '350'), classmate: ('180', '0', '180')},
+            {self.school_class: ('530', '0', '530')},
+        )
+
+    def test_bad_class_filter_is_a_400(self):
+        self.client.force_authenticate(User.objects.create_user('bursar', is_staff=True))
+        response = self.client.get('/api/ledger/students/', {'school_class': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/ledger/students/', {'school_class': self.school_class.pk})
+        self.assertEqual(response.status_code, 200)
+
+
+class AttendanceBitmapTests(SchoolFixtureMixin, TestCase):
+    """The bitmap readers against the same figures counted off Attendance rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.science = Course.objects.create(teacher=cls.course.teacher, name='Science', subject='Science')
+        cls.classmate = Student.objects.create(
+            first_name='Ali', last_name='Khan', email='ali@school.local', grade='7', school_class=cls.school_class,
+        )
+
+    def mark(self, student, course, day, status='Present'):
+        # One row at a time: the signal path, not the bulk one.
+        return Attendance.objects.create(student=student, course=course, date=day, status=status)
+
+    def assertBitmapsMatchRows(self, months):
+        rows = Attendance.objects.filter(student__school_class=self.school_class).values_list(
+            'student_id', 'course_id', 'date', 'status',
+        )
+        by_term, by_class, by_day, calendars = {}, {}, {}, {}
+        for student_id, course_id, day, status in rows:
+            present = status == 'Present'
+            label = term_of(day).label
+            for counts, key in (
+                (by_term, (student_id, course_id, label)), (by_class, (label, course_id)), (by_day, (label, day)),
+            ):
+                held, attended = counts.get(key, (0, 0))
+                counts[key] = (held + 1, attended + present)
+            calendars[student_id, course_id, day] = 'P' if present else 'A'
+
+        for student in (self.student, self.classmate):
+            self.assertEqual(
+                {(row['course'], row['term']): (row['held'], row['present']) for row in student_terms(student)},
+                {(course, label): counts for (pk, course, label), counts in by_term.items() if pk == student.pk},
+            )
+            for year, month in months:
+                for course in student_calendar(student, year, month)['courses']:
+                    expected = ''.join(
+                        calendars.get((student.pk, course['course'], date(year, month, index + 1)), '.')
+                        for index in range(len(course['days']))
+                    )
+                    self.assertEqual(course['days'], expected, (student.pk, course['course'], year, month))
+
+        for label in {label for label, _ in by_class} | {'2024-T1', '2024-T2'}:
+            payload = class_attendance(self.school_class.pk, parse_term(label))
+            self.assertEqual(
+                {(course['course'], course['held'], course['present']) for course in payload['courses']},
+                {(course, *counts) for (term, course), counts in by_class.items() if term == label},
+            )
+            self.assertEqual(
+                [(day['date'], day['held'], day['present']) for day in payload['days']],
+                sorted((day, *counts) for (term, day), counts in by_day.items() if term == label),
+            )
+
+    def test_single_row_writes(self):
+        self.mark(self.classmate, self.course, date(2024, 1, 2))
+        absent = self.mark(self.classmate, self.science, date(2024, 1, 3), 'Absent')
+        dropped = self.mark(self.student, self.science, date(2024, 1, 4))
+        self.assertBitmapsMatchRows([(2024, 1)])
+        absent.status = 'Present'
+        absent.save()
+        dropped.delete()
+        self.assertBitmapsMatchRows([(2024, 1)])
+
+    def test_date_moved_across_a_term_boundary(self):
+        moved = self.mark(self.student, self.science, date(2024, 4, 30), 'Absent')
+        self.mark(self.classmate, self.science, date(2024, 5, 2))
+        self.assertBitmapsMatchRows([(2024, 4), (2024, 5)])
+        moved.date = date(2024, 5, 2)
+        moved.save()
+        self.assertBitmapsMatchRows([(2024, 4), (2024, 5)])
+        self.assertEqual(
+            [(row['term'], row['held']) for row in student_terms(self.student) if row['course'] == self.science.pk],
+            [('2024-T2', 1)],
+        )
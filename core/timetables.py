@@ -0,0 +1,48 @@
+from django.core.cache import cache
+
+from .cache import is_process_local
+from .models import Timetable
+from .serializers import TimetableSerializer
+
+# Timetables change a few times a term; entries are dropped on every change
+# (core/signals.py), so in a shared cache the timeout only bounds memory use.
+# In a per-process cache the drop only reaches the worker that made the
+# change, and the timeout is how long the others serve the old timetable.
+TIMETABLE_CACHE_TIMEOUT = 60 * 60 * 24
+LOCAL_TIMETABLE_CACHE_TIMEOUT = 30
+
+
+def _timeout():
+    return LOCAL_TIMETABLE_CACHE_TIMEOUT if is_process_local() else TIMETABLE_CACHE_TIMEOUT
+
+
+def timetable_cache_key(school_class_id):
+    return f'timetable:class:{school_class_id}'
+
+
+def class_timetable(school_class_id):
+    """Serialized timetable entries of one SchoolClass, served from the cache when possible."""
+    key = timetable_cache_key(school_class_id)
+    entries = cache.get(key)
+    if entries is None:
+        queryset = Timetable.objects.filter(school_class_id=school_class_id).select_related('teacher')
+        entries = TimetableSerializer(queryset, many=True).data
+        cache.set(key, entries, _timeout())
+    return entries
+
+
+async def aclass_timetable(school_class_id):
+    """class_timetable() for async views, filling the same cache entry."""
+    key = timetable_cache_key(school_class_id)
+    entries = await cache.aget(key)
+    if entries is None:
+        queryset = Timetable.objects.filter(school_class_id=school_class_id).select_related('teacher')
+        entries = TimetableSerializer([entry async for entry in queryset], many=True).data
+        await cache.aset(key, entries, _timeout())
+    return entries
+
+
+def forget_class_timetables(school_class_ids):
+    keys = [timetable_cache_key(class_id) for class_id in school_class_ids if class_id is not None]
+    if keys:
+        cache.delete_many(keys)
@@ -0,0 +1,100 @@
+"""
+Per-(resource, scope) version stamps for conditional GETs.
+
+A stamp is an opaque token in the cache, replaced whenever a row in that
+scope changes (core/signals.py, core/querysets.py) and that change commits,
+so no reader pairs a new stamp with rows it cannot see yet. Views combine
+the stamps they depend on into an ETag, so If-None-Match can be answered
+with a 304 before any queryset is built (see ConditionalGetMixin in
+core/mixins.py).
+"""
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import is_process_local
+
+# Resource name and scope field for models whose rows belong to one scope.
+SCOPED_MODELS = {
+    'core.attendance': ('attendance', 'student_id'),
+    'core.result': ('result', 'student_id'),
+    'core.quiz': ('quiz', 'student_id'),
+    'core.fee': ('fee', 'student_id'),
+    # Payments are served with the fees they change.
+    'core.feepayment': ('fee', 'student_id'),
+    'core.timetable': ('timetable', 'school_class_id'),
+    'core.student': ('student', 'id'),
+}
+
+# Small reference tables whose names show up in many payloads.
+CATALOG_MODELS = {'core.teacher', 'core.course', 'core.schoolclass'}
+CATALOG = ('catalog', 'all')
+
+# Bumped by full rebuilds, so every ETag changes at once.
+GLOBAL = ('global', 'all')
+
+
+def _timeout():
+    # A process-local cache cannot see bumps made by other workers: keep
+    # stamps short-lived there so a stale 304 is bounded. With a shared
+    # cache (Redis) they live until replaced.
+    return 60 if is_process_local() else None
+
+
+def _key(resource, scope):
+    return f'version:{resource}:{scope}'
+
+
+def bump(resource, scopes):
+    """
+    Give new stamps to `resource` in each of `scopes`, and to its 'all'
+    scope, when the current transaction commits (at once outside one).
+    """
+    keys = {_key(resource, scope) for scope in scopes if scope is not None}
+    keys.add(_key(resource, 'all'))
+    transaction.on_commit(lambda: cache.set_many({key: uuid.uuid4().hex[:16] for key in keys}, _timeout()))
+
+
+def bump_model(model, scope_values):
+    """Bump the stamps covering rows of `model` (a model class) in the given scopes."""
+    label = model._meta.label_lower
+    if label in SCOPED_MODELS:
+        bump(SCOPED_MODELS[label][0], set(scope_values))
+    elif label in CATALOG_MODELS:
+        bump(CATALOG[0], [])
+
+
+def bump_instance(instance):
+    label = instance._meta.label_lower
+    if label in SCOPED_MODELS:
+        bump_model(type(instance), [getattr(instance, SCOPED_MODELS[label][1])])
+    else:
+        bump_model(type(instance), [])
+
+
+def bump_everything():
+    bump(GLOBAL[0], [GLOBAL[1]])
+
+
+def current_stamps(dependencies):
+    """Stamps for the given (resource, scope) pairs; missing ones are created."""
+    keys = [_key(resource, scope) for resource, scope in dependencies]
+    found = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex[:16] for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, _timeout())
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def etag_for(request, dependencies, variant=''):
+    """Strong ETag over the stamps of `dependencies` (plus GLOBAL) and the request's URL and Accept header."""
+    dependencies = [GLOBAL, *dependencies]
+    parts = [
+        request.path, request.META.get('QUERY_STRING', ''), request.META.get('HTTP_ACCEPT', ''),
+        variant, *current_stamps(dependencies),
+    ]
+    digest = hashlib.md5('|'.join(map(str, parts)).encode(), usedforsecurity=False).hexdigest()
+    return f'"{digest}"'
@@ -1,129 +1,433 @@
-from django.shortcuts import render
-from rest_framework import viewsets
+from datetime import datetime
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView 
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count, Q, F
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 
 # Consolidated Model Imports
 from .models import (
     Student, Teacher, SchoolClass, Attendance, Fee, 
     Timetable, Result, Quiz, Course, ClassProceeding, # <-- RESTORED ClassProceeding
-    AttendanceSummary 
+    AttendanceSummary, ClassBalance, FeePayment, StudentBalance,
+)
+
+from .analytics import ANALYTICS_DEPENDENCIES, cached, class_ranking, score_statistics
+from .authentication import token_cache_stats
+from .bitmaps import class_attendance, parse_term, student_calendar, student_terms, term_of
+from .dashboard import build_dashboard, requested_sections
+from .exports import Export
+from .instrumentation import prometheus_text
+from .jobs import job_metrics
+from .ledger import LedgerError, issue_term_fees, record_payment
+from .mixins import (
+    ConditionalGetMixin, DeltaSyncMixin, SparseFieldsMixin, StudentResolverMixin, StudentScopedMixin,
 )
+from .proceedings import class_proceedings
+from .timetables import class_timetable
+from .versions import CATALOG
 
 # Consolidated Serializer Imports
 from .serializers import (
     StudentSerializer, TeacherSerializer, SchoolClassSerializer, 
     AttendanceSerializer, FeeSerializer, TimetableSerializer, 
     ClassProceedingSerializer, # <-- RESTORED ClassProceedingSerializer
+    RollCallSerializer,
     ResultSerializer, QuizSerializer,
-    AttendanceSummarySerializer 
+    AttendanceSummarySerializer,
+    ClassBalanceSerializer, FeePaymentSerializer, IssueFeesSerializer, StudentBalanceSerializer,
+    requested_fields,
 )
 
+def id_param(request, name):
+    """An optional integer query parameter such as ?school_class=, or None; anything else is a 400."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: ['A valid integer is required.']})
+
 # --- CORE VIEWSETS (Student-Specific Filtering) ---
-class StudentViewSet(viewsets.ModelViewSet):
+# StudentScopedMixin resolves the logged-in Student once per request (and
+# caches it by token), then filters on student_id with no join to auth_user.
+class StudentViewSet(ConditionalGetMixin, StudentScopedMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     """API endpoint to get the single Student record for the logged-in user."""
+    queryset = Student.objects.select_related('school_class')
     serializer_class = StudentSerializer
     permission_classes = [IsAuthenticated]
-    def get_queryset(self):
-        if not self.request.user.is_authenticated:
-            return Student.objects.none()
-        return Student.objects.filter(user=self.request.user)
+    student_field = 'pk'
+    version_resources = ('student', CATALOG)
 
-class FeeViewSet(viewsets.ModelViewSet):
+class FeeViewSet(ConditionalGetMixin, StudentScopedMixin, DeltaSyncMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     """API endpoint to get Fee records specific to the logged-in student."""
+    queryset = Fee.objects.all()
     serializer_class = FeeSerializer
     permission_classes = [IsAuthenticated]
-    def get_queryset(self):
-        if not self.request.user.is_authenticated:
-            return Fee.objects.none()
-        return Fee.objects.filter(student__user=self.request.user)
+    version_resources = ('fee',)
+
+class FeePaymentViewSet(ConditionalGetMixin, StudentScopedMixin, SparseFieldsMixin,
+                        mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Payments against the logged-in student's fees, newest first. Staff
+    record one with POST {"fee", "amount", "method", "reference"}; a payment
+    of more than is still owed on the fee is refused with a 400.
+    """
+    queryset = FeePayment.objects.all()
+    serializer_class = FeePaymentSerializer
+    permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-paid_at', '-id')
+    version_resources = ('fee',)
 
-class ResultViewSet(viewsets.ModelViewSet):
+    def get_permissions(self):
+        if self.action == 'create':
+            return [IsAdminUser()]
+        return super().get_permissions()
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        try:
+            serializer.instance = record_payment(
+                data['fee'], data['amount'], data.get('method', 'cash'), data.get('reference', ''),
+            )
+        except LedgerError as exc:
+            raise ValidationError({'amount': [str(exc)]})
+
+class ResultViewSet(ConditionalGetMixin, StudentScopedMixin, DeltaSyncMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     """API endpoint to get Result records specific to the logged-in student."""
+    queryset = Result.objects.all()
     serializer_class = ResultSerializer
     permission_classes = [IsAuthenticated]
-    def get_queryset(self):
-        if not self.request.user.is_authenticated:
-            return Result.objects.none()
-        return Result.objects.filter(student__user=self.request.user)
+    version_resources = ('result',)
 
-class QuizViewSet(viewsets.ModelViewSet):
+class QuizViewSet(ConditionalGetMixin, StudentScopedMixin, DeltaSyncMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     """API endpoint to get Quiz records specific to the logged-in student."""
+    queryset = Quiz.objects.all()
     serializer_class = QuizSerializer
     permission_classes = [IsAuthenticated]
-    def get_queryset(self):
-        if not self.request.user.is_authenticated:
-            return Quiz.objects.none()
-        return Quiz.objects.filter(student__user=self.request.user)
+    version_resources = ('quiz',)
 
-class AttendanceViewSet(viewsets.ModelViewSet):
+class AttendanceViewSet(ConditionalGetMixin, StudentScopedMixin, DeltaSyncMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     """API endpoint to get individual Attendance records specific to the logged-in student."""
+    queryset = Attendance.objects.all()
     serializer_class = AttendanceSerializer
     permission_classes = [IsAuthenticated]
-    def get_queryset(self):
-        if not self.request.user.is_authenticated:
-            return Attendance.objects.none()
-        return Attendance.objects.filter(student__user=self.request.user)
+    keyset_ordering = ('-date', '-id')
+    version_resources = ('attendance',)
+
+    def get_permissions(self):
+        if self.action == 'roll_call':
+            return [IsAdminUser()]
+        return super().get_permissions()
 
-class ClassProceedingsView(APIView):
-    """Calculates and returns class proceedings (attendance summary) for the logged-in student."""
+    @action(detail=False, methods=['post'], url_path='roll-call')
+    def roll_call(self, request):
+        """Marks a whole class for one course and date in a single request and transaction (staff only)."""
+        serializer = RollCallSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save()
+        counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+        for _, _, result in results:
+            counts[result] += 1
+        return Response({
+            **counts,
+            'results': [
+                {'student': student_id, 'id': attendance_id, 'result': result}
+                for student_id, attendance_id, result in results
+            ],
+        })
+
+class ClassProceedingsView(ConditionalGetMixin, StudentScopedMixin, APIView):
+    """Returns the materialized class proceedings (attendance per course) for the logged-in student."""
     permission_classes = [IsAuthenticated]
+    version_resources = ('attendance', 'student', CATALOG)
     def get(self, request):
         if not request.user.is_authenticated:
              return Response({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
+        student = request.student
+        if student is None:
+             return Response({'error': 'Logged-in user is not linked to a student record.'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response(class_proceedings(student))
+
+class AttendanceTermsView(ConditionalGetMixin, StudentScopedMixin, APIView):
+    """
+    The logged-in student's attendance per course and term, newest first,
+    with percentages and longest absence streaks from the attendance
+    bitmaps (core/bitmaps.py). ?term=2024-T1 narrows it to one term.
+    """
+    permission_classes = [IsAuthenticated]
+    version_resources = ('attendance', CATALOG)
+    def get(self, request):
+        student = request.student
+        if student is None:
+            return Response({'error': 'Logged-in user is not linked to a student record.'}, status=status.HTTP_404_NOT_FOUND)
+        term = request.query_params.get('term')
         try:
-            student = Student.objects.get(user=request.user)
-        except Student.DoesNotExist:
+            term = parse_term(term) if term else None
+        except ValueError as exc:
+            raise ValidationError({'term': [str(exc)]})
+        return Response(student_terms(student, term))
+
+class AttendanceCalendarView(ConditionalGetMixin, StudentScopedMixin, APIView):
+    """
+    One month of the logged-in student's attendance per course, a
+    character per day ('P', 'A' or '.'), from the attendance bitmaps.
+    ?month=2024-01; defaults to the current month.
+    """
+    permission_classes = [IsAuthenticated]
+    version_resources = ('attendance', CATALOG)
+    def get_etag_variant(self):
+        return timezone.localdate().strftime('%Y-%m')
+
+    def get(self, request):
+        student = request.student
+        if student is None:
+            return Response({'error': 'Logged-in user is not linked to a student record.'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            month = datetime.strptime(request.query_params.get('month') or self.get_etag_variant(), '%Y-%m')
+        except ValueError:
+            raise ValidationError({'month': ['Expected YYYY-MM, e.g. 2024-01.']})
+        return Response(student_calendar(student, month.year, month.month))
+
+class DashboardView(ConditionalGetMixin, StudentScopedMixin, APIView):
+    """
+    Profile, fees, results, quizzes, proceedings, attendance summary and
+    today's timetable in one response. Pick sections with
+    ?include=fees,results (or ?fields=...). Responses carry an ETag built
+    from the version stamps of every section, and a matching If-None-Match
+    gets an empty 304 without building anything.
+    """
+    permission_classes = [IsAuthenticated]
+    version_resources = ('student', 'fee', 'result', 'quiz', 'attendance', CATALOG)
+
+    def get_version_dependencies(self):
+        dependencies = super().get_version_dependencies()
+        student = self.request.student
+        if student is not None:
+            dependencies.append(('timetable', student.school_class_id))
+        return dependencies
+
+    def get_etag_variant(self):
+        # The timetable section shows today's entries.
+        return timezone.localdate().isoformat()
+
+    def get(self, request):
+        student = request.student
+        if student is None:
              return Response({'error': 'Logged-in user is not linked to a student record.'}, status=status.HTTP_404_NOT_FOUND)
 
-        attendance_records = Attendance.objects.filter(student=student)
-        
-        courses = attendance_records.values('course').annotate(
-            subject=F('course__subject'), 
-            teacher_first_name=F('course__teacher__first_name'),
-            teacher_last_name=F('course__teacher__last_name'),
-            total_classes=Count('id'),
-            attended=Count('id', filter=Q(status='Present')),
-            absent=Count('id', filter=Q(status='Absent'))
-        ).order_by('subject')
-
-        data = []
-        for c in courses:
-            data.append({
-                'subject': c['subject'],
-                'teacher': f"{c['teacher_first_name']} {c['teacher_last_name']}",
-                'total_classes': c['total_classes'],
-                'attended': c['attended'],
-                'absent': c['absent'],
-                'section': student.school_class.name if student.school_class else 'N/A',
-            })
-        
-        return Response(data)
+        return Response(build_dashboard(student, requested_sections(request.query_params)))
+
+class StudentBalanceViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Students who owe fees, largest outstanding balance first, read off the
+    balance_outstanding index (balance_class_outstanding with
+    ?school_class=). Staff only.
+    """
+    serializer_class = StudentBalanceSerializer
+    permission_classes = [IsAdminUser]
+    keyset_ordering = ('-outstanding', 'student_id')
+
+    def get_queryset(self):
+        queryset = StudentBalance.objects.all()
+        if self.action != 'list':
+            return queryset
+        queryset = queryset.filter(outstanding__gt=0)
+        school_class = id_param(self.request, 'school_class')
+        if school_class is not None:
+            queryset = queryset.filter(school_class_id=school_class)
+        return queryset
+
+class ClassBalanceViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Classes whose members owe fees, largest outstanding total first. POST
+    {"term", "amount"} to .../<class id>/issue-fees/ bills the whole class
+    for a term. Staff only.
+    """
+    serializer_class = ClassBalanceSerializer
+    permission_classes = [IsAdminUser]
+    keyset_ordering = ('-outstanding', 'school_class_id')
+
+    def get_queryset(self):
+        queryset = ClassBalance.objects.all()
+        if self.action == 'list':
+            queryset = queryset.filter(outstanding__gt=0)
+        return queryset
+
+    @action(detail=True, methods=['post'], url_path='issue-fees')
+    def issue_fees(self, request, pk=None):
+        """One fee per member not yet billed for the term, in one bulk insert."""
+        school_class = get_object_or_404(SchoolClass, pk=pk)
+        serializer = IssueFeesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        created = issue_term_fees(school_class, **serializer.validated_data)
+        balance = ClassBalance.objects.filter(school_class=school_class).first()
+        return Response({
+            'created': created,
+            'balance': ClassBalanceSerializer(balance).data if balance else None,
+        })
+
+class TokenCacheStatsView(APIView):
+    """Hit/miss counters of the cached token authentication, for this worker process."""
+    permission_classes = [IsAdminUser]
+    def get(self, request):
+        return Response(token_cache_stats())
+
+class MetricsView(APIView):
+    """
+    Per-route request figures of all worker processes in the Prometheus text
+    format (core/instrumentation.py). Staff only; scrape with a token.
+    """
+    permission_classes = [IsAdminUser]
+    def get(self, request):
+        return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class JobMetricsView(APIView):
+    """Queue depth, latency and throughput of the job worker pool (core/jobs.py)."""
+    permission_classes = [IsAdminUser]
+    def get(self, request):
+        return Response(job_metrics())
+
+class GradebookStatisticsView(ConditionalGetMixin, APIView):
+    """
+    Score statistics for results or quizzes by subject and by class and
+    subject (core/analytics.py). ?school_class= and ?subject= narrow the
+    per-class rows.
+    """
+    permission_classes = [IsAuthenticated]
+    version_resources = ANALYTICS_DEPENDENCIES
+    def get(self, request, source):
+        payload = cached(f'statistics:{source}', lambda: score_statistics(source))
+        rows = payload['by_class_subject']
+        school_class = request.query_params.get('school_class')
+        if school_class:
+            rows = [row for row in rows if str(row['school_class']) == school_class]
+        subject = request.query_params.get('subject')
+        if subject:
+            rows = [row for row in rows if row['subject'] == subject]
+        return Response({'by_subject': payload['by_subject'], 'by_class_subject': rows})
+
+class ClassRankingView(ConditionalGetMixin, APIView):
+    """Rank of every student of one class, per subject and overall. Staff only."""
+    permission_classes = [IsAdminUser]
+    version_resources = ANALYTICS_DEPENDENCIES
+    def get(self, request, source, school_class_id):
+        return Response(cached(
+            f'ranking:{source}:{school_class_id}', lambda: class_ranking(source, int(school_class_id)),
+        ))
+
+class ClassAttendanceView(ConditionalGetMixin, APIView):
+    """
+    Attendance of one class in one term (?term=2024-T1, default the
+    current one), per course and per day, from the members' attendance
+    bitmaps (core/bitmaps.py). Staff only.
+    """
+    permission_classes = [IsAdminUser]
+    version_resources = (('attendance', 'all'), ('student', 'all'), CATALOG)
+    def get_etag_variant(self):
+        return self.request.query_params.get('term') or term_of(timezone.localdate()).label
+
+    def get(self, request, school_class_id):
+        try:
+            term = parse_term(self.get_etag_variant())
+        except ValueError as exc:
+            raise ValidationError({'term': [str(exc)]})
+        return Response(class_attendance(int(school_class_id), term))
+
+class ExportView(APIView):
+    """
+    Streams a whole-school export, e.g. /api/exports/attendance.csv or
+    /api/exports/fees.jsonl.gz (see core/exports.py). Staff only.
+    """
+    permission_classes = [IsAdminUser]
+    def get(self, request, kind, fmt, gz=None):
+        export = Export(kind, fmt, compress=bool(gz))
+        # Under ASGI a sync iterator would be read whole into memory before sending
+        content = export.astream() if isinstance(request._request, ASGIRequest) else export
+        response = StreamingHttpResponse(content, content_type=export.content_type)
+        response['Content-Disposition'] = f'attachment; filename="{export.filename}"'
+        return response
 
 # --- GENERIC VIEWSETS (No Filtering Required) ---
 
-class TeacherViewSet(viewsets.ModelViewSet):
+class TeacherViewSet(ConditionalGetMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Teacher.objects.all()
     serializer_class = TeacherSerializer
     permission_classes = [IsAuthenticated]
+    version_resources = (CATALOG,)
 
-class SchoolClassViewSet(viewsets.ModelViewSet):
+class SchoolClassViewSet(ConditionalGetMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = SchoolClass.objects.all()
     serializer_class = SchoolClassSerializer
     permission_classes = [IsAuthenticated]
+    version_resources = (CATALOG,)
 
-class TimetableViewSet(viewsets.ModelViewSet): # <-- RESTORED
-    queryset = Timetable.objects.all()
+class TimetableViewSet(ConditionalGetMixin, StudentResolverMixin, DeltaSyncMixin, SparseFieldsMixin, viewsets.ModelViewSet): # <-- RESTORED
+    """
+    Students only see their own class's timetable, served from a per-class
+    cache; other users can narrow with ?school_class=. Both accept ?day=Mon,
+    and ?since= for delta sync.
+    """
+    queryset = Timetable.objects.select_related('teacher')
     serializer_class = TimetableSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('day', 'start_time', 'id')
 
-class AttendanceSummaryViewSet(viewsets.ReadOnlyModelViewSet):
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        student = self.request.student
+        school_class_id = id_param(self.request, 'school_class')
+        if student is not None:
+            queryset = queryset.filter(school_class_id=student.school_class_id)
+        elif school_class_id is not None:
+            queryset = queryset.filter(school_class_id=school_class_id)
+        day = self.request.query_params.get('day')
+        if day:
+            queryset = queryset.filter(day=day)
+        return queryset
+
+    def get_sync_scope(self):
+        student = self.request.student
+        return {'school_class_id': student.school_class_id} if student else {}
+
+    def get_version_dependencies(self):
+        student = self.request.student
+        return [('timetable', student.school_class_id if student else 'all'), CATALOG]
+
+    def list(self, request, *args, **kwargs):
+        student = request.student
+        if student is None or 'since' in request.query_params:
+            return super().list(request, *args, **kwargs)
+        if student.school_class_id is None:
+            return self.get_paginated_response(self.paginate_queryset([]))
+        entries = class_timetable(student.school_class_id)
+        day = request.query_params.get('day')
+        if day:
+            entries = [entry for entry in entries if entry['day'] == day]
+        page = self.paginate_queryset(entries)
+        fields = requested_fields(request)
+        if fields:
+            page = [{k: v for k, v in entry.items() if k in fields or k == 'id'} for entry in page]
+        return self.get_paginated_response(page)
+
+class AttendanceSummaryViewSet(ConditionalGetMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = AttendanceSummarySerializer
+    keyset_ordering = ('-percentage', 'id')
+
+    def get_version_dependencies(self):
+        return [('attendance', self.kwargs.get('student_pk')), CATALOG]
+
     def get_queryset(self):
         student_id = self.kwargs.get('student_pk') 
         if student_id is not None:
-            return AttendanceSummary.objects.filter(student__id=student_id).order_by('-percentage')
+            return AttendanceSummary.objects.filter(student__id=student_id).select_related('course').order_by('-percentage')
         return AttendanceSummary.objects.none()
\ No newline at end of file
@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'school_api.settings')
+# Request ORM calls run on worker threads here; connections that persisted
+# would pile up, one per thread. Each request opens its own connection
+# instead: pair this process with a transaction-pooling PgBouncer (see
+# DATABASES in settings.py) rather than connecting to PostgreSQL directly.
+# WSGI processes and the job worker keep the settings default.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -42,13 +42,15 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',   
     'rest_framework.authtoken',
-    'background_task',
 ]
 
 MIDDLEWARE = [
+    # Per-route query/time/size figures, Server-Timing and /api/metrics/ (core/instrumentation.py)
+    'core.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     # Whitenoise is essential for serving static files in production on Render
-    'whitenoise.middleware.WhiteNoiseMiddleware', 
+    # (async-capable subclass, so ASGI requests never drop to a thread here)
+    'core.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware', 
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -90,9 +92,39 @@ USE_TZ = True
 DATABASES = {
     'default': dj_database_url.config(
         default=os.environ.get('DATABASE_URL'), 
-        conn_max_age=600
+        # Persistent connections. The ASGI web process (school_api/asgi.py)
+        # defaults DB_CONN_MAX_AGE to 0: its ORM calls run on threads of their
+        # own, and a persistent connection would be left behind on each one.
+        # Every request there opens a fresh connection instead, so in
+        # production point DATABASE_URL at a transaction-pooling PgBouncer
+        # next to the web process and set DB_TRANSACTION_POOLER=1.
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        conn_health_checks=True,
     )
 }
+# Behind a transaction pooler a connection is only ours for one
+# transaction; named server-side cursors (QuerySet.iterator() on
+# PostgreSQL) would not survive that.
+if os.environ.get('DB_TRANSACTION_POOLER'):
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# --- CACHE CONFIGURATION ---
+# Shared cache for cross-request lookups (e.g. token -> Student). Point
+# REDIS_URL at a Redis instance in production so all workers share it;
+# without it each process keeps its own in-memory cache.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 # --- STATIC FILES CONFIGURATION (CRUCIAL FIX) ---
 STATIC_URL = 'static/'
@@ -108,6 +140,10 @@ STATICFILES_DIRS = [
 # Configure WhiteNoise to serve compressed static files (FIX for Admin Panel CSS/JS)
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Uploaded files: bulk import sources and their reject files (core/imports.py)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 
 # --- REST FRAMEWORK / CORS CONFIGURATION ---
 # Allow all origins for CORS (be more restrictive in a final production app)
@@ -115,12 +151,54 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication', 
+        # TokenAuthentication with a token -> user cache (see core/authentication.py)
+        'core.authentication.CachedTokenAuthentication', 
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    # Plain JSON rendering, timed as serialization (core/instrumentation.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.instrumentation.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    # Keyset (cursor) pagination on indexed columns; see core/pagination.py
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+}
+
+# Cached token authentication: a process-local LRU tier plus the shared cache
+# alias below, used only when it is really shared (REDIS_URL). LOCAL_TTL is
+# how long a revoked token keeps working on the other workers.
+TOKEN_AUTH_CACHE = {
+    'LOCAL_TTL': 5,
+    'LOCAL_MAX_ENTRIES': 10000,
+    'SHARED_CACHE': 'default',
+    'SHARED_TTL': 60,
+}
+
+# Request instrumentation; SHARED_CACHE sums the figures of all worker
+# processes for /api/metrics/ (None or a locmem cache: each process reports
+# its own). The Server-Timing header goes to staff users only, or to every
+# response while DEBUG.
+INSTRUMENTATION = {
+    'SERVER_TIMING': True if DEBUG else 'staff',
+    'N_PLUS_ONE_THRESHOLD': 5,
+    'SHARED_CACHE': 'default',
+    'FLUSH_INTERVAL': 10,
+}
+
+# Job worker pool (python manage.py run_worker; see core/jobs.py).
+JOB_WORKER = {
+    'PROCESSES': int(os.environ['JOB_WORKER_PROCESSES']) if os.environ.get('JOB_WORKER_PROCESSES') else None,
+    'POLL_INTERVAL': 1.0,
+    'MAX_TASKS_PER_CHILD': 100,
+    'KEEP_FINISHED_DAYS': 7,
+    'LEASE_SECONDS': 60,
 }
 
 # Default primary key field type
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Covering indexes (Index.include) are PostgreSQL-only; SQLite (local dev and
+# tests) just builds the key columns, which is fine.
+SILENCED_SYSTEM_CHECKS = ['models.W040']
@@ -1,12 +1,21 @@
 # Assuming your imports at the top look like this (do not change the imports):
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework import routers
 from core.views import (
     StudentViewSet, TeacherViewSet, SchoolClassViewSet, AttendanceViewSet,
     FeeViewSet, TimetableViewSet, ResultViewSet, QuizViewSet,
-    AttendanceSummaryViewSet, ClassProceedingsView
+    AttendanceSummaryViewSet, ClassProceedingsView, TokenCacheStatsView,
+    DashboardView, ExportView, GradebookStatisticsView, ClassRankingView, JobMetricsView,
+    MetricsView, FeePaymentViewSet, StudentBalanceViewSet, ClassBalanceViewSet,
+    AttendanceTermsView, AttendanceCalendarView, ClassAttendanceView,
 )
+from core.async_views import (
+    AsyncAttendanceSummaryView, AsyncAttendancesView, AsyncClassProceedingsView, AsyncDashboardView,
+    AsyncFeesView, AsyncQuizzesView, AsyncResultsView, AsyncStudentsView,
+)
+from core.analytics import SOURCES as ANALYTICS_SOURCES
+from core.exports import EXPORTS, FORMATS
 from rest_framework.authtoken import views as authtoken_views
 
 router = routers.DefaultRouter()
@@ -19,6 +28,11 @@ router.register(r'fees', FeeViewSet, basename='fee')
 router.register(r'results', ResultViewSet, basename='result')
 router.register(r'quizzes', QuizViewSet, basename='quiz')
 router.register(r'attendances', AttendanceViewSet, basename='attendance')
+router.register(r'payments', FeePaymentViewSet, basename='payment')
+
+# Fee ledger balances, staff only (core/ledger.py)
+router.register(r'ledger/students', StudentBalanceViewSet, basename='student-balance')
+router.register(r'ledger/classes', ClassBalanceViewSet, basename='class-balance')
 
 # These generic viewsets have a static 'queryset' and do not strictly need 'basename'.
 router.register(r'teachers', TeacherViewSet)
@@ -37,5 +51,34 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
     path('api/auth/', authtoken_views.obtain_auth_token),
+    path('api/auth/cache-stats/', TokenCacheStatsView.as_view()),
     path('api/proceedings/', ClassProceedingsView.as_view()),
+    # Read off the per-term attendance bitmaps (core/bitmaps.py)
+    path('api/attendance-terms/', AttendanceTermsView.as_view()),
+    path('api/attendance-calendar/', AttendanceCalendarView.as_view()),
+    path('api/analytics/attendance/classes/<int:school_class_id>/', ClassAttendanceView.as_view()),
+    path('api/dashboard/', DashboardView.as_view()),
+    path('api/jobs/metrics/', JobMetricsView.as_view()),
+    path('api/metrics/', MetricsView.as_view()),
+    # Async versions of the student reads, for the ASGI worker (core/async_views.py)
+    path('api/async/students/', AsyncStudentsView.as_view()),
+    path('api/async/students/<int:student_pk>/attendancesummary/', AsyncAttendanceSummaryView.as_view()),
+    path('api/async/fees/', AsyncFeesView.as_view()),
+    path('api/async/results/', AsyncResultsView.as_view()),
+    path('api/async/quizzes/', AsyncQuizzesView.as_view()),
+    path('api/async/attendances/', AsyncAttendancesView.as_view()),
+    path('api/async/proceedings/', AsyncClassProceedingsView.as_view()),
+    path('api/async/dashboard/', AsyncDashboardView.as_view()),
+    re_path(
+        rf"^api/exports/(?P<kind>{'|'.join(EXPORTS)})\.(?P<fmt>{'|'.join(FORMATS)})(?P<gz>\.gz)?$",
+        ExportView.as_view(),
+    ),
+    re_path(
+        rf"^api/analytics/(?P<source>{'|'.join(ANALYTICS_SOURCES)})/$",
+        GradebookStatisticsView.as_view(),
+    ),
+    re_path(
+        rf"^api/analytics/(?P<source>{'|'.join(ANALYTICS_SOURCES)})/classes/(?P<school_class_id>[0-9]+)/ranking/$",
+        ClassRankingView.as_view(),
+    ),
 ]
\ No newline at end of file